@@ -10,7 +10,7 @@ def main():
         "working_directory": os.getcwd(),
         "python_path": sys.executable,
         "python_version": sys.version,
-        "environment_variables": dict(os.environ),
+        "environment_variable_names": sorted(os.environ),
         "script_path": os.path.abspath(__file__),
         "args": sys.argv,
         "env_file_exists": os.path.exists(".env"),
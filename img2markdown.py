@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
+import asyncio
+import atexit
 import base64
+import hashlib
 import os
+import sqlite3
 import sys
 import subprocess
 import tempfile
+import time
 import argparse
 import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
 import pyperclip
-from openai import OpenAI
+from openai import APIStatusError, AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+from img2markdown_archive import convert_archive, is_archive
+from img2markdown_batch import convert_directory, settings_hash
+from img2markdown_html import get_text_from_clipboard
+from img2markdown_image import benchmark_triage, prepare_upload, split_bands, triage_image
+from img2markdown_log import log_event, setup_logging
+from img2markdown_pipeline import iterate_pipeline
+from img2markdown_router import ComplexityRouter, EndpointRouter
+from img2markdown_scheduler import BULK, INTERACTIVE
+from img2markdown_singleflight import DEFAULT_WAIT_TIMEOUT, SingleFlight
+from img2markdown_store import ResponseStore, reprocess
+from img2markdown_tiles import TileCache, join_bands
+from img2markdown_workqueue import DEFAULT_LEASE_SECONDS, WorkQueue, run_worker
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,43 +44,56 @@ VISION_MODELS = [
     "gpt-4"
 ]
 
-# Initialize OpenAI client
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("Error: OPENAI_API_KEY not found in environment variables.")
-    print("Please make sure you have a .env file with your OpenAI API key:")
-    print("OPENAI_API_KEY=your_api_key_here")
-    sys.exit(1)
+DEFAULT_PROMPT = "Output the contents of the image in markdown format."
 
-client = OpenAI(api_key=api_key)
+# Defaults for the interactive clipboard path (seconds)
+DEFAULT_INTERACTIVE_DEADLINE = 60
+DEFAULT_INTERACTIVE_TIMEOUT = 30
 
+# Attempts with less time than this left are not started
+MIN_ATTEMPT_SECONDS = 1.0
 
-def get_image_from_clipboard():
-    """Get image from clipboard and convert to bytes."""
+# Follow-up message used to continue output that hit max_tokens
+CONTINUATION_PROMPT = (
+    "Your previous answer was cut off. Continue exactly where it stopped, "
+    "without repeating any text and without wrapping the output in a code block."
+)
+DEFAULT_MAX_CONTINUATIONS = 3
+
+# Connection warm-up gives up after this many seconds
+WARM_UP_TIMEOUT = 5.0
+
+
+def get_image_from_clipboard(quiet=False):
+    """Get image from clipboard and convert to bytes (quiet: print nothing, e.g. in a background thread)."""
+    say = (lambda *args: None) if quiet else print
     # Create a temporary file to save the clipboard image
     with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
         temp_path = temp_file.name
     
     # Use macOS's pngpaste utility to get clipboard contents
-    print("Getting image from clipboard using pngpaste...")
-    result = subprocess.run(
-        ['pngpaste', temp_path],
-        capture_output=True,
-        text=True,
-        check=False
-    )
-    
-    if result.returncode != 0:
-        print("Error capturing clipboard content.")
-        print("Make sure you have pngpaste installed: brew install pngpaste")
-        print("Also ensure you have an image copied to your clipboard.")
+    say("Getting image from clipboard using pngpaste...")
+    try:
+        result = subprocess.run(
+            ['pngpaste', temp_path],
+            capture_output=True,
+            text=True,
+            check=False
+        )
+    except OSError:
+        result = None
+    
+    if result is None or result.returncode != 0:
+        say("Error capturing clipboard content.")
+        say("Make sure you have pngpaste installed: brew install pngpaste")
+        say("Also ensure you have an image copied to your clipboard.")
         os.unlink(temp_path)
         return None
     
     # Check if the file exists and has content
     if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-        print("No image found in clipboard.")
-        print("Please copy an image to your clipboard and try again.")
+        say("No image found in clipboard.")
+        say("Please copy an image to your clipboard and try again.")
         os.unlink(temp_path)
         return None
     
@@ -70,7 +106,7 @@ def get_image_from_clipboard():
         os.unlink(temp_path)
         return img_data
     except IOError as e:
-        print(f"Error reading image file: {e}")
+        say(f"Error reading image file: {e}")
         if os.path.exists(temp_path):
             os.unlink(temp_path)
         return None
@@ -95,99 +131,769 @@ def encode_image(image_bytes):
     return base64.b64encode(image_bytes).decode('utf-8')
 
 
-def try_models_in_sequence(base64_image, models, prompt, max_tokens=4096):
-    """Try multiple models in sequence until one succeeds."""
-    last_error = None
-    
-    for model in models:
+class Img2MarkdownError(Exception):
+    """Base class for errors raised by the converter."""
+
+
+class ConfigurationError(Img2MarkdownError):
+    """Raised when the converter cannot be set up, e.g. no API key is available."""
+
+
+class ConversionError(Img2MarkdownError):
+    """Raised when no model could convert the image."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        # List of (model, exception) pairs, one per failed attempt
+        self.errors = errors or []
+
+
+class DeadlineExceeded(ConversionError):
+    """Raised when the end-to-end deadline runs out before any model succeeded."""
+
+
+class Deadline:
+    """An end-to-end time budget shared by every attempt of a conversion."""
+
+    def __init__(self, seconds=None, start=None):
+        # start is the time.monotonic() value the budget counts from (default: now)
+        self.seconds = seconds
+        if start is None:
+            start = time.monotonic()
+        self.expires_at = None if seconds is None else start + seconds
+
+    @classmethod
+    def coerce(cls, deadline):
+        """Accept a Deadline, a number of seconds or None."""
+        if isinstance(deadline, cls):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self):
+        """Seconds left, or None if there is no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining < MIN_ATTEMPT_SECONDS
+
+
+def run_in_background(function, *args):
+    """Call function(*args) in a daemon thread, which never holds up exiting; returns a Future."""
+    future = Future()
+
+    def run():
         try:
-            print(f"Trying model: {model}...")
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=max_tokens
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class StageTimings:
+    """Wall-clock durations of the stages of a run, some of which run side by side."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def timed(self, name, function, *args):
+        """Call function(*args) as stage name; usable as a thread pool task."""
+        with self.stage(name):
+            return function(*args)
+
+    def total(self):
+        return time.perf_counter() - self.started_at
+
+    def saved(self):
+        """Seconds gained by overlapping stages: their serial sum minus the elapsed time."""
+        return max(0.0, sum(self.stages.values()) - self.total())
+
+    def summary(self):
+        stages = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.stages.items())
+        return (f"Stage timings: {stages}; total {self.total() * 1000:.0f} ms "
+                f"(overlap saved {self.saved() * 1000:.0f} ms)")
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of converting a single image."""
+    text: str = None
+    model: str = None
+    usage: dict = None
+    elapsed: float = 0.0
+    index: int = None
+    error: Exception = None
+    # Number of continuation requests, and whether the output is still cut off
+    continuations: int = 0
+    truncated: bool = False
+    # Name of the routed endpoint, when an EndpointRouter is in use
+    endpoint: str = None
+    # "cheap", "escalated" or "full", when a ComplexityRouter is in use
+    route: str = None
+    # Triage label of an image that was not sent to the API (e.g. "empty")
+    skipped: str = None
+    # {"bands": n, "reused": k} for a conversion done band by band
+    tiles: dict = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def markdown(self):
+        """The model output prepared for pasting."""
+        return prep_for_pasting(self.text) if self.text is not None else None
+
+    def to_dict(self):
+        """A JSON-serialisable copy of a successful result."""
+        return {
+            "text": self.text,
+            "model": self.model,
+            "usage": self.usage,
+            "elapsed": self.elapsed,
+            "continuations": self.continuations,
+            "truncated": self.truncated,
+            "endpoint": self.endpoint,
+            "route": self.route,
+            "tiles": self.tiles,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data.get(key) for key in cls().to_dict()})
+
+
+def join_continuation(text, addition, max_overlap=400):
+    """
+    Append a continuation to truncated output.
+
+    Models sometimes re-open a code fence or repeat the last few words they
+    wrote, so both are dropped before joining.
+    """
+    for fence in ("```markdown\n", "```\n"):
+        if addition.startswith(fence):
+            addition = addition[len(fence):]
+            break
+    for size in range(min(len(text), len(addition), max_overlap), 7, -1):
+        if text.endswith(addition[:size]):
+            addition = addition[size:]
+            break
+    return text + addition
+
+
+def add_usage(total, usage):
+    """Add the token counts of a response's usage (or a usage dict) to a running total dict."""
+    if usage is None:
+        return total
+    total = dict(total or {})
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+        total[key] = total.get(key, 0) + (value or 0)
+    return total
+
+
+class Converter:
+    """
+    Convert images to markdown with an OpenAI-compatible vision model.
+
+    A single client (and therefore a single HTTP connection pool) is reused
+    for every call. Pass an existing sync `client` and/or `async_client`, or
+    let the converter build them from `api_key` / `base_url`.
+    """
+
+    def __init__(self, client=None, async_client=None, base_url=None, api_key=None,
+                 model=None, fallback=True, models=None, prompt=None,
+                 max_tokens=4096, max_workers=4, timeout=None, deadline=None,
+                 max_continuations=DEFAULT_MAX_CONTINUATIONS, target_bytes=None,
+                 upload_format="webp", router=None, scheduler=None, complexity_router=None,
+                 store=None, verbose=False):
+        self._api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._base_url = base_url
+        # Optional EndpointRouter spreading requests over several endpoints
+        self.router = router
+        # Optional PriorityScheduler shared with other converters
+        self.scheduler = scheduler
+        # Optional ComplexityRouter sending simple images to a cheaper model
+        self.complexity_router = complexity_router
+        # Optional ResponseStore keeping the raw responses for reprocessing
+        self.store = store
+        if client is None and async_client is None and router is None and not self._api_key:
+            raise ConfigurationError(
+                "OPENAI_API_KEY not found in environment variables. "
+                "Pass api_key= or an existing client to Converter()."
             )
-            print(f"Success with model: {model}")
-            return response.choices[0].message.content, model
+        # Only build clients ourselves when none were injected
+        self._build_clients = client is None and async_client is None
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.fallback = fallback
+        self.models = list(models or (router.models() if router else None) or VISION_MODELS)
+        self.prompt = prompt or DEFAULT_PROMPT
+        self.max_tokens = max_tokens
+        self.max_workers = max_workers
+        # Per-attempt timeout and default end-to-end deadline, in seconds
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_continuations = max_continuations
+        # Optional byte budget for uploads, and the lossy format used to meet it
+        self.target_bytes = target_bytes
+        self.upload_format = upload_format
+        self.verbose = verbose
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _log(self, message, event=None, level=logging.DEBUG, **fields):
+        """Print a progress message when verbose and record it as a structured event."""
+        if self.verbose:
+            print(message)
+        if event:
+            log_event(event, level, **fields)
+
+    def _sync_client(self):
+        if self.client is None:
+            if not self._build_clients:
+                raise ConfigurationError("Only an async client was given; use the async methods.")
+            self.client = OpenAI(api_key=self._api_key, base_url=self._base_url)
+        return self.client
+
+    def _async_client(self):
+        if self.async_client is None and self._build_clients:
+            self.async_client = AsyncOpenAI(api_key=self._api_key, base_url=self._base_url)
+        return self.async_client
+
+    def close(self):
+        """Close the underlying HTTP connection pool of the sync client."""
+        if self.client is not None and hasattr(self.client, "close"):
+            self.client.close()
+        if self.router is not None:
+            self.router.close()
+
+    async def aclose(self):
+        """Close both the sync and the async client."""
+        self.close()
+        if self.async_client is not None and hasattr(self.async_client, "close"):
+            await self.async_client.close()
+
+    def warm_up(self, timeout=WARM_UP_TIMEOUT):
+        """
+        Open the pooled connection to the first endpoint (DNS, TCP, TLS) before the first request.
+
+        Sends a cheap models.retrieve request, meant to run while the image
+        is captured and encoded. Returns the seconds it took, or None if no
+        connection could be made; the real request reports any error.
+        """
+        start = time.perf_counter()
+        try:
+            model, endpoint = next(self._targets())
+            client = endpoint.sync_client() if endpoint is not None else self._sync_client()
+            client.with_options(timeout=timeout, max_retries=0).models.retrieve(model)
+        except APIStatusError:
+            # Any HTTP answer means the connection is up
+            pass
         except Exception as e:
-            last_error = e
-            print(f"Failed with model {model}: {e}")
-            continue
-    
-    # If we get here, all models failed
-    raise Exception(f"All models failed. Last error: {last_error}")
+            log_event("warmup.failed", logging.DEBUG, error=str(e))
+            return None
+        elapsed = time.perf_counter() - start
+        log_event("warmup.done", logging.DEBUG, elapsed=round(elapsed, 3))
+        return elapsed
 
+    def settings(self):
+        """The settings that affect the output, e.g. for cache and manifest keys."""
+        return {
+            "model": self.model,
+            "fallback": self.fallback,
+            "models": self.models,
+            "prompt": self.prompt,
+            "max_tokens": self.max_tokens,
+            "max_continuations": self.max_continuations,
+            "target_bytes": self.target_bytes,
+            "upload_format": self.upload_format,
+            "cheap_model": self.complexity_router.cheap_model if self.complexity_router else None,
+        }
 
-def image_to_markdown(base64_image, model=None, fallback=True, prompt=None, max_tokens=4096):
-    """Send image to OpenAI API and get markdown response."""
-    if prompt is None:
-        prompt = "Output the contents of the image in markdown format."
-    
-    try:
-        if model and not fallback:
-            # Use only the specified model with no fallback
-            print(f"Sending image to OpenAI API (model: {model})...")
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
+    def remember(self, result, source=None, output=None, image_hash=None, markdown=None):
+        """Keep a successful result's raw response in the store, if there is one; returns its id."""
+        if self.store is None or not result.ok or result.text is None:
+            return None
+        try:
+            return self.store.record(result, self.settings(), source, output, image_hash, markdown)
+        except (OSError, sqlite3.Error) as e:
+            # Losing the copy is not worth failing the conversion over
+            log_event("store.failed", logging.WARNING, error=str(e))
+            return None
+
+    def models_to_try(self):
+        """Return the models to try, in order, for the configured model and fallback."""
+        if self.model and not self.fallback:
+            return [self.model]
+        if self.model:
+            return [self.model] + [m for m in self.models if m != self.model]
+        return list(self.models)
+
+    def _targets(self, models=None):
+        """
+        Yield (model, endpoint) pairs to attempt, in order.
+
+        Without a router the endpoint is None and the converter's own client
+        is used. With a router each model is tried on the endpoints serving
+        it, fastest healthy endpoint first. `models` defaults to models_to_try().
+        """
+        for model in self.models_to_try() if models is None else models:
+            if self.router is None:
+                yield model, None
+                continue
+            for endpoint in self.router.ranked(model):
+                self._log(f"Routing {model} to {endpoint.name}", "route.choice", model=model,
+                          endpoint=endpoint.name, score=round(endpoint.score(), 3))
+                yield model, endpoint
+
+    def _record(self, endpoint, attempt_start, ok):
+        if endpoint is not None:
+            self.router.record(endpoint, time.perf_counter() - attempt_start, ok)
+
+    def _messages(self, base64_image, mime_type="image/png"):
+        return [
+            {
+                "role": "user",
+                "content": [
                     {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
+                        "type": "text",
+                        "text": self.prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{base64_image}"
+                        }
                     }
-                ],
-                max_tokens=max_tokens
+                ]
+            }
+        ]
+
+    def prepare(self, image_bytes):
+        """Return (base64, mime_type) for image bytes, transcoding or shrinking them if needed."""
+        upload_bytes, mime_type, info = prepare_upload(
+            image_bytes, self.target_bytes, self.upload_format
+        )
+        log_event("upload.prepared", mime_type=mime_type, **info)
+        return encode_image(upload_bytes), mime_type
+
+    def _request_options(self, deadline, errors):
+        """
+        Work out the keyword arguments for the next attempt.
+
+        The attempt gets the per-attempt timeout or whatever is left of the
+        deadline, whichever is shorter. Raises DeadlineExceeded when the
+        budget is spent.
+        """
+        if deadline.expired():
+            log_event("deadline.exceeded", logging.WARNING, deadline=deadline.seconds, attempts=len(errors))
+            raise DeadlineExceeded(
+                f"Deadline of {deadline.seconds:g}s exceeded after {len(errors)} attempt(s)", errors
             )
-            return response.choices[0].message.content, model
-        else:
-            # Use fallback sequence
-            models_to_try = []
-            if model:
-                # Start with the specified model
-                models_to_try.append(model)
-                # Then add the rest of the models (excluding the specified one)
-                models_to_try.extend([m for m in VISION_MODELS if m != model])
+        timeouts = [t for t in (self.timeout, deadline.remaining()) if t is not None]
+        return {"timeout": min(timeouts)} if timeouts else {}
+
+    def _client_for_deadline(self, client, deadline):
+        # The client's own retries would each get the full timeout, so let the
+        # fallback chain do the retrying when a deadline is in force
+        if deadline.expires_at is not None and hasattr(client, "with_options"):
+            return client.with_options(max_retries=0)
+        return client
+
+    def _create(self, client, priority, deadline, **kwargs):
+        """Make one API call, holding a scheduler slot of the given priority if there is one."""
+        if self.scheduler is None:
+            return client.chat.completions.create(**kwargs)
+        with self.scheduler.slot(priority, timeout=deadline.remaining()):
+            # Time spent queueing comes out of the attempt's budget
+            remaining = deadline.remaining()
+            if remaining is not None and "timeout" in kwargs:
+                kwargs["timeout"] = min(kwargs["timeout"], remaining)
+            return client.chat.completions.create(**kwargs)
+
+    def convert(self, image_bytes, deadline=None, priority=INTERACTIVE):
+        """Convert image bytes to markdown. Raises ConversionError on failure."""
+        base64_image, mime_type = self.prepare(image_bytes)
+        return self.convert_base64(base64_image, deadline=deadline, mime_type=mime_type, priority=priority)
+
+    def convert_base64(self, base64_image, deadline=None, mime_type="image/png", priority=INTERACTIVE):
+        """
+        Convert a base64 encoded image, trying each model until one succeeds.
+
+        `deadline` (seconds or a Deadline) bounds the whole fallback chain;
+        it defaults to the converter's `deadline`. `priority` (INTERACTIVE or
+        BULK) decides the queue position when a scheduler is shared.
+        """
+        deadline = Deadline.coerce(deadline if deadline is not None else self.deadline)
+        messages = self._messages(base64_image, mime_type)
+        errors = []
+        start = time.perf_counter()
+        models = route = spent = None
+        if self.complexity_router is not None:
+            result, route, spent = self._try_cheap_model(base64_image, messages, deadline, priority, errors, start)
+            if result is not None:
+                return result
+            # The full chain, without repeating the cheap model
+            models = [m for m in self.models_to_try() if m != self.complexity_router.cheap_model]
+            if not models:
+                # e.g. --cheap-model is --model and --no-fallback is set
+                errors.append((self.complexity_router.cheap_model,
+                               ConversionError("No other model to escalate to", [])))
+                raise self._all_failed(errors)
+        result = self._attempt(self._targets(models), messages, deadline, priority, errors, start)
+        if result is None:
+            raise self._all_failed(errors)
+        result.route = route
+        # An escalated result also accounts for the tokens the cheap model used
+        result.usage = add_usage(result.usage, spent)
+        return result
+
+    def convert_tiled(self, image_bytes, cache=None, deadline=None, priority=INTERACTIVE):
+        """
+        Convert an image band by band, reusing cached markdown for bands seen before.
+
+        Only new bands are sent, up to max_workers at a time, so the tokens
+        and latency follow the size of the change rather than the page. The
+        usage covers the converted bands only. Images that cannot be split
+        are converted whole.
+        """
+        bands = split_bands(image_bytes)
+        if not bands:
+            return self.convert(image_bytes, deadline=deadline, priority=priority)
+        deadline = Deadline.coerce(deadline if deadline is not None else self.deadline)
+        cache = cache or TileCache()
+        settings = self.settings()
+        start = time.perf_counter()
+        keys = [cache.key(band["hash"], settings) for band in bands]
+        texts = [None] * len(bands)
+        models = []
+        missing = []
+        for i, key in enumerate(keys):
+            entry = cache.get(key)
+            if entry is None:
+                missing.append(i)
             else:
-                # Use all models in the predefined order
-                models_to_try = VISION_MODELS
-            
-            return try_models_in_sequence(base64_image, models_to_try, prompt, max_tokens)
-    
-    except Exception as e:
-        print(f"Error calling OpenAI API: {e}")
-        print("\nPossible solutions:")
-        print("1. Check your OpenAI API key in the .env file")
-        print("2. Ensure your OpenAI account has sufficient credits")
-        print("3. Try a different model with --model parameter")
-        print("   Available models with vision: " + ", ".join(VISION_MODELS))
-        print("4. Check your internet connection")
-        sys.exit(1)
+                texts[i] = entry["text"]
+                models.append(entry["model"])
+        self._log(f"Reusing {len(bands) - len(missing)} of {len(bands)} bands", "tiles.split",
+                  bands=len(bands), reused=len(bands) - len(missing))
+
+        result = ConversionResult(usage=None, tiles={"bands": len(bands), "reused": len(bands) - len(missing)})
+        errors = []
+        if missing:
+            # New bands are about to be added; drop the ones nobody has used for a while
+            cache.prune_if_due()
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                futures = {
+                    pool.submit(self.convert, bands[i]["png"], deadline=deadline, priority=priority): i
+                    for i in missing
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        band = future.result()
+                    except Img2MarkdownError as e:
+                        errors.append((f"band {i + 1}", e))
+                        continue
+                    # Cached straight away, so a retry after a failure only redoes the rest
+                    cache.put(keys[i], band.text, band.model)
+                    texts[i] = band.text
+                    models.append(band.model)
+                    result.usage = add_usage(result.usage, band.usage)
+                    result.continuations += band.continuations
+                    result.truncated = result.truncated or band.truncated
+        if errors:
+            deadline_errors = [e for _, e in errors if isinstance(e, DeadlineExceeded)]
+            if deadline_errors:
+                raise deadline_errors[0]
+            raise ConversionError(f"{len(errors)} of {len(bands)} bands failed. Last error: {errors[-1][1]}", errors)
+
+        result.text = join_bands(texts)
+        # The model that produced most of the bands
+        result.model = max(set(models), key=models.count)
+        result.elapsed = time.perf_counter() - start
+        log_event("tiles.done", bands=len(bands), converted=len(missing), elapsed=round(result.elapsed, 3),
+                  **(result.usage or {}))
+        return result
+
+    def _try_cheap_model(self, base64_image, messages, deadline, priority, errors, start):
+        """
+        Convert a simple image with the cheap model.
+
+        Returns (result, route, usage): the accepted result, or None with the
+        route the full chain takes ("full" or "escalated") and the usage of
+        a rejected cheap attempt.
+        """
+        router = self.complexity_router
+        tier, complexity = router.classify(base64.b64decode(base64_image))
+        if tier != "simple":
+            router.record("complex")
+            return None, "full", None
+        self._log(f"Simple image, trying {router.cheap_model} first", "route.cheap", model=router.cheap_model)
+        result = self._attempt(self._targets([router.cheap_model]), messages, deadline, priority, errors, start)
+        problem = "request failed" if result is None else router.check(result, complexity)
+        if problem is None:
+            router.record("cheap")
+            result.route = "cheap"
+            return result, "cheap", None
+        router.record("escalated")
+        self._log(f"Escalating to the full model: {problem}", "route.escalate", logging.INFO,
+                  model=router.cheap_model, reason=problem)
+        return None, "escalated", result.usage if result is not None else None
+
+    def _attempt(self, targets, messages, deadline, priority, errors, start):
+        """Try each (model, endpoint) target until one succeeds; None if they all fail."""
+        for model, endpoint in targets:
+            options = self._request_options(deadline, errors)
+            attempt_start = time.perf_counter()
+            try:
+                # Built per attempt so e.g. a missing API key fails this endpoint only
+                client = endpoint.sync_client() if endpoint else self._sync_client()
+                client = self._client_for_deadline(client, deadline)
+                self._log(f"Trying model: {model}...", "attempt.start", model=model, **options)
+                response = self._create(
+                    client, priority, deadline,
+                    model=model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    **options
+                )
+            except Exception as e:
+                self._record(endpoint, attempt_start, ok=False)
+                errors.append((f"{model}@{endpoint.name}" if endpoint else model, e))
+                self._log(f"Failed with model {model}: {e}", "attempt.failed", logging.WARNING, model=model, error=str(e))
+                continue
+            self._record(endpoint, attempt_start, ok=True)
+            self._log(f"Success with model: {model}", "attempt.ok", model=model)
+            result = self._start_result(model, response, endpoint)
+            while self._needs_continuation(result, response):
+                try:
+                    response = self._create(
+                        client, priority, deadline,
+                        model=model,
+                        messages=self._continuation_messages(messages, result),
+                        max_tokens=self.max_tokens,
+                        **self._request_options(deadline, errors)
+                    )
+                except Exception as e:
+                    self._log(f"Continuation failed with model {model}: {e}", "continuation.failed",
+                              logging.WARNING, model=model, error=str(e))
+                    break
+                self._add_continuation(result, response)
+            return self._finish_result(result, response, start)
+        return None
+
+    def _start_result(self, model, response, endpoint=None):
+        return ConversionResult(
+            text=response.choices[0].message.content or "",
+            model=model,
+            endpoint=endpoint.name if endpoint else None,
+            usage=add_usage(None, getattr(response, "usage", None)),
+        )
+
+    def _needs_continuation(self, result, response):
+        return (
+            getattr(response.choices[0], "finish_reason", None) == "length"
+            and result.continuations < self.max_continuations
+        )
+
+    def _continuation_messages(self, messages, result):
+        self._log(f"Output truncated at max_tokens, requesting continuation {result.continuations + 1}...",
+                  "continuation.start", model=result.model, continuation=result.continuations + 1)
+        return messages + [
+            {"role": "assistant", "content": result.text},
+            {"role": "user", "content": CONTINUATION_PROMPT},
+        ]
+
+    def _add_continuation(self, result, response):
+        result.text = join_continuation(result.text, response.choices[0].message.content or "")
+        result.usage = add_usage(result.usage, getattr(response, "usage", None))
+        result.continuations += 1
+
+    def _finish_result(self, result, response, start):
+        result.truncated = getattr(response.choices[0], "finish_reason", None) == "length"
+        result.elapsed = time.perf_counter() - start
+        log_event("conversion.done", model=result.model, elapsed=round(result.elapsed, 3),
+                  continuations=result.continuations, truncated=result.truncated, usage=result.usage)
+        return result
+
+    def _all_failed(self, errors):
+        log_event("conversion.failed", logging.ERROR, attempts=[(m, str(e)) for m, e in errors])
+        return ConversionError(f"All models failed. Last error: {errors[-1][1] if errors else None}", errors)
+
+    def convert_many(self, images, max_workers=None, priority=BULK, processes=None,
+                     triage=False, triage_thresholds=None):
+        """
+        Convert an iterable of image bytes, yielding results as they complete.
+
+        Results carry the input position in `index`; failures are yielded
+        with `error` set rather than raised, so one bad image does not stop
+        the batch. At most 2 * max_workers images are read ahead of the pool.
+
+        With `processes` set (0 for one per CPU core), images may also be
+        file paths: they are decoded, triaged (if `triage`) and encoded in a
+        process pool while max_workers requests run on an event loop. Empty
+        images then come back with `skipped` set instead of being sent.
+        """
+        max_workers = max_workers or self.max_workers
+        if processes is not None:
+            yield from self._convert_many_processes(images, max_workers, priority, processes,
+                                                    triage, triage_thresholds)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = set()
+            for index, image_bytes in enumerate(images):
+                pending.add(pool.submit(self._convert_indexed, index, image_bytes, priority))
+                if len(pending) >= 2 * max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+    def _convert_many_processes(self, images, max_workers, priority, processes, triage, triage_thresholds):
+        async def convert(index, prepared):
+            if "error" in prepared:
+                return ConversionResult(index=index, error=ConversionError(
+                    f"Could not prepare the image: {prepared['error']}"))
+            if prepared.get("triage") == "empty":
+                return ConversionResult(index=index, skipped="empty", error=ConversionError(
+                    "The image appears to be empty"))
+            log_event("upload.prepared", mime_type=prepared["mime_type"], **prepared["info"])
+            try:
+                result = await self.aconvert_base64(prepared["base64"], mime_type=prepared["mime_type"],
+                                                    priority=priority)
+            except Exception as e:
+                return ConversionResult(index=index, error=e)
+            result.index = index
+            return result
+
+        return iterate_pipeline(
+            images, convert,
+            processes=processes or None,
+            concurrency=max_workers,
+            prepare_options={
+                "target_bytes": self.target_bytes,
+                "upload_format": self.upload_format,
+                "triage": triage,
+                "triage_thresholds": triage_thresholds,
+            },
+        )
+
+    def _convert_indexed(self, index, image_bytes, priority=BULK):
+        try:
+            result = self.convert(image_bytes, priority=priority)
+        except Exception as e:
+            return ConversionResult(index=index, error=e)
+        result.index = index
+        return result
+
+    async def aconvert(self, image_bytes, deadline=None, priority=INTERACTIVE):
+        """Async variant of convert(); uses the async client when available."""
+        base64_image, mime_type = self.prepare(image_bytes)
+        return await self.aconvert_base64(base64_image, deadline=deadline, mime_type=mime_type,
+                                          priority=priority)
+
+    async def aconvert_base64(self, base64_image, deadline=None, mime_type="image/png",
+                              priority=INTERACTIVE):
+        """Async variant of convert_base64()."""
+        deadline = Deadline.coerce(deadline if deadline is not None else self.deadline)
+        native = self.router is None and self.scheduler is None and self.complexity_router is None
+        client = self._async_client() if native else None
+        if client is None:
+            # Only a sync client was injected, or requests are routed over
+            # several endpoints or models or share a (thread-based)
+            # scheduler: run the sync path off the event loop
+            return await asyncio.to_thread(self.convert_base64, base64_image, deadline, mime_type, priority)
+        client = self._client_for_deadline(client, deadline)
+        messages = self._messages(base64_image, mime_type)
+        errors = []
+        start = time.perf_counter()
+        for model in self.models_to_try():
+            options = self._request_options(deadline, errors)
+            try:
+                self._log(f"Trying model: {model}...", "attempt.start", model=model, **options)
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    **options
+                )
+            except Exception as e:
+                errors.append((model, e))
+                self._log(f"Failed with model {model}: {e}", "attempt.failed", logging.WARNING, model=model, error=str(e))
+                continue
+            self._log(f"Success with model: {model}", "attempt.ok", model=model)
+            result = self._start_result(model, response)
+            while self._needs_continuation(result, response):
+                try:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=self._continuation_messages(messages, result),
+                        max_tokens=self.max_tokens,
+                        **self._request_options(deadline, errors)
+                    )
+                except Exception as e:
+                    self._log(f"Continuation failed with model {model}: {e}", "continuation.failed",
+                              logging.WARNING, model=model, error=str(e))
+                    break
+                self._add_continuation(result, response)
+            return self._finish_result(result, response, start)
+        raise self._all_failed(errors)
+
+    async def aconvert_many(self, images, concurrency=None, priority=BULK):
+        """Async variant of convert_many(), yielding results as they complete."""
+        semaphore = asyncio.Semaphore(concurrency or self.max_workers)
+
+        async def run(index, image_bytes):
+            async with semaphore:
+                try:
+                    result = await self.aconvert(image_bytes, priority=priority)
+                except Exception as e:
+                    return ConversionResult(index=index, error=e)
+                result.index = index
+                return result
+
+        tasks = [asyncio.ensure_future(run(i, image)) for i, image in enumerate(images)]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+
+def print_conversion_help(error):
+    """Print troubleshooting hints for a failed conversion."""
+    print(f"Error calling OpenAI API: {error}")
+    print("\nPossible solutions:")
+    print("1. Check your OpenAI API key in the .env file")
+    print("2. Ensure your OpenAI account has sufficient credits")
+    print("3. Try a different model with --model parameter")
+    print("   Available models with vision: " + ", ".join(VISION_MODELS))
+    print("4. Check your internet connection")
+
+
+def config_file_path():
+    """Return the path of config.json, creating its directory if needed."""
+    config_dir = os.path.join(os.path.expanduser("~"), ".config", "img2markdown")
+    os.makedirs(config_dir, exist_ok=True)
+    return os.path.join(config_dir, "config.json")
 
 
 def save_config(config_path, config):
@@ -223,6 +929,12 @@ def parse_arguments():
         type=str,
         help=f"OpenAI model to use (available: {', '.join(VISION_MODELS)})"
     )
+    parser.add_argument(
+        "--cheap-model",
+        type=str,
+        help="Cheaper vision model tried first for simple images (few lines of text); "
+             "escalates to --model if its output fails basic checks"
+    )
     parser.add_argument(
         "--no-fallback",
         action="store_true",
@@ -244,6 +956,46 @@ def parse_arguments():
         default=4096,
         help="Maximum number of tokens in the response (default: 4096)"
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Timeout in seconds for each model attempt "
+             f"(default: {DEFAULT_INTERACTIVE_TIMEOUT} for the clipboard, none for --file)"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="End-to-end time budget in seconds shared by all model attempts, per image in "
+             "--dir, --queue, --ndjson and archive runs and per request with --serve-http "
+             f"(default: {DEFAULT_INTERACTIVE_DEADLINE} for the clipboard, none otherwise)"
+    )
+    parser.add_argument(
+        "--max-continuations",
+        type=int,
+        help="How many times to continue output that was cut off at --max-tokens "
+             f"(default: {DEFAULT_MAX_CONTINUATIONS}, 0 to disable)"
+    )
+    parser.add_argument(
+        "--target-bytes",
+        type=int,
+        help="Re-encode images larger than this many bytes to the smallest legible WebP/JPEG"
+    )
+    parser.add_argument(
+        "--upload-format",
+        choices=["webp", "jpeg"],
+        help="Lossy format used to meet --target-bytes (default: webp)"
+    )
+    parser.add_argument(
+        "--force-vision",
+        action="store_true",
+        help="Always send the clipboard image to the API, even when text or HTML is on the clipboard"
+    )
+    parser.add_argument(
+        "--tiles",
+        action="store_true",
+        help="Split the image into bands along blank rows and only convert bands that changed "
+             "since an earlier capture"
+    )
     parser.add_argument(
         "--list-models",
         action="store_true",
@@ -252,14 +1004,141 @@ def parse_arguments():
     parser.add_argument(
         "--file",
         type=str,
-        help="Path to image file to use instead of clipboard"
+        help="Path to image file to use instead of clipboard; a zip or tar archive converts every image in it"
     )
     parser.add_argument(
         "--output",
         type=str,
-        help="Path to save markdown output (default: clipboard)"
+        help="Path to save markdown output (default: clipboard); for archives a .zip of .md files "
+             "or a single combined document (default: <archive>-markdown.zip)"
+    )
+    parser.add_argument(
+        "--dir",
+        type=str,
+        help="Convert every image in a directory tree; re-runs only convert new or changed images"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        help="Where --dir writes the .md files and its manifest (default: next to the images)"
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        metavar="DB",
+        help="Shared work queue (a SQLite file several hosts can reach) for --enqueue, --work and --progress"
+    )
+    parser.add_argument(
+        "--enqueue",
+        type=str,
+        metavar="DIR",
+        help="Add every image in a directory tree to --queue (output goes to --output-dir or next to the images)"
+    )
+    parser.add_argument(
+        "--work",
+        action="store_true",
+        help="Claim and convert images from --queue until it is finished; run one per host"
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Show the progress and throughput of all workers on --queue"
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="How long a claimed image stays with a worker that stops renewing it "
+             f"(default: {DEFAULT_LEASE_SECONDS:.0f})"
+    )
+    parser.add_argument(
+        "--serve-http",
+        action="store_true",
+        help="Run a local HTTP conversion service (POST /convert, GET /healthz, GET /metrics)"
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help='Read JSON lines ({"id", "path" or "base64", "options"}) from stdin until it closes '
+             "and write a JSON result line for each as it finishes; --workers sets the window"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address for --serve-http to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port for --serve-http (default: 8765)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent conversions for --serve-http and --dir (default: 4)"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        metavar="N",
+        help="For --dir and archives: decode and encode images in N worker processes "
+             "(0 = one per CPU core) while requests run on an event loop"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Requests --serve-http queues before answering 503 (default: 16)"
+    )
+    parser.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Do not keep the raw model responses in ~/.img2markdown_responses"
+    )
+    parser.add_argument(
+        "--reprocess",
+        action="store_true",
+        help="Re-run the current markdown post-processing over all stored responses and rewrite "
+             "their outputs (or write <id>.md files to --output-dir), without calling the API"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "OFF"],
+        help="Level for the JSON-lines log in ~/.img2markdown_logs (default: INFO)"
+    )
+    parser.add_argument(
+        "--no-single-flight",
+        action="store_true",
+        help="Always make an API call, even if an identical conversion is already running"
+    )
+    parser.add_argument(
+        "--no-triage",
+        action="store_true",
+        help="Skip the local check for empty or textless images"
+    )
+    parser.add_argument(
+        "--skip-textless",
+        action="store_true",
+        help="Reject images that look like they contain no text instead of only warning"
+    )
+    parser.add_argument(
+        "--triage-benchmark",
+        type=str,
+        metavar="DIR",
+        help="Run the local image triage over a directory of fixture images and exit"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    # The queue actions have nothing to act on without a queue
+    for flag, value in (("--enqueue", args.enqueue), ("--work", args.work), ("--progress", args.progress)):
+        if value and not args.queue:
+            parser.error(f"{flag} requires --queue")
+    if args.queue and not (args.enqueue or args.work or args.progress):
+        parser.error("--queue needs --enqueue, --work or --progress")
+    return args
 
 
 def prep_for_pasting(markdown_text):
@@ -294,28 +1173,117 @@ def prep_for_pasting(markdown_text):
     return '\n'.join(processed_lines)
 
 
+def deliver_markdown(markdown, output_path=None):
+    """Write markdown to output_path (or the clipboard) and print a short preview."""
+    if output_path:
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(markdown)
+            print(f"Markdown content saved to {output_path}")
+        except Exception as e:
+            print(f"Error saving output file: {e}")
+            sys.exit(1)
+    else:
+        # Copy markdown to clipboard
+        print("Copying markdown to clipboard...")
+        pyperclip.copy(markdown)
+        print("Markdown content is now in your clipboard.")
+
+
+def print_preview(markdown):
+    """Print the first few lines of the markdown."""
+    preview_lines = markdown.split('\n')[:5]
+    print("\nPreview of markdown content:")
+    for line in preview_lines:
+        print(line)
+    if len(preview_lines) < len(markdown.split('\n')):
+        print("...")
+
+
 def main():
     """Main function to process clipboard image and convert to markdown."""
     args = parse_arguments()
+    run_start = time.monotonic()
+    timings = StageTimings()
+    mode = (
+        "reprocess" if args.reprocess else "serve-http" if args.serve_http else "ndjson" if args.ndjson else "queue" if args.queue
+        else "dir" if args.dir
+        else "file" if args.file else "clipboard"
+    )
+    
+    # Start reading the clipboard straight away: the configuration is loaded,
+    # the converter set up and the API connection opened while pngpaste runs
+    capture = None
+    if mode == "clipboard" and not (args.list_models or args.triage_benchmark):
+        capture = run_in_background(timings.timed, "capture", get_image_from_clipboard, True)
+    
+    # Load configuration
+    config_path = config_file_path()
+    config = timings.timed("config", load_config, config_path)
+    triage_thresholds = config.get("triage_thresholds")
+    
+    # Structured logging is written by a background thread
+    setup_logging(
+        level=args.log_level or config.get("log_level"),
+        sample_rate=config.get("log_sample_rate")
+    )
+    log_event("run.start", mode=mode)
+    
+    # Several OpenAI-compatible endpoints can be configured in config.json
+    router = EndpointRouter.from_config(config["endpoints"]) if config.get("endpoints") else None
+    if router:
+        atexit.register(router.save_stats)
     
     # Handle list-models flag
     if args.list_models:
         print("Available models with vision capabilities:")
-        for model in VISION_MODELS:
+        for model in (router.models() if router else None) or VISION_MODELS:
             print(f"- {model}")
+        if router:
+            print()
+            print("\n".join(router.describe()))
         sys.exit(0)
     
-    # Load configuration
-    config_dir = os.path.join(os.path.expanduser("~"), ".config", "img2markdown")
-    os.makedirs(config_dir, exist_ok=True)
-    config_path = os.path.join(config_dir, "config.json")
-    config = load_config(config_path)
+    # Handle triage-benchmark flag
+    if args.triage_benchmark:
+        benchmark_triage(args.triage_benchmark, triage_thresholds)
+        sys.exit(0)
+    
+    # Fill or inspect a shared work queue; neither needs the API
+    if args.queue and not args.work:
+        queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+        if args.enqueue:
+            added = queue.enqueue(args.enqueue, args.output_dir)
+            print(f"Added {added} images to {args.queue}")
+        if args.progress:
+            print("\n".join(queue.describe()))
+        queue.close()
+        sys.exit(0)
+    
+    # Raw responses are kept so new formatting rules can be applied offline
+    store = None if args.no_store else ResponseStore.from_config(config)
+    
+    # Re-run the post-processing over the stored responses; no API call needed
+    if args.reprocess:
+        if store is None:
+            print("Error: the response store is disabled (--no-store or store_responses in config.json).")
+            sys.exit(1)
+        counts = reprocess(store, prep_for_pasting, args.output_dir, args.processes or None)
+        sys.exit(1 if counts["failed"] else 0)
     
     # Use command line args or fall back to config values
     model = args.model or config.get("model")
     fallback = not args.no_fallback if args.no_fallback is not None else config.get("fallback", True)
-    prompt = args.prompt or config.get("prompt", "Output the contents of the image in markdown format.")
+    prompt = args.prompt or config.get("prompt", DEFAULT_PROMPT)
     max_tokens = args.max_tokens or config.get("max_tokens", 4096)
+    timeout = args.timeout or config.get("timeout")
+    deadline = args.deadline or config.get("deadline")
+    target_bytes = args.target_bytes or config.get("target_bytes")
+    upload_format = args.upload_format or config.get("upload_format", "webp")
+    cheap_model = args.cheap_model or config.get("cheap_model")
+    max_continuations = args.max_continuations
+    if max_continuations is None:
+        max_continuations = config.get("max_continuations", DEFAULT_MAX_CONTINUATIONS)
     
     # Save configuration if requested
     if args.save_config:
@@ -325,15 +1293,157 @@ def main():
             "prompt": prompt,
             "max_tokens": max_tokens
         }
+        if timeout:
+            new_config["timeout"] = timeout
+        if deadline:
+            new_config["deadline"] = deadline
+        if target_bytes:
+            new_config["target_bytes"] = target_bytes
+            new_config["upload_format"] = upload_format
+        if cheap_model:
+            new_config["cheap_model"] = cheap_model
         save_config(config_path, new_config)
     
+    # The interactive clipboard path should never hang the Shortcut
+    if mode == "clipboard":
+        timeout = timeout or DEFAULT_INTERACTIVE_TIMEOUT
+        deadline = deadline or DEFAULT_INTERACTIVE_DEADLINE
+    
+    # Simple images can go to a cheaper model first
+    complexity_router = None
+    if cheap_model:
+        complexity_router = ComplexityRouter(cheap_model, config.get("complexity_thresholds"))
+    
+    # Set up the converter (one client, one connection pool)
+    try:
+        converter = Converter(
+            model=model,
+            fallback=fallback,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            deadline=deadline,
+            max_continuations=max_continuations,
+            max_workers=args.workers,
+            target_bytes=target_bytes,
+            upload_format=upload_format,
+            router=router,
+            complexity_router=complexity_router,
+            store=store,
+            verbose=True
+        )
+    except ConfigurationError:
+        # Text on the clipboard is still converted without an API key
+        converter = None
+    
+    # Open the connection to the API while the clipboard is checked and the
+    # image captured and encoded; the conversion never waits for it
+    if converter is not None and mode in ("clipboard", "file"):
+        run_in_background(timings.timed, "warm-up", converter.warm_up)
+    
+    # Text copied from a web page or PDF viewer is already on the clipboard:
+    # convert it locally instead of OCR-ing the rendered picture
+    if mode == "clipboard" and not (args.force_vision or config.get("force_vision", False)):
+        start = time.perf_counter()
+        clipboard_text = get_text_from_clipboard()
+        if clipboard_text is not None:
+            kind, markdown = clipboard_text
+            prepared_markdown = prep_for_pasting(markdown.strip())
+            elapsed = time.perf_counter() - start
+            print(f"Found {kind} on the clipboard; converted it locally in {elapsed * 1000:.0f} ms.")
+            print("Use --force-vision to convert the clipboard image with the API instead.")
+            deliver_markdown(prepared_markdown, args.output)
+            print("Done! No API call was needed.")
+            log_event("run.done", model=None, source=kind, elapsed=round(elapsed, 3),
+                      output="file" if args.output else "clipboard")
+            print_preview(prepared_markdown)
+            sys.exit(0)
+    
+    if converter is None:
+        print("Error: OPENAI_API_KEY not found in environment variables.")
+        print("Please make sure you have a .env file with your OpenAI API key:")
+        print("OPENAI_API_KEY=your_api_key_here")
+        sys.exit(1)
+    
+    # Run as a resident HTTP service
+    if args.serve_http:
+        from img2markdown_server import serve
+        converter.verbose = False
+        serve(converter, args.host, args.port, args.workers, args.queue_size)
+        sys.exit(0)
+    
+    # Convert a whole directory tree
+    if args.dir:
+        converter.verbose = False
+        counts = convert_directory(
+            converter,
+            args.dir,
+            args.output_dir,
+            triage=not args.no_triage and config.get("triage", True),
+            triage_thresholds=triage_thresholds,
+            processes=args.processes
+        )
+        if converter.complexity_router:
+            print(converter.complexity_router.describe())
+        sys.exit(1 if counts["failed"] else 0)
+    
+    # Stream conversions between stdin and stdout, staying up until stdin closes
+    if args.ndjson:
+        from img2markdown_ndjson import serve_ndjson
+        converter.verbose = False
+        serve_ndjson(
+            converter,
+            window=args.workers,
+            tiles=args.tiles or config.get("tiles", False),
+            triage=not args.no_triage and config.get("triage", True),
+            triage_thresholds=triage_thresholds
+        )
+        sys.exit(0)
+    
+    # Work through a shared queue alongside workers on other hosts
+    if args.queue:
+        converter.verbose = False
+        queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+        counts = run_worker(
+            converter,
+            queue,
+            triage=not args.no_triage and config.get("triage", True),
+            triage_thresholds=triage_thresholds
+        )
+        if args.progress:
+            print("\n".join(queue.describe()))
+        queue.close()
+        sys.exit(1 if counts["failed"] else 0)
+    
+    # Convert the images inside an archive, streaming them without extracting
+    if args.file and is_archive(args.file):
+        converter.verbose = False
+        counts = convert_archive(
+            converter,
+            args.file,
+            args.output,
+            triage=not args.no_triage and config.get("triage", True),
+            triage_thresholds=triage_thresholds,
+            processes=args.processes
+        )
+        if converter.complexity_router:
+            print(converter.complexity_router.describe())
+        sys.exit(1 if counts["failed"] else 0)
+    
+    # The deadline covers capture and encoding as well as the API calls
+    run_deadline = Deadline(deadline, start=run_start)
+    
     # Get image data
     image_bytes = None
     if args.file:
         print(f"Reading image from file: {args.file}")
-        image_bytes = get_image_from_file(args.file)
+        image_bytes = timings.timed("capture", get_image_from_file, args.file)
     else:
-        image_bytes = get_image_from_clipboard()
+        print("Getting image from clipboard using pngpaste...")
+        image_bytes = capture.result()
+        if not image_bytes:
+            # Capture again in the foreground so the reason is printed
+            image_bytes = get_image_from_clipboard()
     
     # Check if we have image data
     if not image_bytes:
@@ -342,48 +1452,95 @@ def main():
         sys.exit(1)
     
     print(f"Successfully captured image ({len(image_bytes)} bytes)")
+    log_event("capture.done", bytes=len(image_bytes), source="file" if args.file else "clipboard")
     
-    # Encode image
-    print("Encoding image to base64...")
-    base64_image = encode_image(image_bytes)
+    # Check locally for empty or textless images before paying for an API call
+    if not args.no_triage and config.get("triage", True):
+        triage = timings.timed("triage", triage_image, image_bytes, triage_thresholds)
+        log_event("triage.done", **(triage or {"label": None}))
+        if triage is not None:
+            print(
+                f"Image triage: {triage['label']} (variance {triage['variance']}, "
+                f"entropy {triage['entropy']}, edge density {triage['edge_density']})"
+            )
+            if triage["label"] == "empty":
+                print("The image appears to be empty (blank or a single colour). Nothing to convert.")
+                print("Use --no-triage to send it to the API anyway.")
+                sys.exit(1)
+            if triage["label"] == "textless":
+                if args.skip_textless or config.get("skip_textless", False):
+                    print("The image does not appear to contain any text. Skipping conversion.")
+                    print("Use --no-triage to send it to the API anyway.")
+                    sys.exit(1)
+                print("Warning: the image does not appear to contain any text.")
     
-    # Send to OpenAI and get markdown
-    markdown_text, used_model = image_to_markdown(
-        base64_image,
-        model=model,
-        fallback=fallback,
-        prompt=prompt,
-        max_tokens=max_tokens
-    )
+    # Encode image (with its real MIME type, transcoded or shrunk if needed);
+    # in tiled mode each changed band is encoded on its own instead
+    tiles = args.tiles or config.get("tiles", False)
+    if not tiles:
+        print("Encoding image to base64...")
+        base64_image, mime_type = timings.timed("encode", converter.prepare, image_bytes)
+        print(f"Uploading as {mime_type} (~{len(base64_image) * 3 // 4} bytes)")
+    
+    # Send to OpenAI and get markdown. A concurrent run converting the same
+    # image (e.g. a double-tapped Shortcut) shares its result with us.
+    def convert():
+        if tiles:
+            return converter.convert_tiled(image_bytes, deadline=run_deadline).to_dict()
+        return converter.convert_base64(base64_image, deadline=run_deadline, mime_type=mime_type).to_dict()
+    
+    try:
+        if args.no_single_flight or not config.get("single_flight", True):
+            result = ConversionResult.from_dict(timings.timed("convert", convert))
+        else:
+            key = f"{hashlib.sha256(image_bytes).hexdigest()[:32]}-{settings_hash(converter.settings())}"
+            wait_timeout = run_deadline.remaining() or DEFAULT_WAIT_TIMEOUT
+            data, shared = timings.timed("convert", SingleFlight().run, key, convert, wait_timeout)
+            result = ConversionResult.from_dict(data)
+            if shared:
+                print("Reusing the result of an identical concurrent conversion.")
+    except DeadlineExceeded as e:
+        print(f"Error: {e}.")
+        print("Raise the budget with --deadline or --timeout, or try again later.")
+        sys.exit(1)
+    except Img2MarkdownError as e:
+        print_conversion_help(e)
+        sys.exit(1)
+    used_model = result.model
+    if result.tiles:
+        converted = result.tiles["bands"] - result.tiles["reused"]
+        print(f"Split into {result.tiles['bands']} bands: reused {result.tiles['reused']}, converted {converted}.")
+    if result.continuations:
+        print(f"Output hit the token limit; continued {result.continuations} time(s).")
+    if result.truncated:
+        print("Warning: the output is still truncated. Try a larger --max-tokens or --max-continuations.")
+    if result.route == "escalated":
+        print(f"The output of {cheap_model} failed the quality checks; converted with {used_model} instead.")
     
     # Prepare markdown for pasting
-    prepared_markdown = prep_for_pasting(markdown_text)
+    prepared_markdown = result.markdown
     
     # Handle output
-    if args.output:
-        try:
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(prepared_markdown)
-            print(f"Markdown content saved to {args.output}")
-        except Exception as e:
-            print(f"Error saving output file: {e}")
-            sys.exit(1)
-    else:
-        # Copy markdown to clipboard
-        print("Copying markdown to clipboard...")
-        pyperclip.copy(prepared_markdown)
-        print("Markdown content is now in your clipboard.")
+    deliver_markdown(prepared_markdown, args.output)
+    converter.remember(result, source=args.file or "clipboard", output=args.output,
+                       image_hash=hashlib.sha256(image_bytes).hexdigest(), markdown=prepared_markdown)
     
-    print(f"Done! Used model: {used_model}")
+    print(f"Done! Used model: {used_model}" + (f" via {result.endpoint}" if result.endpoint else ""))
+    log_event("run.done", model=used_model, endpoint=result.endpoint, route=result.route,
+              output="file" if args.output else "clipboard")
     
     # Also print the first few lines of the markdown
-    preview_lines = prepared_markdown.split('\n')[:5]
-    print("\nPreview of markdown content:")
-    for line in preview_lines:
-        print(line)
-    if len(preview_lines) < len(prepared_markdown.split('\n')):
-        print("...")
+    print_preview(prepared_markdown)
+    
+    print()
+    print(timings.summary())
+    stage_ms = {f"{name.replace('-', '_')}_ms": round(seconds * 1000) for name, seconds in timings.stages.items()}
+    log_event("run.timings", saved_ms=round(timings.saved() * 1000), **stage_ms)
 
 
 if __name__ == "__main__":
+    # The worker pools of --processes and --reprocess are spawned; in the
+    # PyInstaller binary each worker starts this executable again and must run
+    # its task rather than the CLI
+    multiprocessing.freeze_support()
     main()
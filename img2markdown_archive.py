@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Convert the images inside a zip or tar archive without extracting it.
+
+Members are read one at a time, straight from the archive, as the converter
+asks for more work, so memory stays bounded by the images in flight. The
+markdown is written, in archive order, either as a zip of .md files or as
+one combined document.
+"""
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+
+from img2markdown_batch import IMAGE_EXTENSIONS
+from img2markdown_image import triage_image
+
+ARCHIVE_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tbz2", ".txz", ".tar", ".zip")
+
+
+def is_archive(path):
+    """True if path is a zip or tar (optionally compressed) file."""
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def archive_stem(path):
+    """The archive's file name without its (possibly double) extension."""
+    name = os.path.basename(path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def _is_image_member(name):
+    parts = name.split("/")
+    # Skip the resource forks macOS adds to zips it creates
+    if "__MACOSX" in parts or parts[-1].startswith("._"):
+        return False
+    return posixpath.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_archive_images(path):
+    """Yield (member name, image bytes) for every image in the archive, in archive order."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image_member(info.filename):
+                    yield info.filename, archive.read(info)
+        return
+    # Stream mode reads the (compressed) tar front to back without seeking
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and _is_image_member(member.name):
+                f = archive.extractfile(member)
+                yield member.name, f.read()
+
+
+class ZipOutput:
+    """
+    Write each member's markdown as <member>.md into a zip.
+
+    Members are written in archive order, so a later member whose name
+    differs only in the extension (e.g. shot.jpg after shot.png) keeps it
+    (shot.jpg.md); a member repeated in a tar gets a number (shot-2.md).
+    """
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        # Compared ignoring case, as they clash when extracted on macOS
+        self.names = set()
+
+    def write(self, name, markdown):
+        output = posixpath.splitext(name)[0] + ".md"
+        if output.lower() in self.names:
+            output = name + ".md"
+        stem, number = output[:-len(".md")], 2
+        while output.lower() in self.names:
+            output = f"{stem}-{number}.md"
+            number += 1
+        self.names.add(output.lower())
+        self.archive.writestr(output, markdown)
+
+    def close(self):
+        self.archive.close()
+
+
+class CombinedOutput:
+    """Write all markdown into one document with a section per member."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.sections = 0
+
+    def write(self, name, markdown):
+        if self.sections:
+            self.file.write("\n\n")
+        self.file.write(f"## {name}\n\n{markdown.strip()}\n")
+        self.sections += 1
+
+    def close(self):
+        self.file.close()
+
+
+def convert_archive(converter, archive_path, output_path=None,
+                    triage=True, triage_thresholds=None, verbose=True, processes=None):
+    """
+    Convert every image in a zip or tar archive.
+
+    output_path ending in .zip gets one .md file per image, anything else a
+    single combined document; the default is <archive>-markdown.zip next to
+    the archive. Results that finish early are held back only until the
+    images before them are done, so the output is always in archive order.
+    With `processes` set (0 for one per core) triage and encoding run in a
+    process pool. Returns a dict of counts.
+    """
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(archive_path),
+                                   f"{archive_stem(archive_path)}-markdown.zip")
+    temp_path = f"{output_path}.tmp{os.getpid()}"
+    output = ZipOutput(temp_path) if output_path.lower().endswith(".zip") else CombinedOutput(temp_path)
+    counts = {"converted": 0, "empty": 0, "failed": 0}
+    names = []
+    finished = {}
+    next_index = 0
+    start = time.perf_counter()
+
+    def pending_images():
+        """Yield the image bytes to convert, recording each member name in names."""
+        for name, image_bytes in iter_archive_images(archive_path):
+            if triage and processes is None:
+                result = triage_image(image_bytes, triage_thresholds)
+                if result is not None and result["label"] == "empty":
+                    counts["empty"] += 1
+                    if verbose:
+                        print(f"Skipped empty image: {name}")
+                    continue
+            names.append(name)
+            yield image_bytes
+
+    try:
+        results = converter.convert_many(pending_images(), processes=processes,
+                                         triage=triage, triage_thresholds=triage_thresholds)
+        for result in results:
+            finished[result.index] = result
+            # Write out every result whose predecessors are all done
+            while next_index in finished:
+                result = finished.pop(next_index)
+                name = names[next_index]
+                next_index += 1
+                if result.skipped == "empty":
+                    counts["empty"] += 1
+                    if verbose:
+                        print(f"Skipped empty image: {name}")
+                    continue
+                if not result.ok:
+                    counts["failed"] += 1
+                    if verbose:
+                        print(f"Failed: {name}: {result.error}")
+                    continue
+                output.write(name, result.markdown)
+                converter.remember(result, source=f"{archive_path}:{name}")
+                counts["converted"] += 1
+                if verbose:
+                    print(f"Converted: {name} ({result.model}, {result.elapsed:.1f}s)")
+        output.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        output.close()
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    if verbose:
+        print(
+            f"Converted {counts['converted']}, empty {counts['empty']}, failed {counts['failed']} "
+            f"in {time.perf_counter() - start:.1f}s -> {output_path}"
+        )
+    return counts
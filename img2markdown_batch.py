@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Directory conversions with a manifest for incremental re-runs.
+
+The manifest is a small SQLite database kept in the output directory. For
+every image it records the size, mtime, content hash, the hash of the
+conversion settings and where the markdown was written, so a re-run only
+converts new or changed images and an interrupted run resumes where it
+stopped.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from img2markdown_image import triage_image
+
+MANIFEST_NAME = ".img2markdown-manifest.sqlite"
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def output_names(rel_paths):
+    """
+    Map image paths to the paths of their .md files.
+
+    "sub/shot.png" becomes "sub/shot.md", unless another image in the same
+    folder has the same name up to the extension (ignoring case, as macOS
+    does): then each keeps its extension, e.g. "sub/shot.png.md" and
+    "sub/shot.jpg.md", so no output overwrites another.
+    """
+    stems = Counter(os.path.splitext(path)[0].lower() for path in rel_paths)
+    return {
+        path: (path if stems[os.path.splitext(path)[0].lower()] > 1 else os.path.splitext(path)[0]) + ".md"
+        for path in rel_paths
+    }
+
+
+def settings_hash(settings):
+    """Hash the settings that affect the output, so changing them forces a re-run."""
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def find_images(source_dir):
+    """Return the paths of all images below source_dir, relative to it, in sorted order."""
+    found = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), source_dir))
+    return found
+
+
+def write_atomic(path, text):
+    """Write text to path via a temporary file so a crash never leaves half a file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class Manifest:
+    """SQLite journal of converted images, keyed on the path relative to the source directory."""
+
+    def __init__(self, path):
+        self.path = path
+        # With a process pool the images are listed on a different thread
+        # from the one recording results, so access is serialised here
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha256 TEXT,
+                settings_hash TEXT,
+                output TEXT,
+                model TEXT,
+                status TEXT,
+                error TEXT,
+                updated_at REAL
+            )
+            """
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def get(self, path):
+        with self._lock:
+            cursor = self.db.execute(
+                "SELECT size, mtime_ns, sha256, settings_hash, output, status FROM files WHERE path = ?",
+                (path,)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        keys = ("size", "mtime_ns", "sha256", "settings_hash", "output", "status")
+        return dict(zip(keys, row))
+
+    def record(self, path, size, mtime_ns, sha256, settings, output, model, status, error=None):
+        """Insert or replace the entry for path and commit straight away."""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, sha256, settings, output, model, status, error, time.time())
+            )
+            self.db.commit()
+
+    def is_current(self, entry, settings, size=None, mtime_ns=None, sha256=None):
+        """True if a finished entry still matches the file and settings."""
+        if entry is None or entry["status"] not in ("done", "empty"):
+            return False
+        if entry["settings_hash"] != settings:
+            return False
+        if entry["status"] == "done" and not os.path.exists(entry["output"]):
+            return False
+        if sha256 is not None:
+            return entry["sha256"] == sha256
+        return entry["size"] == size and entry["mtime_ns"] == mtime_ns
+
+
+def convert_directory(converter, source_dir, output_dir=None, settings=None,
+                      triage=True, triage_thresholds=None, verbose=True, processes=None):
+    """
+    Convert every image below source_dir into a .md file in output_dir.
+
+    Images whose size, mtime (or, failing that, content hash) and settings
+    match the manifest are skipped. Each finished image is committed to the
+    manifest immediately, so an interrupted run resumes where it stopped.
+    `settings` defaults to converter.settings(). With `processes` set (0 for
+    one per core) triage and encoding run in a process pool. Returns a dict
+    of counts.
+    """
+    output_dir = output_dir or source_dir
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    settings = settings_hash(settings if settings is not None else converter.settings())
+    counts = {"converted": 0, "unchanged": 0, "empty": 0, "failed": 0}
+    jobs = []
+    start = time.perf_counter()
+
+    def pending_images():
+        """Yield the bytes of every image that needs converting, recording its metadata in jobs."""
+        images = find_images(source_dir)
+        outputs = output_names(images)
+        for rel_path in images:
+            full_path = os.path.join(source_dir, rel_path)
+            stat = os.stat(full_path)
+            entry = manifest.get(rel_path)
+            # Cheap check first: unchanged size and mtime need no hashing
+            if manifest.is_current(entry, settings, size=stat.st_size, mtime_ns=stat.st_mtime_ns):
+                counts["unchanged"] += 1
+                continue
+
+            with open(full_path, 'rb') as f:
+                image_bytes = f.read()
+            digest = hashlib.sha256(image_bytes).hexdigest()
+            output = os.path.join(output_dir, outputs[rel_path])
+            if manifest.is_current(entry, settings, sha256=digest):
+                # Touched but not changed, just refresh the stat fields
+                manifest.record(rel_path, stat.st_size, stat.st_mtime_ns, digest, settings,
+                                entry["output"], None, entry["status"])
+                counts["unchanged"] += 1
+                continue
+
+            if triage and processes is None:
+                result = triage_image(image_bytes, triage_thresholds)
+                if result is not None and result["label"] == "empty":
+                    manifest.record(rel_path, stat.st_size, stat.st_mtime_ns, digest, settings,
+                                    None, None, "empty")
+                    counts["empty"] += 1
+                    if verbose:
+                        print(f"Skipped empty image: {rel_path}")
+                    continue
+
+            jobs.append((rel_path, stat.st_size, stat.st_mtime_ns, digest, output))
+            # Worker processes read the file themselves
+            yield image_bytes if processes is None else full_path
+
+    try:
+        results = converter.convert_many(pending_images(), processes=processes,
+                                         triage=triage, triage_thresholds=triage_thresholds)
+        for result in results:
+            rel_path, size, mtime_ns, digest, output = jobs[result.index]
+            if result.skipped == "empty":
+                manifest.record(rel_path, size, mtime_ns, digest, settings, None, None, "empty")
+                counts["empty"] += 1
+                if verbose:
+                    print(f"Skipped empty image: {rel_path}")
+                continue
+            if not result.ok:
+                manifest.record(rel_path, size, mtime_ns, digest, settings, None, None,
+                                "failed", str(result.error))
+                counts["failed"] += 1
+                if verbose:
+                    print(f"Failed: {rel_path}: {result.error}")
+                continue
+            write_atomic(output, result.markdown)
+            manifest.record(rel_path, size, mtime_ns, digest, settings, output, result.model, "done")
+            converter.remember(result, source=os.path.join(source_dir, rel_path), output=output, image_hash=digest)
+            counts["converted"] += 1
+            if verbose:
+                print(f"Converted: {rel_path} -> {output} ({result.model}, {result.elapsed:.1f}s)")
+    finally:
+        manifest.close()
+
+    if verbose:
+        print(
+            f"Converted {counts['converted']}, unchanged {counts['unchanged']}, "
+            f"empty {counts['empty']}, failed {counts['failed']} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+    return counts
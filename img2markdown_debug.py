@@ -11,19 +11,21 @@ import subprocess
 import configparser
 from pathlib import Path
 import datetime
+import logging
+
+from img2markdown_log import log_event, setup_logging
 
 # Create debug log directory in user's home
 debug_dir = os.path.join(os.path.expanduser("~"), ".img2markdown_debug")
 os.makedirs(debug_dir, exist_ok=True)
 
-# Set up logging to file
+# Set up logging to file (JSON lines, written by a background thread, rotated by size)
 debug_log = os.path.join(debug_dir, "shortcut_debug.log")
+setup_logging(debug_log, level=os.getenv("IMG2MARKDOWN_LOG_LEVEL", "DEBUG"))
 
 def log_debug(message):
-    """Write debug message to log file with timestamp"""
-    timestamp = datetime.datetime.now().isoformat()
-    with open(debug_log, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
+    """Queue a debug message for the background log writer"""
+    log_event(message, logging.DEBUG)
 
 def log_environment():
     """Log detailed environment information"""
@@ -32,7 +34,8 @@ def log_environment():
         "working_directory": os.getcwd(),
         "python_path": sys.executable,
         "python_version": sys.version,
-        "environment_variables": {k: v for k, v in os.environ.items() if not k.startswith("SUDO_")},
+        # Names only, the values may contain secrets such as OPENAI_API_KEY
+        "environment_variable_names": sorted(os.environ),
         "script_path": os.path.abspath(__file__),
         "args": sys.argv,
         "platform": sys.platform,
@@ -71,12 +74,7 @@ def log_environment():
     except Exception as e:
         env_info["pngpaste_error"] = str(e)
     
-    # Write debug info to a file
-    debug_file = os.path.join(debug_dir, "environment.json")
-    with open(debug_file, "w", encoding="utf-8") as f:
-        json.dump(env_info, f, indent=2, default=str)
-    
-    log_debug(f"Environment information written to {debug_file}")
+    log_event("environment", logging.DEBUG, **env_info)
 
 def main():
     """Main function with enhanced error handling for Shortcuts"""
@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
 import sys
-import os
-import subprocess
+import pyperclip
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget, QLabel
 )
 from PyQt5.QtCore import Qt, QTimer
 
+from img2markdown import (
+    DEFAULT_INTERACTIVE_DEADLINE, DEFAULT_INTERACTIVE_TIMEOUT, Converter, Img2MarkdownError,
+    get_image_from_clipboard, load_config, config_file_path
+)
+from img2markdown_router import ComplexityRouter, EndpointRouter
+from img2markdown_store import ResponseStore
+
 
 class Img2MarkdownGUI(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.converter = None
         self.initUI()
         self.timer = QTimer()
         self.timer.timeout.connect(self.reset_status)
@@ -51,21 +58,36 @@ class Img2MarkdownGUI(QMainWindow):
         y = (screen_geometry.height() - window_geometry.height()) // 2
         self.move(x, y)
 
+    def get_converter(self):
+        """Create the converter on first use and keep it for later clicks"""
+        if self.converter is None:
+            config = load_config(config_file_path())
+            endpoints = config.get("endpoints")
+            self.converter = Converter(
+                router=EndpointRouter.from_config(endpoints) if endpoints else None,
+                complexity_router=ComplexityRouter.from_config(config),
+                store=ResponseStore.from_config(config),
+                model=config.get("model"),
+                fallback=config.get("fallback", True),
+                prompt=config.get("prompt"),
+                max_tokens=config.get("max_tokens", 4096),
+                # A click should never leave the window waiting on a stalled connection
+                timeout=config.get("timeout") or DEFAULT_INTERACTIVE_TIMEOUT,
+                deadline=config.get("deadline") or DEFAULT_INTERACTIVE_DEADLINE
+            )
+        return self.converter
+
     def convert_image(self):
-        """Run the img2markdown executable and show status"""
+        """Convert the clipboard image in-process and show status"""
         try:
-            # Get the absolute path to the executable
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            executable_path = os.path.join(script_dir, 'dist', 'img2markdown')
-
-            # Run the executable
             self.status_label.setText("Converting image...")
-            subprocess.run(
-                [executable_path],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            image_bytes = get_image_from_clipboard()
+            if not image_bytes:
+                raise Img2MarkdownError("No image found in clipboard.")
+
+            result = self.get_converter().convert(image_bytes)
+            pyperclip.copy(result.markdown)
+            self.get_converter().remember(result, source="clipboard")
 
             # Show success message
             self.status_label.setText("Markdown copied to clipboard!")
@@ -74,9 +96,9 @@ class Img2MarkdownGUI(QMainWindow):
             # Reset status after 5 seconds
             self.timer.start(5000)
 
-        except subprocess.CalledProcessError as e:
+        except Img2MarkdownError as e:
             # Show error message
-            self.status_label.setText(f"Error: {e.stderr}")
+            self.status_label.setText(f"Error: {e}")
             self.status_label.setStyleSheet("color: red;")
             # Reset status after 5 seconds
             self.timer.start(5000)
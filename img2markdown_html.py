@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Text-on-clipboard fast path.
+
+Copying from a web page or a PDF viewer puts HTML, RTF or plain text on the
+clipboard next to (or instead of) a rendered picture. That text is already
+there for free, so it is converted locally to markdown instead of sending
+the picture to a vision model.
+"""
+import re
+import subprocess
+from html.parser import HTMLParser
+
+# Clipboard classes as reported by AppleScript's "clipboard info"
+HTML_CLASS = "«class HTML»"
+RTF_CLASS = "«class RTF »"
+TEXT_CLASSES = ("«class utf8»", "«class ut16»", "string", "Unicode text")
+IMAGE_CLASSES = ("«class PNGf»", "TIFF picture", "JPEG picture", "GIF picture", "«class PDF »")
+
+CLIPBOARD_TIMEOUT = 5
+
+BLOCK_TAGS = {"p", "div", "section", "article", "header", "footer", "main", "aside",
+              "nav", "figure", "figcaption", "form", "dl", "dt", "dd", "address"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+SKIP_TAGS = {"head", "script", "style", "title", "noscript", "template", "svg"}
+VOID_TAGS = {"br", "hr", "img", "meta", "link", "input", "wbr", "col", "area", "base", "source"}
+
+
+def _escape_cell(text):
+    return text.replace("|", "\\|").replace("\n", " ").strip()
+
+
+class _MarkdownBuilder(HTMLParser):
+    """Collect markdown from a stream of HTML parser events."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.current = []
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.lists = []
+        self.quote_depth = 0
+        self.links = []
+        self.table = None
+        # Indent of the list item being written, None outside list items
+        self.item_indent = None
+        # Consecutive items of the same top-level list are kept on adjacent lines
+        self.list_group = 0
+
+    # Block handling
+
+    def _prefix(self):
+        return "> " * self.quote_depth
+
+    def _flush(self):
+        """End the current block, if it has any text."""
+        text = "".join(self.current)
+        self.current = []
+        indent, self.item_indent = self.item_indent, None
+        kind = f"item{self.list_group}" if indent is not None else "block"
+        if self.pre_depth:
+            if text.strip("\n"):
+                self.blocks.append((text, "block"))
+            return
+        text = re.sub(r"[ \t\r\f\v]*\n[ \t\r\f\v]*", "\n", text)
+        text = re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+        if not text:
+            return
+        prefix = self._prefix()
+        if indent:
+            text = indent + text
+        self.blocks.append(("\n".join(prefix + line for line in text.split("\n")), kind))
+
+    def _write(self, text):
+        if self.skip_depth:
+            return
+        if self.table is not None:
+            if self.table["cell"] is not None:
+                self.table["cell"].append(text)
+            return
+        self.current.append(text)
+
+    # HTMLParser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        if tag in HEADING_TAGS:
+            self._flush()
+            self._write("#" * HEADING_TAGS[tag] + " ")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+        elif tag == "br":
+            self._write("\n")
+        elif tag == "hr":
+            self._flush()
+            self.blocks.append(("---", "block"))
+        elif tag in ("strong", "b"):
+            self._write("**")
+        elif tag in ("em", "i"):
+            self._write("*")
+        elif tag in ("del", "s", "strike"):
+            self._write("~~")
+        elif tag == "code" and not self.pre_depth:
+            self._write("`")
+        elif tag == "pre":
+            self._flush()
+            self.pre_depth += 1
+            self.current.append("```\n")
+        elif tag == "a":
+            self.links.append(attrs.get("href"))
+            if attrs.get("href"):
+                self._write("[")
+        elif tag == "img":
+            alt = attrs.get("alt") or ""
+            if attrs.get("src") and not attrs["src"].startswith("data:"):
+                self._write(f"![{alt}]({attrs['src']})")
+            elif alt:
+                self._write(alt)
+        elif tag in ("ul", "ol"):
+            self._flush()
+            if not self.lists:
+                self.list_group += 1
+            self.lists.append({"ordered": tag == "ol", "count": int(attrs.get("start") or 1) - 1})
+        elif tag == "li":
+            self._flush()
+            indent = "   " * max(len(self.lists) - 1, 0)
+            if self.lists and self.lists[-1]["ordered"]:
+                self.lists[-1]["count"] += 1
+                marker = f"{self.lists[-1]['count']}. "
+            else:
+                marker = "- "
+            self._write(marker)
+            self.item_indent = indent
+        elif tag == "blockquote":
+            self._flush()
+            self.quote_depth += 1
+        elif tag == "table":
+            self._flush()
+            self.table = {"rows": [], "row": None, "cell": None}
+        elif self.table is not None:
+            if tag == "tr":
+                self.table["row"] = []
+            elif tag in ("td", "th"):
+                self.table["cell"] = []
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+            return
+        if self.skip_depth:
+            return
+        if tag in HEADING_TAGS or tag in BLOCK_TAGS:
+            self._flush()
+        elif tag in ("strong", "b"):
+            self._write("**")
+        elif tag in ("em", "i"):
+            self._write("*")
+        elif tag in ("del", "s", "strike"):
+            self._write("~~")
+        elif tag == "code" and not self.pre_depth:
+            self._write("`")
+        elif tag == "pre" and self.pre_depth:
+            text = "".join(self.current)
+            self.current = [text if text.endswith("\n") else text + "\n", "```"]
+            self._flush()
+            self.pre_depth -= 1
+        elif tag == "a" and self.links:
+            href = self.links.pop()
+            if href:
+                self._write(f"]({href})")
+        elif tag in ("ul", "ol") and self.lists:
+            self._flush()
+            self.lists.pop()
+        elif tag == "li":
+            self._flush()
+        elif tag == "blockquote" and self.quote_depth:
+            self._flush()
+            self.quote_depth -= 1
+        elif self.table is not None:
+            if tag in ("td", "th") and self.table["cell"] is not None:
+                self.table["row"].append(_escape_cell(re.sub(r"\s+", " ", "".join(self.table["cell"]))))
+                self.table["cell"] = None
+            elif tag == "tr" and self.table["row"] is not None:
+                self.table["rows"].append(self.table["row"])
+                self.table["row"] = None
+            elif tag == "table":
+                self._finish_table()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        self._write(data)
+
+    def _finish_table(self):
+        rows = [row for row in self.table["rows"] if any(row)]
+        self.table = None
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * width]
+        lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+        self.blocks.append(("\n".join(self._prefix() + line for line in lines), "block"))
+
+    def markdown(self):
+        if self.table is not None:
+            self._finish_table()
+        self._flush()
+        if not self.blocks:
+            return ""
+        # List items stay on consecutive lines; everything else is a paragraph
+        parts = [self.blocks[0][0]]
+        for (_, previous), (text, kind) in zip(self.blocks, self.blocks[1:]):
+            parts.append("\n" if previous == kind != "block" else "\n\n")
+            parts.append(text)
+        return "".join(parts) + "\n"
+
+
+def html_to_markdown(html):
+    """Convert an HTML fragment to markdown (headings, emphasis, links, lists, code, quotes and tables)."""
+    builder = _MarkdownBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.markdown()
+
+
+def parse_clipboard_info(info):
+    """Return the clipboard classes listed in the output of AppleScript's "clipboard info"."""
+    # e.g. "«class HTML», 1234, «class utf8», 56, «class PNGf», 9876"
+    parts = [part.strip() for part in info.strip().split(",")]
+    return [part for part in parts if part and not part.isdigit()]
+
+
+def decode_applescript_data(output):
+    """Decode AppleScript's «data XXXX<hex>» into bytes, or None if it is not in that form."""
+    match = re.match(r"\s*«data \S{4}([0-9A-Fa-f]*)»\s*$", output)
+    if not match:
+        return None
+    return bytes.fromhex(match.group(1))
+
+
+def _run(command, input_bytes=None):
+    """Run a clipboard helper and return its stdout bytes, or None if it failed."""
+    try:
+        result = subprocess.run(command, input=input_bytes, capture_output=True,
+                                timeout=CLIPBOARD_TIMEOUT, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def clipboard_types():
+    """The classes currently on the macOS clipboard, or None when they cannot be read."""
+    output = _run(["osascript", "-e", "clipboard info"])
+    if output is None:
+        return None
+    return parse_clipboard_info(output.decode("utf-8", errors="replace"))
+
+
+def _clipboard_html():
+    output = _run(["osascript", "-e", f"the clipboard as {HTML_CLASS}"])
+    data = decode_applescript_data(output.decode("utf-8", errors="replace")) if output else None
+    return data.decode("utf-8", errors="replace") if data else None
+
+
+def _clipboard_rtf_as_html():
+    rtf = _run(["pbpaste", "-Prefer", "rtf"])
+    if not rtf:
+        return None
+    html = _run(["textutil", "-convert", "html", "-stdin", "-stdout", "-format", "rtf"], rtf)
+    return html.decode("utf-8", errors="replace") if html else None
+
+
+def get_text_from_clipboard():
+    """
+    Return (kind, markdown) for text on the clipboard, or None to use the image.
+
+    HTML and RTF are converted to markdown. Plain text is only used when
+    there is no image next to it: a copied file or picture also carries a
+    text name, which must not replace the picture.
+    """
+    types = clipboard_types()
+    if not types:
+        return None
+    has_image = any(t in IMAGE_CLASSES for t in types)
+    if HTML_CLASS in types:
+        html = _clipboard_html()
+        markdown = html_to_markdown(html) if html else ""
+        if markdown.strip():
+            return "html", markdown
+    if RTF_CLASS in types:
+        html = _clipboard_rtf_as_html()
+        markdown = html_to_markdown(html) if html else ""
+        if markdown.strip():
+            return "rtf", markdown
+    if not has_image and any(t in TEXT_CLASSES for t in types):
+        text = _run(["pbpaste"])
+        text = text.decode("utf-8", errors="replace") if text else ""
+        if text.strip():
+            return "text", text
+    return None
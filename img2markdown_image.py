@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Local image analysis helpers for img2markdown.
+
+Everything in here runs on the local machine with Pillow, before any API call.
+"""
+import hashlib
+import io
+import os
+import time
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+# Images are downscaled to this size before computing statistics
+TRIAGE_MAX_SIZE = 512
+
+# Default triage thresholds (override with "triage_thresholds" in config.json)
+DEFAULT_TRIAGE_THRESHOLDS = {
+    # Below this grayscale standard deviation the image is a flat colour
+    "empty_stddev": 2.0,
+    # Below this grayscale entropy (bits) there is nothing to read
+    "empty_entropy": 0.5,
+    # An image is only empty if it also has fewer edge pixels than this
+    "empty_max_edge_pixels": 16,
+    # Gradient magnitude a pixel needs to count as an edge
+    "edge_level": 40,
+    # Fraction of edge pixels below which the image has no text-like structure
+    "min_edge_density": 0.001,
+    # Entropy (bits) above which the image looks like a photo rather than text
+    "photo_entropy": 7.2,
+}
+
+TRIAGE_LABELS = ("empty", "textless", "text")
+
+# Images are downscaled to this width before counting text lines
+COMPLEXITY_MAX_WIDTH = 1024
+
+# Limits for an image to count as "simple" (override with "complexity_thresholds" in config.json)
+DEFAULT_COMPLEXITY_THRESHOLDS = {
+    # Detected text lines
+    "max_lines": 6,
+    # Fraction of edge pixels; dense tables and code are well above this
+    "max_edge_density": 0.06,
+    # Image size in megapixels
+    "max_megapixels": 2.0,
+}
+
+# Gray levels a pixel may differ from the background and still count as blank
+BAND_TOLERANCE = 24
+# Blank rows needed to cut between bands; the median text line height is used if larger
+BAND_MIN_GAP = 12
+# Background rows kept above and below each band so no glyph is clipped
+BAND_MARGIN = 8
+# At most this many bands per image; beyond it only the tallest gaps are cut
+MAX_BANDS = 32
+
+# Formats the vision API accepts as they are, with their MIME types
+UPLOAD_MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# Quality range searched when re-encoding to meet a byte budget. Below the
+# floor small text starts to smear, so it is never used.
+DEFAULT_MIN_QUALITY = 50
+MAX_QUALITY = 95
+# Largest width or height each lossy format can encode
+MAX_DIMENSIONS = {"webp": 16383, "jpeg": 65535}
+
+
+def triage_image(image_bytes, thresholds=None):
+    """
+    Classify an image as "empty", "textless" or "text" using cheap statistics.
+
+    Returns a dict with the label and the measured variance, entropy and
+    edge density, or None if the bytes cannot be decoded by Pillow.
+    """
+    limits = dict(DEFAULT_TRIAGE_THRESHOLDS)
+    if thresholds:
+        limits.update(thresholds)
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.thumbnail((TRIAGE_MAX_SIZE, TRIAGE_MAX_SIZE))
+        gray = image.convert("L")
+    except Exception:
+        return None
+
+    variance = ImageStat.Stat(gray).var[0]
+    entropy = max(0.0, gray.entropy())
+    # FIND_EDGES marks the one pixel border, so leave it out of the count
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    if edges.width > 2 and edges.height > 2:
+        edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+    histogram = edges.histogram()
+    edge_pixels = sum(histogram[int(limits["edge_level"]):])
+    edge_density = edge_pixels / max(1, edges.width * edges.height)
+
+    # A line of text on a large white canvas has very low variance and
+    # entropy too, so only call it empty if there are no edges either
+    flat = variance ** 0.5 < limits["empty_stddev"] or entropy < limits["empty_entropy"]
+    if flat and edge_pixels < limits["empty_max_edge_pixels"]:
+        label = "empty"
+    elif edge_density < limits["min_edge_density"] or entropy > limits["photo_entropy"]:
+        label = "textless"
+    else:
+        label = "text"
+
+    return {
+        "label": label,
+        "variance": round(variance, 2),
+        "entropy": round(entropy, 3),
+        "edge_density": round(edge_density, 5),
+    }
+
+
+def benchmark_triage(fixture_dir, thresholds=None):
+    """
+    Run triage over every image below fixture_dir and print the results.
+
+    If the images are sorted into sub-directories named after the expected
+    label (empty/, textless/, text/), the accuracy is reported as well.
+    """
+    rows = []
+    for root, _, files in os.walk(fixture_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            expected = os.path.basename(root)
+            if expected not in TRIAGE_LABELS:
+                expected = None
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            start = time.perf_counter()
+            result = triage_image(data, thresholds)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if result is None:
+                continue
+            rows.append((path, expected, result, elapsed_ms))
+
+    if not rows:
+        print(f"No images found in {fixture_dir}")
+        return []
+
+    print(f"{'label':<9} {'expected':<9} {'variance':>10} {'entropy':>8} {'edges':>8} {'ms':>7}  path")
+    for path, expected, result, elapsed_ms in rows:
+        print(
+            f"{result['label']:<9} {expected or '-':<9} {result['variance']:>10.1f} "
+            f"{result['entropy']:>8.3f} {result['edge_density']:>8.4f} {elapsed_ms:>7.1f}  {path}"
+        )
+
+    labelled = [row for row in rows if row[1]]
+    if labelled:
+        correct = sum(1 for _, expected, result, _ in labelled if result["label"] == expected)
+        print(f"\nAccuracy: {correct}/{len(labelled)} ({100.0 * correct / len(labelled):.1f}%)")
+    mean_ms = sum(row[3] for row in rows) / len(rows)
+    print(f"Mean triage time: {mean_ms:.1f} ms over {len(rows)} images")
+    return rows
+
+
+def measure_complexity(image_bytes, edge_level=DEFAULT_TRIAGE_THRESHOLDS["edge_level"]):
+    """
+    Measure how much text an image holds: its size, edge density and number of text lines.
+
+    Lines are counted as runs of rows that contain edge pixels, separated
+    by blank rows. Returns a dict, or None if Pillow cannot decode the bytes.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        image.thumbnail((COMPLEXITY_MAX_WIDTH, COMPLEXITY_MAX_WIDTH * 8))
+        gray = image.convert("L")
+    except Exception:
+        return None
+
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    if edges.width > 2 and edges.height > 2:
+        edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+    mask = edges.point(lambda v: 255 if v >= edge_level else 0)
+    edge_density = ImageStat.Stat(mask).mean[0] / 255
+    # Averaging each row down to one pixel gives the fraction of edge pixels per row
+    row_fractions = [v / 255 for v in mask.resize((1, mask.height), Image.BOX).tobytes()]
+    min_fraction = 2 / max(1, mask.width)
+    lines = 0
+    in_line = False
+    for fraction in row_fractions:
+        inked = fraction >= min_fraction
+        if inked and not in_line:
+            lines += 1
+        in_line = inked
+
+    return {
+        "width": width,
+        "height": height,
+        "megapixels": round(width * height / 1e6, 3),
+        "edge_density": round(edge_density, 5),
+        "text_lines": lines,
+    }
+
+
+def classify_complexity(complexity, thresholds=None):
+    """Return "simple" if every measurement is within the thresholds, else "complex"."""
+    limits = dict(DEFAULT_COMPLEXITY_THRESHOLDS)
+    if thresholds:
+        limits.update(thresholds)
+    if complexity is None:
+        return "complex"
+    simple = (
+        complexity["text_lines"] <= limits["max_lines"]
+        and complexity["edge_density"] <= limits["max_edge_density"]
+        and complexity["megapixels"] <= limits["max_megapixels"]
+    )
+    return "simple" if simple else "complex"
+
+
+def _row_ink(mask):
+    """The maximum of every row of an "L" mask, as bytes, by halving the width with lighter()."""
+    width = 1
+    while width < mask.width:
+        width *= 2
+    column = Image.new("L", (width, mask.height), 0)
+    column.paste(mask, (0, 0))
+    while column.width > 1:
+        half = column.width // 2
+        column = ImageChops.lighter(column.crop((0, 0, half, column.height)),
+                                    column.crop((half, 0, column.width, column.height)))
+    return column.tobytes()
+
+
+def _runs(flags):
+    """Return (start, end) of every run of true values."""
+    runs = []
+    start = None
+    for i, flag in enumerate(flags):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(flags)))
+    return runs
+
+
+def split_bands(image_bytes, min_gap=BAND_MIN_GAP, max_bands=MAX_BANDS,
+                margin=BAND_MARGIN, tolerance=BAND_TOLERANCE):
+    """
+    Split an image into horizontal bands along runs of blank rows.
+
+    A cut needs at least min_gap blank rows and at least the median text
+    line height, so paragraphs are separated but their lines are not. Each
+    band is a dict with its "top" and "bottom" row, a "hash" of its pixels
+    (blank rows excluded, so a band that only moved keeps its hash) and
+    "png" bytes with up to margin rows of background around it. Returns an
+    empty list for a blank image and None if Pillow cannot decode it.
+    """
+    try:
+        image = _flatten(Image.open(io.BytesIO(image_bytes)))
+    except Exception:
+        return None
+
+    gray = image.convert("L")
+    histogram = gray.histogram()
+    background = histogram.index(max(histogram))
+    difference = ImageChops.difference(gray, Image.new("L", gray.size, background))
+    mask = difference.point(lambda v: 255 if v > tolerance else 0)
+    lines = _runs([value > 0 for value in _row_ink(mask)])
+    if not lines:
+        return []
+
+    heights = sorted(end - start for start, end in lines)
+    needed = max(min_gap, heights[len(heights) // 2])
+    cuts = [(lines[i][1], lines[i + 1][0]) for i in range(len(lines) - 1)
+            if lines[i + 1][0] - lines[i][1] >= needed]
+    if len(cuts) > max_bands - 1:
+        cuts = sorted(sorted(cuts, key=lambda gap: gap[0] - gap[1])[:max_bands - 1])
+
+    edges = [lines[0][0]] + [row for gap in cuts for row in gap] + [lines[-1][1]]
+    spans = list(zip(edges[::2], edges[1::2]))
+    bands = []
+    for i, (top, bottom) in enumerate(spans):
+        # The margin never reaches past the middle of the gap to a neighbour
+        above = top if i == 0 else (top - spans[i - 1][1]) // 2
+        below = image.height - bottom if i == len(spans) - 1 else (spans[i + 1][0] - bottom) // 2
+        content = image.crop((0, top, image.width, bottom))
+        digest = hashlib.sha256(f"{content.width}x{content.height}:".encode("ascii"))
+        digest.update(content.tobytes())
+        padded = image.crop((0, top - min(margin, above), image.width, bottom + min(margin, below)))
+        bands.append({"top": top, "bottom": bottom, "hash": digest.hexdigest(), "png": _encode(padded, "png")})
+    return bands
+
+
+def sniff_format(image_bytes):
+    """Detect the image format from its magic bytes, or return None."""
+    head = image_bytes[:16]
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1", b"avif"):
+        return "heif"
+    return None
+
+
+def _flatten(image):
+    """Return an RGB copy of the first frame, with any transparency put on white."""
+    image.seek(0)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _encode(image, fmt, quality=None):
+    buffer = io.BytesIO()
+    if fmt == "png":
+        image.save(buffer, "PNG", optimize=True)
+    elif fmt == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _fit_quality(image, fmt, target_bytes, min_quality):
+    """Return (bytes, quality) at the highest quality that fits target_bytes, or at min_quality."""
+    # Binary search for the highest quality that fits the budget
+    low, high = min_quality, MAX_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = _encode(image, fmt, quality)
+        if len(candidate) <= target_bytes:
+            best = (candidate, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        # Nothing fits: use the legibility floor, it is as small as we go
+        best = (_encode(image, fmt, min_quality), min_quality)
+    return best
+
+
+def prepare_upload(image_bytes, target_bytes=None, upload_format="webp",
+                   min_quality=DEFAULT_MIN_QUALITY):
+    """
+    Return (bytes, mime_type, info) ready to send to the vision API.
+
+    Formats the API accepts are passed through with their real MIME type.
+    Anything else (BMP, TIFF, HEIF, animated GIF) is transcoded to PNG. With
+    target_bytes set, images over the budget are re-encoded as WebP or JPEG
+    at the highest quality that fits, but never below min_quality. Images
+    too large for WebP (e.g. tall scrolling screenshots) use JPEG; if that
+    fails too, the image is uploaded as it is.
+    """
+    fmt = sniff_format(image_bytes)
+    info = {"format": fmt, "original_bytes": len(image_bytes), "quality": None}
+    image = None
+    needs_transcode = fmt not in UPLOAD_MIME_TYPES
+    if fmt == "gif":
+        try:
+            image = Image.open(io.BytesIO(image_bytes))
+            needs_transcode = getattr(image, "n_frames", 1) > 1
+        except Exception:
+            pass
+
+    over_budget = target_bytes is not None and len(image_bytes) > target_bytes
+    if not needs_transcode and not over_budget:
+        info["upload_bytes"] = len(image_bytes)
+        return image_bytes, UPLOAD_MIME_TYPES[fmt], info
+
+    try:
+        image = image or Image.open(io.BytesIO(image_bytes))
+        flat = _flatten(image)
+    except Exception:
+        # Leave it to the API to complain about something Pillow cannot read
+        info["upload_bytes"] = len(image_bytes)
+        return image_bytes, UPLOAD_MIME_TYPES.get(fmt, "image/png"), info
+
+    if needs_transcode:
+        image_bytes, fmt = _encode(flat, "png"), "png"
+        info["transcoded"] = True
+
+    if upload_format == "webp" and max(flat.size) > MAX_DIMENSIONS["webp"]:
+        upload_format = "jpeg"
+    if (target_bytes is not None and len(image_bytes) > target_bytes
+            and max(flat.size) <= MAX_DIMENSIONS[upload_format]):
+        try:
+            best = _fit_quality(flat, upload_format, target_bytes, min_quality)
+        except (OSError, ValueError):
+            # The encoder gave up; the image still goes out, just larger
+            best = None
+        if best is not None and len(best[0]) < len(image_bytes):
+            image_bytes, fmt = best[0], upload_format
+            info["quality"] = best[1]
+
+    info["upload_bytes"] = len(image_bytes)
+    return image_bytes, UPLOAD_MIME_TYPES[fmt], info
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Structured, buffered logging for img2markdown.
+
+Records are JSON lines. Callers only put records on an in-memory queue; a
+background thread formats them and writes them to a size-rotated file, so
+logging never waits on disk I/O. Configure with setup_logging() or with the
+IMG2MARKDOWN_LOG_LEVEL, IMG2MARKDOWN_LOG_SAMPLE and IMG2MARKDOWN_LOG_FILE
+environment variables.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+LOGGER_NAME = "img2markdown"
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".img2markdown_logs")
+DEFAULT_LOG_FILE = os.path.join(DEFAULT_LOG_DIR, "img2markdown.log")
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+
+logger = logging.getLogger(LOGGER_NAME)
+# Library users see nothing unless they configure logging themselves
+logger.addHandler(logging.NullHandler())
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records; everything above DEBUG always passes."""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+def setup_logging(path=None, level=None, sample_rate=None,
+                  max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+    """
+    Route the img2markdown logger through a queue to a rotating JSON-lines file.
+
+    Calling it again replaces the previous configuration. Returns the logger.
+    """
+    global _listener
+    path = path or os.getenv("IMG2MARKDOWN_LOG_FILE") or DEFAULT_LOG_FILE
+    level = (level or os.getenv("IMG2MARKDOWN_LOG_LEVEL") or "INFO").upper()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("IMG2MARKDOWN_LOG_SAMPLE", "1.0"))
+
+    stop_logging()
+    logger.handlers.clear()
+    logger.propagate = False
+    if level == "OFF":
+        logger.setLevel(logging.CRITICAL + 1)
+        return logger
+    logger.setLevel(level)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Sampling happens before the record is queued so dropped records cost nothing
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    return logger
+
+
+def stop_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log a named event with structured fields."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Line-delimited JSON streaming mode for shell pipelines and other services.
+
+    {"id": "a", "path": "scans/page1.png"}
+    {"id": "b", "base64": "iVBORw0KGgo...", "options": {"deadline": 20, "priority": "interactive"}}
+
+Every line on stdin names one image, as a file path or as base64 bytes,
+with an optional id and options (deadline, priority, tiles), either nested
+under "options" or at the top level. Up to `window` images are converted at
+once; reading stops while the window is full. One JSON line is written to
+stdout per input as soon as it finishes, so results can come back out of
+order and are matched up by id. The process keeps running until stdin is
+closed and every result has been written.
+"""
+import base64
+import binascii
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from img2markdown_image import triage_image
+from img2markdown_log import log_event
+from img2markdown_scheduler import BULK, PRIORITIES, PriorityScheduler
+
+REQUEST_OPTIONS = ("deadline", "priority", "tiles")
+
+
+class RequestError(ValueError):
+    """Raised for an input line that does not describe an image."""
+
+    def __init__(self, message, request_id=None):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+def parse_request(line):
+    """
+    Parse one input line into (id, image bytes, options).
+
+    Raises RequestError with a message suitable for the result line.
+    """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        raise RequestError(f"invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise RequestError("each line must be a JSON object")
+    request_id = request.get("id")
+    if not isinstance(request.get("options") or {}, dict):
+        raise RequestError('"options" must be a JSON object', request_id)
+    options = dict(request.get("options") or {})
+    options.update((key, request[key]) for key in REQUEST_OPTIONS if key in request)
+    unknown = set(options) - set(REQUEST_OPTIONS)
+    if unknown:
+        raise RequestError(f"unknown options: {', '.join(sorted(unknown))}", request_id)
+    if options.get("priority", BULK) not in PRIORITIES:
+        raise RequestError(f"priority must be one of {', '.join(PRIORITIES)}", request_id)
+
+    if request.get("base64"):
+        try:
+            image_bytes = base64.b64decode(request["base64"], validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise RequestError(f"invalid base64: {e}", request_id)
+    elif request.get("path"):
+        try:
+            with open(request["path"], 'rb') as f:
+                image_bytes = f.read()
+        except OSError as e:
+            raise RequestError(f"cannot read {request['path']}: {e.strerror or e}", request_id)
+    else:
+        raise RequestError('a line needs "path" or "base64"', request_id)
+    return request_id, image_bytes, options
+
+
+class NdjsonStream:
+    """
+    Convert the images named on an input stream, writing a JSON result line for each.
+
+    A PriorityScheduler sized to the window is attached to the converter
+    unless it has one, so lines marked interactive overtake bulk ones.
+    """
+
+    def __init__(self, converter, output=None, window=4, tiles=False, triage=True, triage_thresholds=None):
+        self.converter = converter
+        if converter.scheduler is None:
+            converter.scheduler = PriorityScheduler(window, reserved_interactive=1 if window > 1 else 0)
+        self.output = output or sys.stdout
+        self.window = window
+        self.tiles = tiles
+        self.triage = triage
+        self.triage_thresholds = triage_thresholds
+        self.counts = {"converted": 0, "empty": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def write(self, record, outcome):
+        """Write one result line; lines from different threads never interleave."""
+        with self._lock:
+            self.counts[outcome] += 1
+            self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.output.flush()
+
+    def handle(self, number, line, received):
+        """Convert the image on one input line and write its result."""
+        try:
+            request_id, image_bytes, options = parse_request(line)
+        except RequestError as e:
+            self.write({"id": e.request_id, "line": number, "ok": False, "error": str(e)}, "failed")
+            return
+        record = {"id": request_id, "line": number}
+        if self.triage:
+            triage = triage_image(image_bytes, self.triage_thresholds)
+            if triage is not None and triage["label"] == "empty":
+                record.update(ok=False, skipped="empty", error="The image appears to be empty",
+                              latency=round(time.perf_counter() - received, 3))
+                self.write(record, "empty")
+                return
+        deadline = options.get("deadline")
+        priority = options.get("priority", BULK)
+        try:
+            if options.get("tiles", self.tiles):
+                result = self.converter.convert_tiled(image_bytes, deadline=deadline, priority=priority)
+            else:
+                result = self.converter.convert(image_bytes, deadline=deadline, priority=priority)
+        except Exception as e:
+            record.update(ok=False, error=str(e), latency=round(time.perf_counter() - received, 3))
+            self.write(record, "failed")
+            log_event("ndjson.failed", id=request_id, error=str(e))
+            return
+        self.converter.remember(result, source=f"ndjson:{request_id}" if request_id is not None else "ndjson")
+        record.update(
+            ok=True,
+            markdown=result.markdown,
+            model=result.model,
+            latency=round(time.perf_counter() - received, 3),
+            usage=result.usage,
+            truncated=result.truncated,
+        )
+        if result.route:
+            record["route"] = result.route
+        if result.tiles:
+            record["tiles"] = result.tiles
+        self.write(record, "converted")
+
+    def run(self, stream=None):
+        """Process lines until the stream is closed; returns the counts."""
+        stream = stream or sys.stdin
+        slots = threading.BoundedSemaphore(self.window)
+        start = time.perf_counter()
+
+        def work(number, line, received):
+            try:
+                self.handle(number, line, received)
+            except Exception as e:
+                # Every input gets its line, even when something unexpected breaks
+                self.write({"id": None, "line": number, "ok": False, "error": f"{type(e).__name__}: {e}"},
+                           "failed")
+            finally:
+                slots.release()
+
+        log_event("ndjson.start", window=self.window)
+        with ThreadPoolExecutor(max_workers=self.window, thread_name_prefix="ndjson") as pool:
+            # readline() rather than iterating, so each line is handled as soon as it arrives
+            for number, line in enumerate(iter(stream.readline, ""), start=1):
+                if not line.strip():
+                    continue
+                # Stop reading while the window is full: that is the back pressure
+                slots.acquire()
+                pool.submit(work, number, line, time.perf_counter())
+        log_event("ndjson.done", elapsed=round(time.perf_counter() - start, 3), **self.counts)
+        return self.counts
+
+
+def serve_ndjson(converter, window=4, tiles=False, triage=True, triage_thresholds=None):
+    """Run the streaming mode on stdin and stdout; the summary goes to stderr."""
+    stream = NdjsonStream(converter, window=window, tiles=tiles, triage=triage,
+                          triage_thresholds=triage_thresholds)
+    try:
+        counts = stream.run()
+    except KeyboardInterrupt:
+        counts = stream.counts
+    print(f"Converted {counts['converted']}, empty {counts['empty']}, failed {counts['failed']}",
+          file=sys.stderr)
+    return counts
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Two-stage pipeline for bulk conversions.
+
+Decoding, triage, transcoding and base64 encoding are CPU work that holds
+the GIL, so in a thread pool they starve the threads doing network I/O. Here
+they run in a process pool sized to the CPU cores, and the prepared payloads
+are fed through a bounded queue to an asyncio network stage. Image bytes go
+to the worker processes, and payloads come back, through shared memory
+blocks instead of being pickled.
+"""
+import asyncio
+import base64
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from img2markdown_image import prepare_upload, triage_image
+
+_END = object()
+
+
+def default_processes():
+    return os.cpu_count() or 1
+
+
+def share_bytes(data):
+    """Copy data into a new shared memory block; returns (name, size). The receiver unlinks it."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    name = block.name
+    block.close()
+    return name, len(data)
+
+
+def unlink_shared(name):
+    """Free a shared memory block without reading it."""
+    block = shared_memory.SharedMemory(name=name)
+    block.close()
+    block.unlink()
+
+
+def take_bytes(name, size, unlink=True):
+    """Read size bytes from a shared memory block, unlinking it by default."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def prepare_in_worker(source, target_bytes=None, upload_format="webp", triage=False, triage_thresholds=None):
+    """
+    Prepare one image in a worker process.
+
+    source is a file path or a (name, size) shared memory block holding the
+    image bytes. Returns a dict with the shared memory block of the base64
+    payload and its MIME type, the triage label when triage is on, or the
+    error message.
+    """
+    try:
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                image_bytes = f.read()
+        else:
+            image_bytes = take_bytes(*source, unlink=False)
+        label = None
+        if triage:
+            result = triage_image(image_bytes, triage_thresholds)
+            label = result["label"] if result else None
+            if label == "empty":
+                return {"triage": label}
+        upload_bytes, mime_type, info = prepare_upload(image_bytes, target_bytes, upload_format)
+        name, size = share_bytes(base64.b64encode(upload_bytes))
+        return {"payload": (name, size), "mime_type": mime_type, "triage": label, "info": info}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+async def run_pipeline(images, convert, emit, processes=None, concurrency=4, queue_size=None,
+                       prepare_options=None, stop=None):
+    """
+    Prepare images in a process pool and convert them concurrently.
+
+    images yields file paths or image bytes; it is advanced in a thread so
+    reading it never blocks the event loop. `await convert(index, prepared)`
+    receives the worker's dict with the payload replaced by the base64 text
+    and its return value is passed to emit(). At most 2 * processes images
+    are being prepared and queue_size prepared payloads wait for the network
+    stage, so memory stays bounded however long the run is.
+    """
+    loop = asyncio.get_running_loop()
+    processes = processes or default_processes()
+    ready = asyncio.Queue(maxsize=queue_size or 2 * concurrency)
+    preparing = asyncio.Semaphore(2 * processes)
+    iterator = iter(images)
+    options = prepare_options or {}
+
+    # Spawned rather than forked workers: the pipeline runs beside other threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+
+        async def prepare(index, image):
+            shared = None
+            try:
+                source = image
+                if not isinstance(image, str):
+                    shared = source = share_bytes(image)
+                prepared = await loop.run_in_executor(
+                    pool, prepare_in_worker, source,
+                    options.get("target_bytes"), options.get("upload_format", "webp"),
+                    options.get("triage", False), options.get("triage_thresholds"),
+                )
+                if "payload" in prepared:
+                    prepared["base64"] = take_bytes(*prepared.pop("payload")).decode("ascii")
+                # Hold the slot until the network stage has room, which is the back pressure
+                await ready.put((index, prepared))
+            finally:
+                if shared is not None:
+                    unlink_shared(shared[0])
+                preparing.release()
+
+        async def produce():
+            pending = set()
+            index = 0
+            try:
+                while stop is None or not stop.is_set():
+                    image = await asyncio.to_thread(next, iterator, _END)
+                    if image is _END:
+                        break
+                    await preparing.acquire()
+                    task = asyncio.ensure_future(prepare(index, image))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    index += 1
+                await asyncio.gather(*pending)
+            finally:
+                for _ in range(concurrency):
+                    await ready.put(None)
+
+        async def consume():
+            while True:
+                item = await ready.get()
+                if item is None:
+                    return
+                emit(await convert(*item))
+
+        await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+
+
+def iterate_pipeline(images, convert, **kwargs):
+    """Run run_pipeline() on its own event loop thread and yield what it emits."""
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            asyncio.run(run_pipeline(images, convert, results.put, stop=stop, **kwargs))
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(_END)
+
+    thread = threading.Thread(target=run, name="pipeline", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Stops reading new images if the caller stops early
+        stop.set()
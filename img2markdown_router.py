@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Latency-aware routing across several OpenAI-compatible endpoints.
+
+Endpoints are listed under "endpoints" in config.json:
+
+    "endpoints": [
+        {"name": "openai", "base_url": "https://api.openai.com/v1",
+         "api_key_env": "OPENAI_API_KEY", "models": ["gpt-4o", "gpt-4-turbo"]},
+        {"name": "local", "base_url": "http://localhost:8000/v1",
+         "api_key": "unused", "models": ["llava"]}
+    ]
+
+Each request goes to the healthy endpoint with the best score, an EWMA of
+observed latency inflated by the EWMA error rate, and fails over to the
+next one. Endpoints that keep failing are benched for a cool-down period.
+The statistics are persisted so routing survives between runs.
+
+Separately, a ComplexityRouter picks the model: images that look simple
+(few text lines, little detail) go to a cheaper, faster model first and
+are escalated to the full model chain if its output fails quality checks.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from openai import OpenAI
+
+from img2markdown_image import classify_complexity, measure_complexity
+from img2markdown_log import log_event
+
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.3
+# Assumed latency (seconds) of an endpoint that has not answered yet
+LATENCY_PRIOR = 1.0
+# How strongly the error rate inflates the latency score
+ERROR_PENALTY = 4.0
+# Consecutive failures after which an endpoint is benched, and for how long
+MAX_CONSECUTIVE_FAILURES = 3
+COOL_DOWN_SECONDS = 30.0
+
+# Openings of answers where the model declined instead of transcribing
+REFUSAL_PREFIXES = ("i'm sorry", "i am sorry", "sorry,", "i can't", "i cannot", "i'm unable", "i am unable")
+
+# Outcomes counted by the ComplexityRouter
+ROUTE_OUTCOMES = ("complex", "cheap", "escalated")
+
+DEFAULT_STATS_PATH = os.path.join(os.path.expanduser("~"), ".cache", "img2markdown", "endpoints.json")
+
+
+class Endpoint:
+    """One OpenAI-compatible endpoint with its client and observed statistics."""
+
+    def __init__(self, name, base_url=None, api_key=None, models=None, client=None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.models = list(models or [])
+        self.client = client
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+    def supports(self, model):
+        """An endpoint without a model list accepts any model."""
+        return not self.models or model in self.models
+
+    def sync_client(self):
+        if self.client is None:
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self.client
+
+    def healthy(self, now=None):
+        if self.consecutive_failures < MAX_CONSECUTIVE_FAILURES:
+            return True
+        return (now or time.time()) - self.last_failure > COOL_DOWN_SECONDS
+
+    def score(self):
+        """Lower is better: expected latency, inflated by the error rate."""
+        latency = self.latency if self.latency is not None else LATENCY_PRIOR
+        return latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def stats(self):
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+        }
+
+
+class EndpointRouter:
+    """Order endpoints by score for each request and learn from the outcomes."""
+
+    def __init__(self, endpoints, stats_path=None):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        self.load_stats()
+
+    @classmethod
+    def from_config(cls, entries, stats_path=DEFAULT_STATS_PATH):
+        """Build a router from the "endpoints" list of config.json."""
+        endpoints = []
+        for i, entry in enumerate(entries):
+            api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", "OPENAI_API_KEY"))
+            endpoints.append(Endpoint(
+                name=entry.get("name") or f"endpoint{i + 1}",
+                base_url=entry.get("base_url"),
+                api_key=api_key,
+                models=entry.get("models"),
+            ))
+        return cls(endpoints, stats_path)
+
+    def models(self):
+        """All models offered by the endpoints, in configuration order."""
+        seen = []
+        for endpoint in self.endpoints:
+            seen.extend(m for m in endpoint.models if m not in seen)
+        return seen
+
+    def ranked(self, model):
+        """Endpoints that serve model, healthy ones first, each group best score first."""
+        now = time.time()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.supports(model)]
+            return sorted(candidates, key=lambda e: (not e.healthy(now), e.score()))
+
+    def record(self, endpoint, latency, ok):
+        """Update an endpoint's moving averages after an attempt."""
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.error_rate = (1 - EWMA_ALPHA) * endpoint.error_rate + EWMA_ALPHA * (0.0 if ok else 1.0)
+            if ok:
+                endpoint.consecutive_failures = 0
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency = (1 - EWMA_ALPHA) * endpoint.latency + EWMA_ALPHA * latency
+            else:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                endpoint.last_failure = time.time()
+        log_event("route.result", endpoint=endpoint.name, ok=ok, latency=round(latency, 3),
+                  ewma_latency=endpoint.latency, error_rate=round(endpoint.error_rate, 3))
+
+    def load_stats(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for endpoint in self.endpoints:
+            for key, value in saved.get(endpoint.name, {}).items():
+                if hasattr(endpoint, key):
+                    setattr(endpoint, key, value)
+
+    def save_stats(self):
+        if not self.stats_path:
+            return
+        with self._lock:
+            stats = {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            temp_path = f"{self.stats_path}.tmp{os.getpid()}"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, indent=2)
+            os.replace(temp_path, self.stats_path)
+        except OSError as e:
+            log_event("route.save_failed", error=str(e))
+
+    def close(self):
+        self.save_stats()
+        for endpoint in self.endpoints:
+            if endpoint.client is not None and hasattr(endpoint.client, "close"):
+                endpoint.client.close()
+
+    def describe(self):
+        """Return printable lines with per-endpoint stats and the routing order per model."""
+        now = time.time()
+        lines = ["Endpoints:"]
+        for endpoint in self.endpoints:
+            latency = f"{endpoint.latency * 1000:.0f} ms" if endpoint.latency is not None else "n/a"
+            state = "healthy" if endpoint.healthy(now) else "cooling down"
+            lines.append(
+                f"- {endpoint.name} ({endpoint.base_url or 'default'}): {state}, "
+                f"latency {latency}, error rate {endpoint.error_rate:.0%}, "
+                f"{endpoint.requests} requests, {endpoint.failures} failures"
+            )
+            lines.append(f"    models: {', '.join(endpoint.models) or 'any'}")
+        lines.append("Routing order:")
+        for model in self.models():
+            order = " -> ".join(e.name for e in self.ranked(model))
+            lines.append(f"- {model}: {order}")
+        return lines
+
+
+class ComplexityRouter:
+    """Try a cheap model on simple images, escalating to the full model chain when its output looks wrong."""
+
+    def __init__(self, cheap_model, thresholds=None):
+        self.cheap_model = cheap_model
+        self.thresholds = thresholds
+        self._lock = threading.Lock()
+        self.counts = {outcome: 0 for outcome in ROUTE_OUTCOMES}
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a router from "cheap_model" and "complexity_thresholds" in config.json, or None."""
+        if not config.get("cheap_model"):
+            return None
+        return cls(config["cheap_model"], config.get("complexity_thresholds"))
+
+    def classify(self, image_bytes):
+        """Return ("simple" or "complex", the measurements) for an image."""
+        complexity = measure_complexity(image_bytes)
+        tier = classify_complexity(complexity, self.thresholds)
+        log_event("route.tier", tier=tier, **(complexity or {}))
+        return tier, complexity
+
+    def check(self, result, complexity):
+        """Return why the cheap model's output is not good enough, or None if it passes."""
+        text = (result.text or "").strip()
+        if not text:
+            return "empty output"
+        if result.truncated:
+            return "output truncated"
+        if text.lower().startswith(REFUSAL_PREFIXES):
+            return "model declined"
+        # Every detected text line should have produced at least one word
+        expected = (complexity or {}).get("text_lines", 0)
+        if len(text.split()) < expected:
+            return f"{len(text.split())} words for {expected} text lines"
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if len(lines) >= 4 and max(Counter(lines).values()) > len(lines) / 2:
+            return "repetitive output"
+        return None
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def report(self):
+        """Counts per outcome plus the cheap-model hit rate and escalation rate."""
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        tried = counts["cheap"] + counts["escalated"]
+        return {
+            **counts,
+            "total": total,
+            "hit_rate": counts["cheap"] / total if total else 0.0,
+            "escalation_rate": counts["escalated"] / tried if tried else 0.0,
+        }
+
+    def describe(self):
+        report = self.report()
+        return (
+            f"Model routing: {report['cheap']} of {report['total']} images handled by {self.cheap_model} "
+            f"({report['hit_rate']:.0%}), {report['escalated']} escalated "
+            f"({report['escalation_rate']:.0%} of cheap attempts), {report['complex']} sent to the full model"
+        )
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Priority scheduling of API calls.
+
+A PriorityScheduler hands out a fixed number of concurrent API-call slots.
+Interactive work always goes ahead of queued bulk work, and part of the
+capacity is held back for interactive work only, so a long bulk run can
+never take every slot. Share one scheduler between all converters in a
+process (or in the HTTP service) to give them a common view of the quota.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# Lower rank is served first
+_RANK = {INTERACTIVE: 0, BULK: 1}
+
+# Number of recent waits kept per class for percentiles
+WAIT_SAMPLES = 1000
+
+
+class SchedulerTimeout(Exception):
+    """Raised when no slot became free within the timeout."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "cancelled", "enqueued_at")
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self.enqueued_at = time.perf_counter()
+
+
+class PriorityScheduler:
+    """Grant up to `capacity` concurrent slots, interactive before bulk."""
+
+    def __init__(self, capacity=4, reserved_interactive=1):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        # Slots bulk work may never use; keep at least one for bulk to make progress
+        self.reserved_interactive = min(reserved_interactive, capacity - 1)
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._completed = {priority: 0 for priority in PRIORITIES}
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._total_wait = {priority: 0.0 for priority in PRIORITIES}
+        self._granted = {priority: 0 for priority in PRIORITIES}
+
+    def _can_run(self, priority):
+        running = sum(self._running.values())
+        if priority == INTERACTIVE:
+            return running < self.capacity
+        return running < self.capacity - self.reserved_interactive
+
+    def _dispatch(self):
+        """Grant slots to queued waiters in priority order. Caller holds the lock."""
+        granted_any = False
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if not self._can_run(waiter.priority):
+                # The head is the most urgent waiter; nothing behind it may overtake
+                break
+            heapq.heappop(self._queue)
+            waiter.granted = True
+            self._waiting[waiter.priority] -= 1
+            self._running[waiter.priority] += 1
+            wait = time.perf_counter() - waiter.enqueued_at
+            self._waits[waiter.priority].append(wait)
+            self._total_wait[waiter.priority] += wait
+            self._granted[waiter.priority] += 1
+            granted_any = True
+        if granted_any:
+            self._condition.notify_all()
+
+    def acquire(self, priority=BULK, timeout=None):
+        """Block until a slot is granted; raise SchedulerTimeout after timeout seconds."""
+        if priority not in _RANK:
+            raise ValueError(f"Unknown priority: {priority}")
+        waiter = _Waiter(priority)
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            heapq.heappush(self._queue, (_RANK[priority], next(self._sequence), waiter))
+            self._waiting[priority] += 1
+            self._dispatch()
+            while not waiter.granted:
+                remaining = None if give_up_at is None else give_up_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    waiter.cancelled = True
+                    self._waiting[priority] -= 1
+                    # Removing the head may let someone behind it run
+                    self._dispatch()
+                    raise SchedulerTimeout(f"No {priority} slot free within {timeout:g}s")
+                self._condition.wait(remaining)
+
+    def release(self, priority=BULK):
+        with self._condition:
+            self._running[priority] -= 1
+            self._completed[priority] += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority=BULK, timeout=None):
+        """Context manager holding a slot for the duration of the block."""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        """Per-class running, waiting and completed counts and queue wait times (seconds)."""
+        with self._condition:
+            result = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                granted = self._granted[priority]
+                result[priority] = {
+                    "running": self._running[priority],
+                    "waiting": self._waiting[priority],
+                    "completed": self._completed[priority],
+                    "mean_wait": self._total_wait[priority] / granted if granted else 0.0,
+                    "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "max_wait": waits[-1] if waits else 0.0,
+                }
+            return result
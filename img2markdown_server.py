@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Local HTTP conversion service.
+
+    POST /convert   raw image body, or multipart/form-data with an image file
+    GET  /healthz   liveness and queue state
+    GET  /metrics   Prometheus text format counters and latency histograms
+
+Conversions run on a bounded worker pool that shares one Converter (and so
+one pooled upstream client). When every worker is busy and the queue is
+full, new requests are rejected with 503 instead of piling up. Requests
+with "X-Priority: bulk" queue behind interactive ones (the default).
+"""
+import email.parser
+import email.policy
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from img2markdown import DeadlineExceeded, Img2MarkdownError
+from img2markdown_log import log_event
+from img2markdown_scheduler import INTERACTIVE, PRIORITIES, PriorityScheduler
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+MAX_BODY_BYTES = 50 * 1024 * 1024
+# Request paths counted under their own label; anything else counts as "other"
+KNOWN_PATHS = ("/convert", "/healthz", "/metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class ServiceBusy(Img2MarkdownError):
+    """Raised when the worker pool and its queue are full."""
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(
+                key, {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            )
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({key[0] for key in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (key_name, labels), value in sorted(self._counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{label_text(labels)} {value}")
+            for name in sorted({key[0] for key in self._gauges}):
+                lines.append(f"# TYPE {name} gauge")
+                for (key_name, labels), value in sorted(self._gauges.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{label_text(labels)} {value}")
+            for name in sorted({key[0] for key in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (key_name, labels), histogram in sorted(self._histograms.items()):
+                    if key_name != name:
+                        continue
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                        lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram['sum']:.6f}")
+                    lines.append(f"{name}_count{label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class ConversionService:
+    """
+    A Converter behind a bounded worker pool with admission control.
+
+    Every admitted request gets a thread straight away; a PriorityScheduler
+    shared with the converter then decides which of them may call the API,
+    so interactive requests overtake queued bulk ones.
+    """
+
+    def __init__(self, converter, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.converter = converter
+        self.workers = workers
+        self.queue_size = queue_size
+        self.metrics = Metrics()
+        if converter.scheduler is None:
+            converter.scheduler = PriorityScheduler(workers, reserved_interactive=1 if workers > 1 else 0)
+        self.scheduler = converter.scheduler
+        self._pool = ThreadPoolExecutor(max_workers=workers + queue_size, thread_name_prefix="convert")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._admitted = 0
+
+    def state(self):
+        stats = self.scheduler.stats()
+        with self._lock:
+            admitted = self._admitted
+        running = sum(stats[priority]["running"] for priority in PRIORITIES)
+        state = {
+            "workers": self.workers,
+            "running": running,
+            "queued": admitted - running,
+            "capacity": self.workers + self.queue_size,
+            "priorities": stats,
+        }
+        if self.converter.complexity_router is not None:
+            state["routing"] = self.converter.complexity_router.report()
+        return state
+
+    def update_gauges(self):
+        """Copy the scheduler's per-class queue state into the metrics."""
+        for priority, stats in self.scheduler.stats().items():
+            self.metrics.set_gauge("img2markdown_running", stats["running"], priority=priority)
+            self.metrics.set_gauge("img2markdown_waiting", stats["waiting"], priority=priority)
+            self.metrics.set_gauge("img2markdown_queue_wait_mean_seconds", round(stats["mean_wait"], 6),
+                                   priority=priority)
+            self.metrics.set_gauge("img2markdown_queue_wait_p95_seconds", round(stats["p95_wait"], 6),
+                                   priority=priority)
+
+    def submit(self, image_bytes, deadline=None, priority=INTERACTIVE):
+        """Queue a conversion and return its future, or raise ServiceBusy."""
+        if not self._slots.acquire(blocking=False):
+            self.metrics.inc("img2markdown_rejected_total", priority=priority)
+            raise ServiceBusy("Conversion queue is full")
+        with self._lock:
+            self._admitted += 1
+        return self._pool.submit(self._run, image_bytes, deadline, priority)
+
+    def _run(self, image_bytes, deadline, priority):
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            result = self.converter.convert(image_bytes, deadline=deadline, priority=priority)
+            self.converter.remember(result, source="http")
+            self.metrics.inc("img2markdown_tokens_total", (result.usage or {}).get("total_tokens", 0))
+            if result.route:
+                self.metrics.inc("img2markdown_routes_total", route=result.route)
+            return result
+        except DeadlineExceeded:
+            outcome = "deadline"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.metrics.inc("img2markdown_conversions_total", outcome=outcome, priority=priority)
+            self.metrics.observe("img2markdown_conversion_seconds", time.perf_counter() - start,
+                                 priority=priority)
+            with self._lock:
+                self._admitted -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def extract_image(body, content_type):
+    """Return the image bytes from a raw or multipart/form-data request body."""
+    if not content_type or not content_type.lower().startswith("multipart/form-data"):
+        return body
+    header = f"Content-Type: {content_type}\r\nMIME-Version: 1.0\r\n\r\n".encode("latin-1")
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+    parts = [part for part in message.iter_parts()]
+    # Prefer a part that carries a file, then one named "image" or "file"
+    for part in parts:
+        if part.get_filename():
+            return part.get_payload(decode=True)
+    for part in parts:
+        if part.get_param("name", header="content-disposition") in ("image", "file"):
+            return part.get_payload(decode=True)
+    return None
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end for a ConversionService (set as the `service` class attribute)."""
+
+    service = None
+    server_version = "img2markdown"
+
+    def log_message(self, format, *args):
+        # Requests are recorded as structured events instead of stderr lines
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        # Made-up paths would each add a time series
+        path = urlparse(self.path).path
+        if path not in KNOWN_PATHS:
+            path = "other"
+        self.service.metrics.inc("img2markdown_http_requests_total", path=path, code=status)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self.send_json(200, {"status": "ok", **self.service.state()})
+        elif path == "/metrics":
+            self.service.update_gauges()
+            body = self.service.metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/convert":
+            self.send_json(404, {"error": "not found"})
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.send_json(411, {"error": "Content-Length is required"})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "Content-Length must be a non-negative integer"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": f"request body larger than {MAX_BODY_BYTES} bytes"})
+            return
+        body = self.rfile.read(length)
+        image_bytes = extract_image(body, self.headers.get("Content-Type"))
+        if not image_bytes:
+            self.send_json(400, {"error": "no image in request body"})
+            return
+
+        deadline = self.headers.get("X-Deadline-Seconds")
+        if deadline:
+            try:
+                deadline = float(deadline)
+            except ValueError:
+                deadline = None
+            if deadline is None or not 0 < deadline < float("inf"):
+                self.send_json(400, {"error": "X-Deadline-Seconds must be a positive number of seconds"})
+                return
+        else:
+            deadline = None
+        priority = (self.headers.get("X-Priority") or INTERACTIVE).lower()
+        if priority not in PRIORITIES:
+            self.send_json(400, {"error": f"X-Priority must be one of {', '.join(PRIORITIES)}"})
+            return
+        start = time.perf_counter()
+        try:
+            future = self.service.submit(image_bytes, deadline, priority)
+            result = future.result()
+        except ServiceBusy as e:
+            self.send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        except DeadlineExceeded as e:
+            self.send_json(504, {"error": str(e)})
+            return
+        except Img2MarkdownError as e:
+            self.send_json(502, {"error": str(e)})
+            return
+        except Exception as e:
+            # Anything unexpected still gets an answer rather than a dropped connection
+            log_event("http.error", logging.ERROR, error=f"{type(e).__name__}: {e}")
+            self.send_json(500, {"error": "internal error"})
+            return
+        elapsed = time.perf_counter() - start
+        self.service.metrics.observe("img2markdown_request_seconds", elapsed, priority=priority)
+        log_event("http.convert", model=result.model, bytes=len(image_bytes), elapsed=round(elapsed, 3))
+        self.send_json(200, {
+            "markdown": result.markdown,
+            "text": result.text,
+            "model": result.model,
+            "elapsed": round(elapsed, 3),
+            "continuations": result.continuations,
+            "truncated": result.truncated,
+            "route": result.route,
+            "usage": result.usage,
+        })
+
+
+def make_server(converter, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+    """Create (but do not start) the HTTP server; port 0 picks a free port."""
+    service = ConversionService(converter, workers=workers, queue_size=queue_size)
+    handler = type("BoundConversionRequestHandler", (ConversionRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(converter, host=DEFAULT_HOST, port=DEFAULT_PORT,
+          workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+    """Run the conversion service until interrupted."""
+    server = make_server(converter, host, port, workers, queue_size)
+    print(f"Serving on http://{host}:{server.server_address[1]} "
+          f"({workers} workers, queue of {queue_size})")
+    log_event("http.start", host=host, port=server.server_address[1], workers=workers, queue_size=queue_size)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        server.service.shutdown()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Cross-process single-flight for duplicate conversions.
+
+When the Shortcut is double-tapped, or the GUI and a Shortcut fire at the
+same time, two processes end up converting the same image. The first one
+to take the lock file for the image's key does the work and leaves the
+result in a shared slot next to it; the others wait for the lock and then
+reuse that result instead of making their own API call.
+"""
+import fcntl
+import json
+import os
+import time
+
+from img2markdown_log import log_event
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "img2markdown", "singleflight")
+# How long a finished result may be reused (seconds): long enough for the
+# duplicates already waiting on the lock, short enough that a later re-run
+# of the same image makes its own call
+RESULT_TTL = 5.0
+# How long a duplicate waits for the first conversion before doing its own
+DEFAULT_WAIT_TIMEOUT = 180.0
+# Lock and result files older than this are removed
+PRUNE_AGE = 24 * 3600
+POLL_INTERVAL = 0.05
+
+
+class SingleFlight:
+    """Run a computation once per key across processes and share its JSON result."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, ttl=RESULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        return os.path.join(self.directory, f"{key}.lock"), os.path.join(self.directory, f"{key}.json")
+
+    def _read_result(self, result_path):
+        """Return the shared result if it exists and is fresh enough, else None."""
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.ttl:
+                return None
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, result_path, value):
+        temp_path = f"{result_path}.tmp{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(temp_path, result_path)
+
+    def _prune(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > PRUNE_AGE:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def run(self, key, compute, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        """
+        Return (value, shared) for key.
+
+        compute() must return a JSON-serialisable value. shared is True when
+        the value came from an overlapping run in another process rather
+        than from calling compute() here.
+        """
+        lock_path, result_path = self._paths(key)
+        with open(lock_path, 'a+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Someone else is converting this image: wait for them
+                log_event("singleflight.wait", key=key)
+                print("An identical conversion is already running, waiting for its result...")
+                if not self._wait_for_lock(lock_file, wait_timeout):
+                    log_event("singleflight.timeout", key=key)
+                    return compute(), False
+
+            try:
+                shared = self._read_result(result_path)
+                if shared is not None:
+                    log_event("singleflight.shared", key=key)
+                    return shared, True
+                self._prune()
+                value = compute()
+                self._write_result(result_path, value)
+                return value, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _wait_for_lock(self, lock_file, wait_timeout):
+        """Poll for the lock until wait_timeout; return True once it is held."""
+        give_up_at = time.monotonic() + wait_timeout
+        while time.monotonic() < give_up_at:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                time.sleep(POLL_INTERVAL)
+        return False
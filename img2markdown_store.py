@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Store of raw model responses for offline re-processing.
+
+Only the output of prep_for_pasting() used to be kept, so a change to the
+formatting rules meant paying for every conversion again. The store keeps
+the raw model text, zlib-compressed and content-addressed (identical
+responses are stored once), next to a SQLite index with the model, usage,
+settings hash and where the markdown was written. reprocess() then runs the
+current post-processing over the stored responses in a process pool and
+rewrites the outputs, without any API call. Outputs edited by hand since
+they were written are left alone.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from img2markdown_batch import settings_hash, write_atomic
+from img2markdown_log import log_event
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".img2markdown_responses")
+INDEX_NAME = "index.sqlite"
+# Responses handed to a worker process at a time
+REPROCESS_CHUNK = 256
+# Below this many responses a process pool costs more than it saves
+MIN_POOL_RESPONSES = 2 * REPROCESS_CHUNK
+# Responses older than this are removed (override with "response_retention_days" in config.json)
+DEFAULT_RETENTION_DAYS = 90
+# How often the store is pruned (seconds)
+PRUNE_INTERVAL = 24 * 3600
+PRUNE_MARKER = "last-prune"
+
+
+def _object_path(directory, text_hash):
+    return os.path.join(directory, "objects", text_hash[:2], text_hash[2:])
+
+
+def read_object(directory, text_hash):
+    """Return the stored raw text with the given hash."""
+    with open(_object_path(directory, text_hash), 'rb') as f:
+        return zlib.decompress(f.read()).decode("utf-8")
+
+
+def markdown_hash(markdown):
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    """Raw responses as compressed, content-addressed objects plus a SQLite index of conversions."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        # Conversions finish on worker threads, so access is serialised here
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_NAME), timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                text_hash TEXT,
+                image_hash TEXT,
+                model TEXT,
+                endpoint TEXT,
+                route TEXT,
+                usage TEXT,
+                continuations INTEGER,
+                truncated INTEGER,
+                settings_hash TEXT,
+                source TEXT,
+                output TEXT,
+                output_hash TEXT,
+                created_at REAL
+            )
+            """
+        )
+        # Indexes created before output hashes were kept
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(responses)")]
+        if "output_hash" not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN output_hash TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_output ON responses (output)")
+        self.db.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The store set up in config.json, or None when "store_responses" is false.
+
+        "response_store" moves it and "response_retention_days" sets how long
+        responses are kept; the store is pruned at most once a day.
+        """
+        if not config.get("store_responses", True):
+            return None
+        store = cls(config.get("response_store", DEFAULT_DIRECTORY))
+        store.prune_if_due(config.get("response_retention_days", DEFAULT_RETENTION_DAYS) * 24 * 3600)
+        return store
+
+    def close(self):
+        self.db.close()
+
+    def put_text(self, text):
+        """Store raw text once per content hash; returns the hash."""
+        data = text.encode("utf-8")
+        text_hash = hashlib.sha256(data).hexdigest()
+        path = _object_path(self.directory, text_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data, 9))
+            os.replace(temp_path, path)
+        return text_hash
+
+    def get_text(self, text_hash):
+        return read_object(self.directory, text_hash)
+
+    def record(self, result, settings=None, source=None, output=None, image_hash=None, markdown=None):
+        """
+        Store a successful ConversionResult and where its markdown went; returns the record id.
+
+        markdown is what was written to output (default: result.markdown);
+        its hash lets reprocess() tell whether the file was edited since.
+        """
+        text_hash = self.put_text(result.text)
+        if output:
+            output_hash = markdown_hash(markdown if markdown is not None else result.markdown)
+        else:
+            output_hash = None
+        row = (
+            text_hash, image_hash, result.model, result.endpoint, result.route,
+            json.dumps(result.usage) if result.usage else None, result.continuations, int(result.truncated),
+            settings_hash(settings) if settings is not None else None, source,
+            os.path.abspath(output) if output else None, output_hash, time.time(),
+        )
+        with self._lock:
+            cursor = self.db.execute(
+                "INSERT INTO responses (text_hash, image_hash, model, endpoint, route, usage, continuations, "
+                "truncated, settings_hash, source, output, output_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            self.db.commit()
+        return cursor.lastrowid
+
+    def latest(self):
+        """(id, text hash, output, output hash) of the newest record per output, plus every record without one."""
+        with self._lock:
+            return self.db.execute(
+                """
+                SELECT id, text_hash, output, output_hash FROM responses
+                WHERE output IS NULL OR id IN (SELECT MAX(id) FROM responses GROUP BY output)
+                ORDER BY id
+                """
+            ).fetchall()
+
+    def set_output_hashes(self, updates):
+        """Record the hashes of outputs rewritten by reprocess(), as (id, hash) pairs."""
+        with self._lock:
+            self.db.executemany("UPDATE responses SET output_hash = ? WHERE id = ?",
+                                [(output_hash, record_id) for record_id, output_hash in updates])
+            self.db.commit()
+
+    def prune(self, max_age=DEFAULT_RETENTION_DAYS * 24 * 3600):
+        """Remove responses older than max_age seconds and objects no longer used; returns how many records."""
+        with self._lock:
+            cursor = self.db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - max_age,))
+            self.db.commit()
+            removed = cursor.rowcount
+            used = {row[0] for row in self.db.execute("SELECT DISTINCT text_hash FROM responses")}
+        for root, _, files in os.walk(os.path.join(self.directory, "objects")):
+            for name in files:
+                text_hash = os.path.basename(root) + name
+                if text_hash not in used and ".tmp" not in name:
+                    try:
+                        os.unlink(os.path.join(root, name))
+                    except OSError:
+                        pass
+        log_event("store.prune", removed=removed, kept=len(used))
+        return removed
+
+    def prune_if_due(self, max_age):
+        """Run prune() if it has not run for PRUNE_INTERVAL seconds."""
+        marker = os.path.join(self.directory, PRUNE_MARKER)
+        try:
+            if time.time() - os.path.getmtime(marker) < PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+        with open(marker, 'w'):
+            pass
+        self.prune(max_age)
+
+
+def reprocess_chunk(directory, rows, postprocess, output_dir=None):
+    """
+    Re-run postprocess over a chunk of (id, text hash, output, output hash) rows in a worker process.
+
+    Outputs are rewritten in place, or written to output_dir/<id>.md when
+    given. An output is only rewritten while it still holds exactly what
+    was written, so hand edits are kept and counted as modified. Records
+    without an output (e.g. clipboard runs) or whose output no longer
+    exists count as missing. Returns (counts, [(id, new output hash)]).
+    """
+    counts = {"updated": 0, "unchanged": 0, "modified": 0, "missing": 0, "failed": 0}
+    updates = []
+    for record_id, text_hash, output, output_hash in rows:
+        if output_dir:
+            output = os.path.join(output_dir, f"{record_id}.md")
+        elif output is None or not os.path.exists(output):
+            counts["missing"] += 1
+            continue
+        try:
+            markdown = postprocess(read_object(directory, text_hash))
+            if not output_dir:
+                with open(output, 'r', encoding='utf-8') as f:
+                    current = markdown_hash(f.read())
+                if current == markdown_hash(markdown):
+                    counts["unchanged"] += 1
+                    continue
+                if current != output_hash:
+                    counts["modified"] += 1
+                    continue
+            write_atomic(output, markdown)
+            if not output_dir:
+                updates.append((record_id, markdown_hash(markdown)))
+            counts["updated"] += 1
+        except (OSError, ValueError, zlib.error):
+            counts["failed"] += 1
+    return counts, updates
+
+
+def reprocess(store, postprocess, output_dir=None, processes=None, verbose=True):
+    """
+    Apply the current post-processing to every stored response and write the updated outputs.
+
+    Only the newest response per output file is used, and files edited
+    since they were written are skipped. postprocess must be a
+    module-level function (e.g. prep_for_pasting) so worker processes can
+    import it. `processes` defaults to one per core; a frozen executable
+    running the pool must call multiprocessing.freeze_support() first.
+    Returns a dict of counts.
+    """
+    rows = store.latest()
+    chunks = [rows[i:i + REPROCESS_CHUNK] for i in range(0, len(rows), REPROCESS_CHUNK)]
+    counts = {"updated": 0, "unchanged": 0, "modified": 0, "missing": 0, "failed": 0}
+    start = time.perf_counter()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if len(rows) < MIN_POOL_RESPONSES or processes == 1:
+        results = [reprocess_chunk(store.directory, chunk, postprocess, output_dir) for chunk in chunks]
+    else:
+        # Spawned like the conversion pipeline's workers, in case other threads are running
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes or None, mp_context=context) as pool:
+            results = list(pool.map(reprocess_chunk, [store.directory] * len(chunks), chunks,
+                                    [postprocess] * len(chunks), [output_dir] * len(chunks)))
+    for chunk_counts, updates in results:
+        for key, value in chunk_counts.items():
+            counts[key] += value
+        # The next run compares against what was written now
+        store.set_output_hashes(updates)
+
+    elapsed = time.perf_counter() - start
+    log_event("store.reprocess", responses=len(rows), elapsed=round(elapsed, 3), **counts)
+    if verbose:
+        print(
+            f"Reprocessed {len(rows)} responses in {elapsed:.1f}s: updated {counts['updated']}, "
+            f"unchanged {counts['unchanged']}, edited by hand {counts['modified']}, "
+            f"missing output {counts['missing']}, failed {counts['failed']}"
+        )
+    return counts
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Band cache for re-captured documents.
+
+Re-capturing a page after fixing a typo changes one paragraph, yet the
+whole page would go back to the model. In tiled mode the image is split
+into horizontal bands along blank rows (see split_bands() in
+img2markdown_image), the markdown of every band is cached under a hash of
+its pixels and the conversion settings, and only bands that were not seen
+before are converted.
+"""
+import json
+import os
+import time
+
+from img2markdown_batch import settings_hash
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "img2markdown", "tiles")
+# Bands not used for this long are removed
+PRUNE_AGE = 30 * 24 * 3600
+# How often the cache is pruned (seconds)
+PRUNE_INTERVAL = 24 * 3600
+PRUNE_MARKER = "last-prune"
+
+
+def strip_fences(text):
+    """Remove a ```markdown fence wrapped around a band's output."""
+    text = text.strip()
+    for fence in ("```markdown\n", "```\n"):
+        if text.startswith(fence) and text.endswith("\n```"):
+            return text[len(fence):-4].strip()
+    return text
+
+
+def join_bands(texts):
+    """Join the markdown of consecutive bands into one document."""
+    return "\n\n".join(part for part in (strip_fences(text) for text in texts) if part)
+
+
+class TileCache:
+    """Markdown of image bands, one JSON file per band hash and settings."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, band_hash, settings):
+        return f"{band_hash[:32]}-{settings_hash(settings)}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached {"text", "model"} for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Keep bands that are still being reused from being pruned
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, text, model):
+        path = self._path(key)
+        temp_path = f"{path}.tmp{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"text": text, "model": model}, f)
+        os.replace(temp_path, path)
+
+    def prune(self, max_age=PRUNE_AGE):
+        """Remove bands that have not been used for max_age seconds; returns how many."""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def prune_if_due(self, max_age=PRUNE_AGE):
+        """Run prune() if it has not run for PRUNE_INTERVAL seconds; returns how many bands it removed."""
+        marker = os.path.join(self.directory, PRUNE_MARKER)
+        try:
+            if time.time() - os.path.getmtime(marker) < PRUNE_INTERVAL:
+                return 0
+        except OSError:
+            pass
+        with open(marker, 'w'):
+            pass
+        return self.prune(max_age)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Shared work queue for conversions spread over several hosts.
+
+The queue is a SQLite database on a filesystem every worker can reach (or
+a local disk, for several workers on one machine). Workers claim a batch of
+images under a time-bounded lease and keep renewing it while they convert.
+If a worker dies its leases run out and the items are claimed by someone
+else. A result is only recorded, and its output only moved into place,
+while the worker still holds the lease, so every item is completed exactly
+once.
+
+Paths are stored relative to the database's directory when they are below
+it, so hosts may mount the share at different places.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from img2markdown_batch import find_images, output_names, write_atomic
+from img2markdown_image import triage_image
+from img2markdown_log import log_event
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+# How long a worker waits before looking for reclaimable work again
+POLL_INTERVAL = 5.0
+# Completions in this window count towards the throughput
+THROUGHPUT_WINDOW = 600.0
+
+STATUSES = ("pending", "leased", "done", "empty", "failed")
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class WorkItem:
+    """A claimed image: where to read it, where to write the markdown and the lease token."""
+    id: int
+    source: str
+    output: str
+    token: str
+    attempts: int
+
+
+class WorkQueue:
+    """A SQLite-backed queue of images with lease-based claiming."""
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # The rollback journal (not WAL) works on network filesystems; claims
+        # take the write lock up front with BEGIN IMMEDIATE
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                source TEXT UNIQUE,
+                output TEXT,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                token TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0,
+                model TEXT,
+                error TEXT,
+                enqueued_at REAL,
+                finished_at REAL,
+                elapsed REAL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_expires)")
+
+    def close(self):
+        self.db.close()
+
+    def _store_path(self, path):
+        path = os.path.abspath(path)
+        relative = os.path.relpath(path, self.root)
+        return path if relative.startswith(os.pardir) else relative
+
+    def _load_path(self, path):
+        return os.path.join(self.root, path)
+
+    def _transaction(self, work):
+        """Run work(cursor) inside BEGIN IMMEDIATE ... COMMIT and return its result."""
+        with self._lock:
+            cursor = self.db.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            return result
+
+    def enqueue(self, source_dir, output_dir=None):
+        """Add every image below source_dir; returns how many were new. Output goes next to it or under output_dir."""
+        output_dir = output_dir or source_dir
+        rows = []
+        now = time.time()
+        images = find_images(source_dir)
+        outputs = output_names(images)
+        for rel_path in images:
+            output = os.path.join(output_dir, outputs[rel_path])
+            rows.append((self._store_path(os.path.join(source_dir, rel_path)), self._store_path(output), now))
+
+        def insert(cursor):
+            before = cursor.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            cursor.executemany("INSERT OR IGNORE INTO items (source, output, enqueued_at) VALUES (?, ?, ?)", rows)
+            return cursor.execute("SELECT COUNT(*) FROM items").fetchone()[0] - before
+
+        added = self._transaction(insert)
+        log_event("queue.enqueue", queue=self.path, found=len(rows), added=added)
+        return added
+
+    def claim(self, worker, count=1):
+        """Lease up to count pending (or expired) items to worker and return them as WorkItems."""
+        now = time.time()
+
+        def take(cursor):
+            rows = cursor.execute(
+                """
+                SELECT id, source, output, attempts FROM items
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT ?
+                """,
+                (now, count)
+            ).fetchall()
+            items = []
+            for item_id, source, output, attempts in rows:
+                token = uuid.uuid4().hex
+                cursor.execute(
+                    "UPDATE items SET status = 'leased', worker = ?, token = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, token, now + self.lease_seconds, item_id)
+                )
+                items.append(WorkItem(item_id, self._load_path(source), self._load_path(output), token, attempts + 1))
+            return items
+
+        items = self._transaction(take)
+        if items:
+            log_event("queue.claim", worker=worker, items=len(items))
+        return items
+
+    def renew(self, items):
+        """Extend the leases of items still held; returns the ones that were lost."""
+        expires = time.time() + self.lease_seconds
+
+        def extend(cursor):
+            lost = []
+            for item in items:
+                cursor.execute(
+                    "UPDATE items SET lease_expires = ? WHERE id = ? AND token = ? AND status = 'leased'",
+                    (expires, item.id, item.token)
+                )
+                if cursor.rowcount == 0:
+                    lost.append(item)
+            return lost
+
+        return self._transaction(extend)
+
+    def complete(self, item, status="done", model=None, elapsed=None, publish=None):
+        """
+        Record item as finished if its lease is still held; returns False otherwise.
+
+        publish() (e.g. moving the output into place) runs inside the same
+        transaction, after the lease check, so only the lease holder does it.
+        """
+        def finish(cursor):
+            row = cursor.execute(
+                "SELECT 1 FROM items WHERE id = ? AND token = ? AND status = 'leased'", (item.id, item.token)
+            ).fetchone()
+            if row is None:
+                return False
+            if publish is not None:
+                publish()
+            cursor.execute(
+                "UPDATE items SET status = ?, model = ?, elapsed = ?, finished_at = ?, error = NULL, "
+                "lease_expires = NULL WHERE id = ?",
+                (status, model, elapsed, time.time(), item.id)
+            )
+            return True
+
+        return self._transaction(finish)
+
+    def fail(self, item, error):
+        """
+        Give a failed item back for another attempt, or mark it failed after max_attempts.
+
+        Returns the status applied ("pending" or "failed"), or None if the
+        lease was no longer held.
+        """
+        status = "failed" if item.attempts >= self.max_attempts else "pending"
+
+        def release(cursor):
+            cursor.execute(
+                "UPDATE items SET status = ?, error = ?, lease_expires = NULL, finished_at = ? "
+                "WHERE id = ? AND token = ? AND status = 'leased'",
+                (status, str(error), time.time(), item.id, item.token)
+            )
+            return status if cursor.rowcount > 0 else None
+
+        return self._transaction(release)
+
+    def outstanding(self):
+        """Items that are pending or leased, i.e. not finished yet."""
+        with self._lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM items WHERE status IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def progress(self, window=THROUGHPUT_WINDOW):
+        """Counts per status, overall and per-worker throughput (items per minute) and an ETA."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self.db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            workers = self.db.execute(
+                """
+                SELECT worker,
+                       SUM(status IN ('done', 'empty')),
+                       SUM(status IN ('done', 'empty') AND finished_at >= ?),
+                       SUM(status = 'leased' AND lease_expires >= ?),
+                       MAX(finished_at)
+                FROM items WHERE worker IS NOT NULL GROUP BY worker ORDER BY worker
+                """,
+                (now - window, now)
+            ).fetchall()
+            expired = self.db.execute(
+                "SELECT COUNT(*) FROM items WHERE status = 'leased' AND lease_expires < ?", (now,)
+            ).fetchone()[0]
+        counts = {status: counts.get(status, 0) for status in STATUSES}
+        recent = sum(row[2] or 0 for row in workers)
+        rate = recent / (window / 60)
+        remaining = counts["pending"] + counts["leased"]
+        return {
+            "total": sum(counts.values()),
+            **counts,
+            "expired_leases": expired,
+            "per_minute": round(rate, 2),
+            "eta_minutes": round(remaining / rate, 1) if rate else None,
+            "workers": [
+                {
+                    "worker": worker,
+                    "completed": completed or 0,
+                    "per_minute": round((recent_done or 0) / (window / 60), 2),
+                    "leased": leased or 0,
+                    "last_finished": last_finished,
+                }
+                for worker, completed, recent_done, leased, last_finished in workers
+            ],
+        }
+
+    def describe(self):
+        """Printable lines with the aggregated progress of all workers."""
+        progress = self.progress()
+        done = progress["done"] + progress["empty"]
+        lines = [
+            f"Queue {self.path}: {done}/{progress['total']} finished "
+            f"({progress['done']} converted, {progress['empty']} empty), {progress['failed']} failed, "
+            f"{progress['leased']} leased ({progress['expired_leases']} expired), {progress['pending']} pending",
+            f"Throughput: {progress['per_minute']:.1f} images/min over the last {THROUGHPUT_WINDOW / 60:.0f} min"
+            + (f", about {progress['eta_minutes']:.0f} min to go" if progress["eta_minutes"] is not None else ""),
+        ]
+        if progress["workers"]:
+            lines.append("Workers:")
+        now = time.time()
+        for worker in progress["workers"]:
+            last = worker["last_finished"]
+            seen = f"last finished {now - last:.0f}s ago" if last else "nothing finished yet"
+            lines.append(
+                f"- {worker['worker']}: {worker['completed']} finished, {worker['per_minute']:.1f}/min, "
+                f"{worker['leased']} leased, {seen}"
+            )
+        return lines
+
+
+class LeaseKeeper:
+    """Background thread renewing the leases of the items a worker is converting."""
+
+    def __init__(self, queue, interval=None):
+        self.queue = queue
+        self.interval = interval or queue.lease_seconds / 3
+        self.items = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def hold(self, items):
+        with self._lock:
+            self.items.update((item.id, item) for item in items)
+
+    def drop(self, item):
+        with self._lock:
+            self.items.pop(item.id, None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                items = list(self.items.values())
+            if items:
+                for item in self.queue.renew(items):
+                    log_event("queue.lease_lost", item=item.id, source=item.source)
+
+
+def run_worker(converter, queue, worker=None, batch_size=None, triage=True, triage_thresholds=None,
+               poll_interval=POLL_INTERVAL, verbose=True):
+    """
+    Claim and convert images from queue until nothing is left to do.
+
+    A worker keeps going while other workers still hold leases, since those
+    items come back if their worker dies. Returns a dict of counts, where
+    "failed" only counts items given up on and "retried" those put back.
+    """
+    worker = worker or default_worker_name()
+    batch_size = batch_size or converter.max_workers
+    counts = {"converted": 0, "empty": 0, "failed": 0, "retried": 0, "lost": 0}
+    start = time.perf_counter()
+
+    def give_back(item, error):
+        keeper.drop(item)
+        status = queue.fail(item, error)
+        if status is None:
+            counts["lost"] += 1
+            log_event("queue.lease_lost", worker=worker, item=item.id, source=item.source)
+        else:
+            # Items put back as pending are retried and may still succeed
+            counts["failed" if status == "failed" else "retried"] += 1
+        return status
+
+    def finish(item, status, model=None, elapsed=None, publish=None):
+        keeper.drop(item)
+        try:
+            if queue.complete(item, status, model, elapsed, publish):
+                return True
+        except OSError as e:
+            # The output could not be moved into place; the lease is still ours
+            give_back(item, e)
+            return False
+        # Someone else holds the lease now and will record the result
+        counts["lost"] += 1
+        log_event("queue.lease_lost", worker=worker, item=item.id, source=item.source)
+        return False
+
+    with LeaseKeeper(queue) as keeper:
+        while True:
+            items = queue.claim(worker, batch_size)
+            if not items:
+                if queue.outstanding() == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+            keeper.hold(items)
+            jobs = []
+
+            def images():
+                for item in items:
+                    try:
+                        with open(item.source, 'rb') as f:
+                            image_bytes = f.read()
+                    except OSError as e:
+                        give_back(item, e)
+                        continue
+                    if triage:
+                        result = triage_image(image_bytes, triage_thresholds)
+                        if result is not None and result["label"] == "empty":
+                            if finish(item, "empty"):
+                                counts["empty"] += 1
+                            continue
+                    jobs.append(item)
+                    yield image_bytes
+
+            for result in converter.convert_many(images()):
+                item = jobs[result.index]
+                if not result.ok:
+                    status = give_back(item, result.error)
+                    if verbose:
+                        retry = " (will be retried)" if status == "pending" else ""
+                        print(f"Failed: {item.source}: {result.error}{retry}")
+                    continue
+                # Named after the lease token: workers on other hosts may share our PID
+                temp_path = f"{item.output}.{item.token}.tmp"
+                try:
+                    write_atomic(temp_path, result.markdown)
+                except OSError as e:
+                    give_back(item, e)
+                    continue
+                if finish(item, "done", result.model, result.elapsed,
+                          publish=lambda: os.replace(temp_path, item.output)):
+                    converter.remember(result, source=item.source, output=item.output)
+                    counts["converted"] += 1
+                    if verbose:
+                        print(f"Converted: {item.source} -> {item.output} ({result.model}, {result.elapsed:.1f}s)")
+                elif os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+    if verbose:
+        print(
+            f"Worker {worker}: converted {counts['converted']}, empty {counts['empty']}, "
+            f"failed {counts['failed']}, retried {counts['retried']}, lost leases {counts['lost']} in {time.perf_counter() - start:.1f}s"
+        )
+    return counts
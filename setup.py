@@ -5,7 +5,6 @@ from setuptools import setup
 
 APP = ['img2markdown_gui.py']
 DATA_FILES = [
-    ('', ['dist/img2markdown']),
     ('', ['.env'])
 ]
 OPTIONS = {
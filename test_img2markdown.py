@@ -1,6 +1,54 @@
 #!/usr/bin/env python3
+import asyncio
+import time
 import unittest
-from img2markdown import prep_for_pasting
+import unittest.mock
+from types import SimpleNamespace
+
+import img2markdown
+from img2markdown import (
+    ConfigurationError, ConversionError, Converter, Deadline, DeadlineExceeded, StageTimings,
+    join_continuation, prep_for_pasting, run_in_background
+)
+
+
+class FakeCompletions:
+    """Stand-in for client.chat.completions that records every call."""
+
+    def __init__(self, replies=None, failing_models=(), delay=0.0):
+        self.replies = replies or {}
+        self.failing_models = set(failing_models)
+        self.delay = delay
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.delay:
+            time.sleep(self.delay)
+        model = kwargs["model"]
+        if model in self.failing_models:
+            raise RuntimeError(f"{model} is unavailable")
+        # A reply is either a string or a list of (content, finish_reason)
+        # pairs that are handed out one per call
+        reply = self.replies.get(model, f"# Converted by {model}")
+        finish_reason = "stop"
+        if isinstance(reply, list):
+            reply, finish_reason = reply.pop(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply), finish_reason=finish_reason)],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        )
+
+
+class FakeClient:
+    """Minimal sync OpenAI client replacement."""
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**kwargs))
+
+    @property
+    def calls(self):
+        return self.chat.completions.calls
 
 
 class TestPrepForPasting(unittest.TestCase):
@@ -246,5 +294,187 @@ class TestPrepForPasting(unittest.TestCase):
         self.assertEqual(actual_output, expected_output)
 
 
+class TestConverter(unittest.TestCase):
+    def test_convert_uses_injected_client(self):
+        """The injected client is used and the result carries the raw and prepared text."""
+        client = FakeClient()
+        result = Converter(client=client).convert(b"image")
+        self.assertEqual(result.model, "gpt-4o")
+        self.assertEqual(result.text, "# Converted by gpt-4o")
+        self.assertEqual(result.markdown, "### Converted by gpt-4o")
+        self.assertEqual(len(client.calls), 1)
+
+    def test_real_mime_type_is_sent(self):
+        """A JPEG is labelled as image/jpeg rather than always image/png."""
+        client = FakeClient()
+        Converter(client=client).convert(b"\xff\xd8\xff\xe0 fake jpeg")
+        url = client.calls[0]["messages"][0]["content"][1]["image_url"]["url"]
+        self.assertTrue(url.startswith("data:image/jpeg;base64,"))
+
+    def test_fallback_to_next_model(self):
+        """A failing model falls through to the next one in the list."""
+        client = FakeClient(failing_models={"gpt-4o"})
+        result = Converter(client=client).convert(b"image")
+        self.assertEqual(result.model, "gpt-4-turbo")
+        self.assertEqual([c["model"] for c in client.calls], ["gpt-4o", "gpt-4-turbo"])
+
+    def test_all_models_failing_raises(self):
+        """Instead of exiting, a typed exception lists every failed attempt."""
+        client = FakeClient(failing_models={"gpt-4o", "gpt-4-turbo"})
+        converter = Converter(client=client, models=["gpt-4o", "gpt-4-turbo"])
+        with self.assertRaises(ConversionError) as ctx:
+            converter.convert(b"image")
+        self.assertEqual([model for model, _ in ctx.exception.errors], ["gpt-4o", "gpt-4-turbo"])
+
+    def test_no_fallback_only_tries_one_model(self):
+        client = FakeClient(failing_models={"gpt-4-turbo"})
+        converter = Converter(client=client, model="gpt-4-turbo", fallback=False)
+        with self.assertRaises(ConversionError):
+            converter.convert(b"image")
+        self.assertEqual(len(client.calls), 1)
+
+    def test_missing_api_key_raises(self):
+        with unittest.mock.patch.dict("os.environ", {}, clear=True):
+            with self.assertRaises(ConfigurationError):
+                Converter()
+
+    def test_convert_many_yields_every_result(self):
+        """convert_many yields one result per input, including failures."""
+        client = FakeClient(delay=0.01)
+        converter = Converter(client=client, max_workers=3)
+        images = [b"a", b"b", None, b"d"]
+        results = list(converter.convert_many(images))
+        self.assertEqual(sorted(r.index for r in results), [0, 1, 2, 3])
+        failed = [r for r in results if not r.ok]
+        self.assertEqual([r.index for r in failed], [2])
+
+    def test_aconvert_many_with_sync_client(self):
+        """The async API falls back to running the sync client in threads."""
+        converter = Converter(client=FakeClient())
+
+        async def collect():
+            return [r async for r in converter.aconvert_many([b"a", b"b"])]
+
+        results = asyncio.run(collect())
+        self.assertEqual(sorted(r.index for r in results), [0, 1])
+        self.assertTrue(all(r.ok for r in results))
+
+
+class TestDeadline(unittest.TestCase):
+    def test_attempt_timeout_is_capped_by_remaining_budget(self):
+        """Each attempt gets the per-attempt timeout or the time left, whichever is shorter."""
+        client = FakeClient()
+        Converter(client=client, timeout=30).convert(b"image", deadline=10)
+        self.assertLessEqual(client.calls[0]["timeout"], 10)
+        client = FakeClient()
+        Converter(client=client, timeout=5).convert(b"image", deadline=10)
+        self.assertEqual(client.calls[0]["timeout"], 5)
+
+    def test_converter_deadline_applies_to_each_bulk_image(self):
+        """A deadline given to the converter starts afresh for every image of convert_many()."""
+        client = FakeClient(delay=0.05)
+        converter = Converter(client=client, deadline=10, max_workers=1)
+        results = list(converter.convert_many([b"a", b"b", b"c"]))
+        self.assertTrue(all(r.ok for r in results))
+        self.assertTrue(all(9 < call["timeout"] <= 10 for call in client.calls))
+
+    def test_no_timeout_without_deadline(self):
+        client = FakeClient()
+        Converter(client=client).convert(b"image")
+        self.assertNotIn("timeout", client.calls[0])
+
+    def test_spent_budget_stops_the_fallback_chain(self):
+        """Once the deadline has passed no further models are tried."""
+        client = FakeClient(failing_models={"gpt-4o"}, delay=0.15)
+        converter = Converter(client=client, timeout=30)
+        with unittest.mock.patch.object(img2markdown, "MIN_ATTEMPT_SECONDS", 0.01):
+            with self.assertRaises(DeadlineExceeded) as ctx:
+                converter.convert(b"image", deadline=Deadline(0.1))
+        self.assertEqual([c["model"] for c in client.calls], ["gpt-4o"])
+        self.assertEqual(len(ctx.exception.errors), 1)
+
+
+class TestContinuation(unittest.TestCase):
+    def test_truncated_output_is_continued(self):
+        """Output cut off at max_tokens is continued and joined seamlessly."""
+        client = FakeClient(replies={"gpt-4o": [
+            ("```markdown\n# Title\n\nFirst part of a long", "length"),
+            ("part of a long paragraph.\n- second item", "length"),
+            ("- second item\n- last item\n```", "stop"),
+        ]})
+        result = Converter(client=client).convert(b"image")
+        self.assertEqual(result.continuations, 2)
+        self.assertFalse(result.truncated)
+        self.assertEqual(result.markdown, "### Title\n\nFirst part of a long paragraph.\n- second item\n- last item")
+        self.assertEqual(result.usage["total_tokens"], 45)
+        # The continuation request carries the partial answer
+        self.assertEqual(client.calls[1]["messages"][1]["role"], "assistant")
+
+    def test_continuations_are_capped(self):
+        client = FakeClient(replies={"gpt-4o": [("a" * 20, "length"), ("b" * 20, "length")]})
+        result = Converter(client=client, max_continuations=1).convert(b"image")
+        self.assertEqual(result.continuations, 1)
+        self.assertTrue(result.truncated)
+        self.assertEqual(len(client.calls), 2)
+
+    def test_join_continuation_strips_reopened_fence(self):
+        self.assertEqual(join_continuation("Some text ", "```markdown\nmore text"), "Some text more text")
+
+
+class WarmUpClient(FakeClient):
+    """FakeClient that also answers models.retrieve, the warm-up request."""
+
+    def __init__(self, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.retrieved = []
+        self.options = []
+
+        def retrieve(model):
+            if fail:
+                raise ConnectionError("no route to host")
+            self.retrieved.append(model)
+
+        self.models = SimpleNamespace(retrieve=retrieve)
+
+    def with_options(self, **options):
+        self.options.append(options)
+        return self
+
+
+class TestWarmUp(unittest.TestCase):
+    def test_warm_up_requests_the_first_model(self):
+        client = WarmUpClient()
+        elapsed = Converter(client=client, model="gpt-4-turbo").warm_up(timeout=2)
+        self.assertIsNotNone(elapsed)
+        self.assertEqual(client.retrieved, ["gpt-4-turbo"])
+        self.assertEqual(client.options, [{"timeout": 2, "max_retries": 0}])
+        self.assertEqual(client.calls, [])
+
+    def test_failed_warm_up_is_not_an_error(self):
+        self.assertIsNone(Converter(client=WarmUpClient(fail=True)).warm_up())
+        # Clients without a models API (like the plain fake) are skipped too
+        self.assertIsNone(Converter(client=FakeClient()).warm_up())
+
+    def test_deadline_counts_from_its_start(self):
+        deadline = Deadline(10, start=time.monotonic() - 4)
+        self.assertLessEqual(deadline.remaining(), 6)
+
+
+class TestStageTimings(unittest.TestCase):
+    def test_overlapping_stages_report_the_time_saved(self):
+        timings = StageTimings()
+        background = run_in_background(timings.timed, "warm-up", time.sleep, 0.2)
+        timings.timed("capture", time.sleep, 0.2)
+        background.result()
+        self.assertEqual(sorted(timings.stages), ["capture", "warm-up"])
+        self.assertGreater(timings.saved(), 0.1)
+        self.assertIn("overlap saved", timings.summary())
+
+    def test_background_errors_surface_on_result(self):
+        future = run_in_background(int, "not a number")
+        with self.assertRaises(ValueError):
+            future.result(timeout=1)
+
+
 if __name__ == "__main__":
     unittest.main()
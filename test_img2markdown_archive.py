@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from PIL import Image
+
+from img2markdown import Converter
+from img2markdown_archive import archive_stem, convert_archive, is_archive, iter_archive_images
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+NAMES = ["deck/slide1.png", "deck/slide2.png", "deck/slide3.png", "deck/slide10.png"]
+
+
+class TestConvertArchive(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.images = {name: make_png(make_text_image(i + 1)) for i, name in enumerate(NAMES)}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def make_zip(self, extra=None):
+        path = self.path("deck.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("deck/", "")
+            archive.writestr("deck/notes.txt", "not an image")
+            archive.writestr("__MACOSX/deck/._slide1.png", "resource fork")
+            for name in NAMES:
+                archive.writestr(name, self.images[name])
+            for name, data in (extra or {}).items():
+                archive.writestr(name, data)
+        return path
+
+    def make_tar(self):
+        path = self.path("deck.tar.gz")
+        with tarfile.open(path, "w:gz") as archive:
+            for name in NAMES:
+                info = tarfile.TarInfo(name)
+                info.size = len(self.images[name])
+                archive.addfile(info, io.BytesIO(self.images[name]))
+        return path
+
+    def test_members_are_streamed_in_archive_order(self):
+        for path in (self.make_zip(), self.make_tar()):
+            self.assertTrue(is_archive(path))
+            self.assertEqual([(n, d) for n, d in iter_archive_images(path)],
+                             [(n, self.images[n]) for n in NAMES])
+        self.assertFalse(is_archive(self.path("missing.zip")))
+
+    def test_zip_output_has_one_markdown_file_per_image(self):
+        client = FakeClient(delay=0.02)
+        counts = convert_archive(Converter(client=client), self.make_tar(), verbose=False)
+        self.assertEqual(counts, {"converted": 4, "empty": 0, "failed": 0})
+        with zipfile.ZipFile(self.path("deck-markdown.zip")) as output:
+            self.assertEqual(output.namelist(), [os.path.splitext(n)[0] + ".md" for n in NAMES])
+            self.assertEqual(output.read("deck/slide1.md").decode(), "### Converted by gpt-4o")
+
+    def test_names_differing_only_in_extension_do_not_clash(self):
+        extra = {"deck/slide1.jpg": make_png(make_text_image(2))}
+        convert_archive(Converter(client=FakeClient()), self.make_zip(extra), self.path("out.zip"), verbose=False)
+        with zipfile.ZipFile(self.path("out.zip")) as output:
+            names = output.namelist()
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn("deck/slide1.md", names)
+        self.assertIn("deck/slide1.jpg.md", names)
+
+    def test_combined_document_keeps_archive_order(self):
+        output = self.path("deck.md")
+        empty = make_png(Image.new("RGB", (200, 200), "white"))
+        client = FakeClient(delay=0.02)
+        counts = convert_archive(Converter(client=client, max_workers=4),
+                                 self.make_zip({"deck/blank.png": empty}), output, verbose=False)
+        self.assertEqual(counts, {"converted": 4, "empty": 1, "failed": 0})
+        self.assertEqual(len(client.calls), 4)
+        with open(output, encoding="utf-8") as f:
+            text = f.read()
+        headings = [line[3:] for line in text.splitlines() if line.startswith("## ")]
+        self.assertEqual(headings, NAMES)
+
+    def test_failures_are_counted_and_skipped(self):
+        client = FakeClient(failing_models=["gpt-4o", "gpt-4-turbo", "gpt-4-vision-preview", "gpt-4"])
+        output = self.path("out.zip")
+        counts = convert_archive(Converter(client=client), self.make_zip(), output, verbose=False)
+        self.assertEqual(counts["failed"], 4)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(archive.namelist(), [])
+
+    def test_archive_stem(self):
+        self.assertEqual(archive_stem("/x/slides.tar.gz"), "slides")
+        self.assertEqual(archive_stem("dump.ZIP"), "dump")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from img2markdown import Converter
+from img2markdown_batch import convert_directory, output_names
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+
+class TestConvertDirectory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, "images")
+        self.output = os.path.join(self.temp_dir.name, "markdown")
+        os.makedirs(os.path.join(self.source, "sub"))
+        for rel_path in ("a.png", "b.png", os.path.join("sub", "c.png")):
+            self.write_image(rel_path, lines=5)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_image(self, rel_path, lines):
+        with open(os.path.join(self.source, rel_path), 'wb') as f:
+            f.write(make_png(make_text_image(lines)))
+
+    def run_batch(self, settings=None):
+        client = FakeClient()
+        counts = convert_directory(Converter(client=client), self.source, self.output,
+                                   settings=settings or {"model": "gpt-4o"}, verbose=False)
+        return counts, len(client.calls)
+
+    def test_first_run_converts_everything(self):
+        counts, calls = self.run_batch()
+        self.assertEqual(counts["converted"], 3)
+        self.assertEqual(calls, 3)
+        self.assertTrue(os.path.exists(os.path.join(self.output, "sub", "c.md")))
+
+    def test_rerun_only_converts_new_or_changed_images(self):
+        self.run_batch()
+        counts, calls = self.run_batch()
+        self.assertEqual((counts["converted"], counts["unchanged"], calls), (0, 3, 0))
+
+        self.write_image("a.png", lines=8)
+        self.write_image("d.png", lines=3)
+        counts, calls = self.run_batch()
+        self.assertEqual((counts["converted"], counts["unchanged"], calls), (2, 2, 2))
+
+    def test_touched_but_identical_file_is_not_reconverted(self):
+        self.run_batch()
+        path = os.path.join(self.source, "b.png")
+        os.utime(path, ns=(1, 1))
+        counts, calls = self.run_batch()
+        self.assertEqual(calls, 0)
+
+    def test_changed_settings_reconvert_everything(self):
+        self.run_batch()
+        counts, calls = self.run_batch(settings={"model": "gpt-4-turbo"})
+        self.assertEqual(calls, 3)
+
+    def test_deleted_output_is_regenerated(self):
+        self.run_batch()
+        os.remove(os.path.join(self.output, "a.md"))
+        counts, calls = self.run_batch()
+        self.assertEqual(calls, 1)
+
+    def test_images_differing_only_in_extension_get_separate_outputs(self):
+        self.write_image("a.jpg", lines=3)
+        counts, calls = self.run_batch()
+        self.assertEqual(counts["converted"], 4)
+        for name in ("a.png.md", "a.jpg.md", "b.md"):
+            self.assertTrue(os.path.exists(os.path.join(self.output, name)), name)
+        self.assertFalse(os.path.exists(os.path.join(self.output, "a.md")))
+
+    def test_output_names(self):
+        names = output_names(["shot.png", "Shot.JPG", "other.png", os.path.join("sub", "shot.png")])
+        self.assertEqual(names["shot.png"], "shot.png.md")
+        self.assertEqual(names["Shot.JPG"], "Shot.JPG.md")
+        self.assertEqual(names["other.png"], "other.md")
+        self.assertEqual(names[os.path.join("sub", "shot.png")], os.path.join("sub", "shot.md"))
+
+
+if __name__ == "__main__":
+    unittest.main()
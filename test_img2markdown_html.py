@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from img2markdown import prep_for_pasting
+from img2markdown_html import (decode_applescript_data, get_text_from_clipboard,
+                               html_to_markdown, parse_clipboard_info)
+
+
+class TestHtmlToMarkdown(unittest.TestCase):
+    def test_headings_emphasis_and_links(self):
+        html = (
+            "<html><head><title>Page</title><style>p {}</style></head><body>"
+            "<h1>Title</h1><h2>Section</h2>"
+            "<p>Some <b>bold</b>, <em>italic</em> and <a href='https://example.com'>a link</a>.</p>"
+            "<p>Inline <code>code</code><br>next line</p></body></html>"
+        )
+        self.assertEqual(
+            html_to_markdown(html),
+            "# Title\n\n## Section\n\n"
+            "Some **bold**, *italic* and [a link](https://example.com).\n\n"
+            "Inline `code`\nnext line\n"
+        )
+
+    def test_lists_code_blocks_and_quotes(self):
+        html = (
+            "<ul><li>one</li><li>two<ul><li>nested</li></ul></li></ul>"
+            "<ol><li>first</li><li>second</li></ol>"
+            "<pre><code>def f():\n    return 1\n</code></pre>"
+            "<blockquote><p>quoted</p></blockquote>"
+        )
+        self.assertEqual(
+            html_to_markdown(html),
+            "- one\n- two\n   - nested\n\n1. first\n2. second\n\n"
+            "```\ndef f():\n    return 1\n```\n\n> quoted\n"
+        )
+
+    def test_tables(self):
+        html = "<table><tr><th>Name</th><th>Value</th></tr><tr><td>a</td><td>1 | 2</td></tr></table>"
+        self.assertEqual(html_to_markdown(html), "| Name | Value |\n|---|---|\n| a | 1 \\| 2 |\n")
+
+    def test_output_follows_the_pasting_rules(self):
+        markdown = prep_for_pasting(html_to_markdown("<h1>Top</h1><h2>Sub</h2><p>Body</p>").strip())
+        self.assertEqual(markdown, "### Top\n\n**Sub**\n\nBody")
+
+
+class TestClipboardText(unittest.TestCase):
+    def test_parse_clipboard_info(self):
+        info = "«class HTML», 1234, «class utf8», 56, «class PNGf», 9876\n"
+        self.assertEqual(parse_clipboard_info(info), ["«class HTML»", "«class utf8»", "«class PNGf»"])
+
+    def test_decode_applescript_data(self):
+        self.assertEqual(decode_applescript_data("«data HTML3C623E68693C2F623E»\n"), b"<b>hi</b>")
+        self.assertIsNone(decode_applescript_data("not data"))
+
+    def fake_clipboard(self, info, html=None, text=None):
+        def run(command, input_bytes=None):
+            if command[-1] == "clipboard info":
+                return info.encode("utf-8")
+            if command[0] == "osascript":
+                return f"«data HTML{html.encode('utf-8').hex().upper()}»".encode("utf-8")
+            if command == ["pbpaste"]:
+                return text.encode("utf-8")
+            return None
+        return mock.patch("img2markdown_html._run", side_effect=run)
+
+    def test_html_is_preferred_over_the_image(self):
+        with self.fake_clipboard("«class HTML», 10, «class PNGf», 99", html="<h2>Hi</h2>"):
+            self.assertEqual(get_text_from_clipboard(), ("html", "## Hi\n"))
+
+    def test_plain_text_is_used_only_without_an_image(self):
+        with self.fake_clipboard("«class utf8», 5", text="hello"):
+            self.assertEqual(get_text_from_clipboard(), ("text", "hello"))
+        # A copied file or picture also carries its name as text
+        with self.fake_clipboard("«class utf8», 5, «class PNGf», 99", text="screenshot.png"):
+            self.assertIsNone(get_text_from_clipboard())
+
+    def test_unreadable_clipboard_falls_back_to_the_image(self):
+        with mock.patch("img2markdown_html._run", return_value=None):
+            self.assertIsNone(get_text_from_clipboard())
+
+
+if __name__ == "__main__":
+    unittest.main()
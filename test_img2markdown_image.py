@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image, ImageDraw
+
+import img2markdown_image
+from img2markdown_image import (classify_complexity, measure_complexity, prepare_upload, split_bands,
+                                sniff_format, triage_image)
+
+
+def make_png(image):
+    """Encode a Pillow image as PNG bytes."""
+    return encode_as(image, "PNG")
+
+
+def encode_as(image, fmt):
+    """Encode a Pillow image in the given Pillow format."""
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def make_text_image(lines=20):
+    """Draw a few lines of black text on a white background."""
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(lines):
+        draw.text((20, 20 + i * 25), f"The quick brown fox jumps over the lazy dog {i}", fill="black", font_size=18)
+    return image
+
+
+def make_document(paragraphs, width=800):
+    """Draw paragraphs (lists of lines) with a wider gap between paragraphs than between lines."""
+    height = 40 + sum(len(lines) * 25 + 30 for lines in paragraphs)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    y = 20
+    for lines in paragraphs:
+        for line in lines:
+            draw.text((20, y), line, fill="black", font_size=18)
+            y += 25
+        y += 30
+    return image
+
+
+class TestTriageImage(unittest.TestCase):
+    def test_blank_image_is_empty(self):
+        """A single-colour capture should be rejected as empty."""
+        result = triage_image(make_png(Image.new("RGB", (800, 600), "white")))
+        self.assertEqual(result["label"], "empty")
+
+    def test_text_image_is_text(self):
+        """A screenshot of text should be sent on for conversion."""
+        result = triage_image(make_png(make_text_image()))
+        self.assertEqual(result["label"], "text")
+
+    def test_single_line_of_text_is_not_empty(self):
+        """Sparse text on a large background has low entropy but is not empty."""
+        result = triage_image(make_png(make_text_image(lines=1)))
+        self.assertEqual(result["label"], "text")
+
+    def test_smooth_gradient_is_textless(self):
+        """A smooth gradient has no edges and should be flagged as textless."""
+        gradient = Image.linear_gradient("L").resize((800, 600))
+        result = triage_image(make_png(gradient))
+        self.assertEqual(result["label"], "textless")
+
+    def test_thresholds_can_be_overridden(self):
+        """Custom thresholds should change the classification."""
+        result = triage_image(make_png(make_text_image()), {"min_edge_density": 0.9})
+        self.assertEqual(result["label"], "textless")
+
+    def test_undecodable_bytes_return_none(self):
+        """Bytes Pillow cannot read are left for the API to judge."""
+        self.assertIsNone(triage_image(b"not an image"))
+
+
+class TestPrepareUpload(unittest.TestCase):
+    def test_sniff_format(self):
+        image = make_text_image(2)
+        for fmt, expected in (("PNG", "png"), ("JPEG", "jpeg"), ("WEBP", "webp"),
+                              ("BMP", "bmp"), ("TIFF", "tiff"), ("GIF", "gif")):
+            self.assertEqual(sniff_format(encode_as(image, fmt)), expected)
+        self.assertIsNone(sniff_format(b"plain text"))
+
+    def test_supported_format_is_sent_as_is_with_its_mime_type(self):
+        jpeg = encode_as(make_text_image(2), "JPEG")
+        data, mime_type, _ = prepare_upload(jpeg)
+        self.assertEqual((data, mime_type), (jpeg, "image/jpeg"))
+
+    def test_unsupported_format_is_transcoded_to_png(self):
+        data, mime_type, info = prepare_upload(encode_as(make_text_image(2), "BMP"))
+        self.assertEqual(mime_type, "image/png")
+        self.assertEqual(sniff_format(data), "png")
+        self.assertTrue(info["transcoded"])
+
+    def test_target_bytes_shrinks_large_uploads(self):
+        png = make_png(make_text_image(20))
+        budget = len(png) // 2
+        data, mime_type, info = prepare_upload(png, target_bytes=budget)
+        self.assertEqual(mime_type, "image/webp")
+        self.assertLessEqual(len(data), budget)
+        self.assertGreaterEqual(info["quality"], 50)
+
+    def test_images_too_tall_for_webp_use_jpeg(self):
+        # Noise keeps the PNG large enough to be over the budget
+        tall = Image.effect_noise((200, 17000), 40).convert("RGB")
+        ImageDraw.Draw(tall).text((10, 10), "A tall scrolling screenshot", fill="black")
+        png = make_png(tall)
+        data, mime_type, info = prepare_upload(png, target_bytes=len(png) // 2)
+        self.assertEqual(mime_type, "image/jpeg")
+        self.assertLess(len(data), len(png))
+
+    def test_encoder_errors_upload_the_original(self):
+        png = make_png(make_text_image(20))
+        with mock.patch.object(img2markdown_image, "_encode", side_effect=OSError("encoder error")):
+            data, mime_type, info = prepare_upload(png, target_bytes=len(png) // 2)
+        self.assertEqual((data, mime_type, info["quality"]), (png, "image/png", None))
+
+    def test_upload_within_budget_is_untouched(self):
+        png = make_png(make_text_image(2))
+        data, mime_type, _ = prepare_upload(png, target_bytes=len(png))
+        self.assertEqual((data, mime_type), (png, "image/png"))
+
+
+class TestComplexity(unittest.TestCase):
+    def test_text_lines_are_counted(self):
+        for lines in (1, 4, 12):
+            self.assertEqual(measure_complexity(make_png(make_text_image(lines)))["text_lines"], lines)
+
+    def test_short_label_is_simple_and_dense_page_is_complex(self):
+        label = Image.new("RGB", (300, 60), "white")
+        ImageDraw.Draw(label).text((10, 20), "Save changes", fill="black", font_size=18)
+        self.assertEqual(classify_complexity(measure_complexity(make_png(label))), "simple")
+        self.assertEqual(classify_complexity(measure_complexity(make_png(make_text_image(20)))), "complex")
+
+    def test_large_images_are_complex(self):
+        complexity = measure_complexity(make_png(Image.new("RGB", (3000, 2000), "white")))
+        self.assertEqual(complexity["megapixels"], 6.0)
+        self.assertEqual(classify_complexity(complexity), "complex")
+        self.assertEqual(classify_complexity(complexity, {"max_megapixels": 10}), "simple")
+
+    def test_undecodable_bytes_are_complex(self):
+        self.assertIsNone(measure_complexity(b"not an image"))
+        self.assertEqual(classify_complexity(None), "complex")
+
+
+class TestSplitBands(unittest.TestCase):
+    PARAGRAPHS = [["Intro line one", "intro line two"], ["A paragraph with a typo teh"], ["Last", "paragraph"]]
+
+    def test_cuts_between_paragraphs_not_lines(self):
+        bands = split_bands(make_png(make_document(self.PARAGRAPHS)))
+        self.assertEqual(len(bands), 3)
+        self.assertEqual(len(split_bands(make_png(make_text_image(12)))), 1)
+        for band in bands:
+            image = Image.open(io.BytesIO(band["png"]))
+            self.assertEqual(image.width, 800)
+            self.assertGreater(image.height, band["bottom"] - band["top"])
+
+    def test_unchanged_bands_keep_their_hash_when_moved(self):
+        before = split_bands(make_png(make_document(self.PARAGRAPHS)))
+        edited = [self.PARAGRAPHS[0], ["A paragraph with a typo the", "and a new line"], self.PARAGRAPHS[2]]
+        after = split_bands(make_png(make_document(edited)))
+        self.assertEqual(before[0]["hash"], after[0]["hash"])
+        self.assertNotEqual(before[1]["hash"], after[1]["hash"])
+        self.assertEqual(before[2]["hash"], after[2]["hash"])
+        self.assertGreater(after[2]["top"], before[2]["top"])
+
+    def test_band_count_is_capped(self):
+        bands = split_bands(make_png(make_document([[f"Paragraph {i}"] for i in range(10)])), max_bands=4)
+        self.assertEqual(len(bands), 4)
+
+    def test_blank_and_undecodable_images(self):
+        self.assertEqual(split_bands(make_png(Image.new("RGB", (400, 300), "white"))), [])
+        self.assertIsNone(split_bands(b"not an image"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from img2markdown_log import log_event, setup_logging, stop_logging
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "test.log")
+
+    def tearDown(self):
+        setup_logging(level="OFF")
+        self.temp_dir.cleanup()
+
+    def read_entries(self):
+        stop_logging()
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_events_are_written_as_json_lines(self):
+        setup_logging(self.path, level="DEBUG")
+        log_event("attempt.start", logging.DEBUG, model="gpt-4o", timeout=30)
+        log_event("conversion.done", model="gpt-4o")
+        entries = self.read_entries()
+        self.assertEqual([e["event"] for e in entries], ["attempt.start", "conversion.done"])
+        self.assertEqual(entries[0]["level"], "debug")
+        self.assertEqual(entries[0]["timeout"], 30)
+
+    def test_level_filters_records(self):
+        setup_logging(self.path, level="INFO")
+        log_event("attempt.start", logging.DEBUG)
+        log_event("conversion.done")
+        self.assertEqual([e["event"] for e in self.read_entries()], ["conversion.done"])
+
+    def test_sampling_only_drops_debug_records(self):
+        setup_logging(self.path, level="DEBUG", sample_rate=0.0)
+        for _ in range(10):
+            log_event("attempt.start", logging.DEBUG)
+        log_event("attempt.failed", logging.WARNING)
+        self.assertEqual([e["event"] for e in self.read_entries()], ["attempt.failed"])
+
+    def test_file_is_rotated_by_size(self):
+        setup_logging(self.path, level="INFO", max_bytes=2000, backup_count=2)
+        for i in range(100):
+            log_event("conversion.done", index=i, padding="x" * 50)
+        stop_logging()
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import base64
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from img2markdown import Converter
+from img2markdown_ndjson import NdjsonStream, RequestError, parse_request
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+
+class TestNdjsonStream(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "page.png")
+        with open(self.path, "wb") as f:
+            f.write(make_png(make_text_image(3)))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_stream(self, lines, client=None, window=4, **kwargs):
+        client = client or FakeClient()
+        output = io.StringIO()
+        stream = NdjsonStream(Converter(client=client), output=output, window=window, **kwargs)
+        counts = stream.run(io.StringIO("".join(line + "\n" for line in lines)))
+        self.scheduler = stream.converter.scheduler
+        return [json.loads(line) for line in output.getvalue().splitlines()], counts
+
+    def test_one_result_line_per_input(self):
+        encoded = base64.b64encode(make_png(make_text_image(2))).decode("ascii")
+        records, counts = self.run_stream([
+            json.dumps({"id": "file", "path": self.path}),
+            "",
+            json.dumps({"id": "bytes", "base64": encoded, "options": {"priority": "interactive"}}),
+            json.dumps({"id": "missing", "path": os.path.join(self.temp_dir.name, "nope.png")}),
+            "not json",
+            json.dumps({"id": "odd", "path": self.path, "colour": "red", "options": {"speed": 1}}),
+        ])
+        self.assertEqual(counts, {"converted": 2, "empty": 0, "failed": 3})
+        by_id = {record["id"]: record for record in records}
+        self.assertEqual(len(records), 5)
+        self.assertTrue(by_id["file"]["ok"])
+        self.assertEqual(by_id["file"]["markdown"], "### Converted by gpt-4o")
+        self.assertEqual(by_id["file"]["model"], "gpt-4o")
+        self.assertIn("latency", by_id["bytes"])
+        self.assertIn("cannot read", by_id["missing"]["error"])
+        self.assertIn("unknown options: speed", by_id["odd"]["error"])
+        self.assertEqual(by_id[None]["line"], 5)
+
+    def test_every_input_is_answered_with_a_small_window(self):
+        client = FakeClient(delay=0.02)
+        lines = [json.dumps({"id": i, "path": self.path}) for i in range(6)]
+        records, counts = self.run_stream(lines, client=client, window=2)
+        self.assertEqual(sorted(record["id"] for record in records), list(range(6)))
+        self.assertTrue(all(record["ok"] for record in records))
+
+    def test_window_bounds_the_images_in_flight(self):
+        running = []
+        peak = []
+        client = FakeClient(delay=0.05)
+        create = client.chat.completions.create
+
+        def counted(**kwargs):
+            running.append(1)
+            peak.append(len(running))
+            try:
+                return create(**kwargs)
+            finally:
+                running.pop()
+
+        client.chat.completions.create = counted
+        self.run_stream([json.dumps({"path": self.path}) for _ in range(8)], client=client, window=3)
+        self.assertLessEqual(max(peak), 3)
+
+    def test_priority_option_reaches_the_scheduler(self):
+        self.run_stream([
+            json.dumps({"path": self.path}),
+            json.dumps({"path": self.path, "priority": "interactive"}),
+            json.dumps({"path": self.path, "options": {"priority": "interactive"}}),
+        ])
+        stats = self.scheduler.stats()
+        self.assertEqual((stats["interactive"]["completed"], stats["bulk"]["completed"]), (2, 1))
+
+    def test_empty_images_are_skipped(self):
+        blank = base64.b64encode(make_png(Image.new("RGB", (300, 200), "white"))).decode("ascii")
+        client = FakeClient()
+        records, counts = self.run_stream([json.dumps({"id": "blank", "base64": blank})], client=client)
+        self.assertEqual(records[0]["skipped"], "empty")
+        self.assertEqual(counts["empty"], 1)
+        self.assertEqual(client.calls, [])
+
+    def test_parse_request_validation(self):
+        with self.assertRaises(RequestError):
+            parse_request("[1, 2]")
+        with self.assertRaises(RequestError) as ctx:
+            parse_request(json.dumps({"id": 7}))
+        self.assertEqual(ctx.exception.request_id, 7)
+        with self.assertRaises(RequestError):
+            parse_request(json.dumps({"base64": "***"}))
+        with self.assertRaises(RequestError):
+            parse_request(json.dumps({"path": self.path, "priority": "urgent"}))
+        _, image_bytes, options = parse_request(json.dumps({"path": self.path, "deadline": 5, "tiles": True}))
+        self.assertEqual(options, {"deadline": 5, "tiles": True})
+        self.assertTrue(image_bytes.startswith(b"\x89PNG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
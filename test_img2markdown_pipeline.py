@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import base64
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from img2markdown import Converter
+from img2markdown_batch import convert_directory
+from img2markdown_pipeline import prepare_in_worker, share_bytes, take_bytes, unlink_shared
+from test_img2markdown import FakeClient
+from test_img2markdown_image import encode_as, make_png, make_text_image
+
+
+class TestSharedMemory(unittest.TestCase):
+    def test_bytes_round_trip_through_shared_memory(self):
+        name, size = share_bytes(b"payload")
+        self.assertEqual(take_bytes(name, size, unlink=False), b"payload")
+        self.assertEqual(take_bytes(name, size), b"payload")
+        with self.assertRaises(FileNotFoundError):
+            take_bytes(name, size)
+
+    def test_worker_returns_the_base64_payload(self):
+        bmp = encode_as(make_text_image(2), "BMP")
+        source = share_bytes(bmp)
+        # The worker leaves the source block to its owner
+        self.addCleanup(unlink_shared, source[0])
+        prepared = prepare_in_worker(source, triage=True)
+        payload = take_bytes(*prepared["payload"])
+        self.assertEqual((prepared["mime_type"], prepared["triage"]), ("image/png", "text"))
+        self.assertTrue(base64.b64decode(payload).startswith(b"\x89PNG"))
+
+    def test_worker_reports_empty_and_unreadable_images(self):
+        with tempfile.NamedTemporaryFile(suffix=".png") as f:
+            f.write(make_png(Image.new("RGB", (100, 100), "white")))
+            f.flush()
+            self.assertEqual(prepare_in_worker(f.name, triage=True), {"triage": "empty"})
+        self.assertIn("FileNotFoundError", prepare_in_worker("/does/not/exist.png")["error"])
+
+
+class TestProcessPipeline(unittest.TestCase):
+    def test_convert_many_with_processes(self):
+        images = [make_png(make_text_image(i + 1)) for i in range(6)]
+        images.insert(2, make_png(Image.new("RGB", (100, 100), "white")))
+        client = FakeClient(delay=0.01)
+        results = list(Converter(client=client).convert_many(images, processes=2, triage=True))
+        self.assertEqual(sorted(r.index for r in results), list(range(7)))
+        skipped = [r.index for r in results if r.skipped]
+        self.assertEqual(skipped, [2])
+        self.assertEqual(sum(r.ok for r in results), 6)
+        self.assertEqual(len(client.calls), 6)
+        self.assertTrue(client.calls[0]["messages"][0]["content"][1]["image_url"]["url"]
+                        .startswith("data:image/png;base64,"))
+
+    def test_directory_run_with_processes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                with open(os.path.join(temp_dir, f"{i}.png"), 'wb') as f:
+                    f.write(make_png(make_text_image(i + 1)))
+            with open(os.path.join(temp_dir, "blank.png"), 'wb') as f:
+                f.write(make_png(Image.new("RGB", (100, 100), "white")))
+            counts = convert_directory(Converter(client=FakeClient()), temp_dir, settings={},
+                                       verbose=False, processes=2)
+            self.assertEqual((counts["converted"], counts["empty"]), (4, 1))
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "3.md")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from img2markdown import ConversionError, Converter
+from img2markdown_router import ComplexityRouter, Endpoint, EndpointRouter
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+
+def make_router(stats_path=None, **failing):
+    """Two endpoints, "fast" and "slow", both serving gpt-4o."""
+    endpoints = [
+        Endpoint("slow", models=["gpt-4o"], client=FakeClient(failing_models=failing.get("slow", ()))),
+        Endpoint("fast", models=["gpt-4o", "gpt-4o-mini"],
+                 client=FakeClient(failing_models=failing.get("fast", ()))),
+    ]
+    return EndpointRouter(endpoints, stats_path)
+
+
+class TestEndpointRouter(unittest.TestCase):
+    def test_lower_latency_endpoint_is_preferred(self):
+        router = make_router()
+        slow, fast = router.endpoints
+        router.record(slow, 2.0, ok=True)
+        router.record(fast, 0.3, ok=True)
+        self.assertEqual([e.name for e in router.ranked("gpt-4o")], ["fast", "slow"])
+
+    def test_errors_push_an_endpoint_down(self):
+        router = make_router()
+        slow, fast = router.endpoints
+        router.record(slow, 1.0, ok=True)
+        router.record(fast, 0.5, ok=True)
+        for _ in range(2):
+            router.record(fast, 0.5, ok=False)
+        self.assertEqual(router.ranked("gpt-4o")[0].name, "slow")
+
+    def test_repeatedly_failing_endpoint_is_benched(self):
+        router = make_router()
+        slow, fast = router.endpoints
+        router.record(slow, 5.0, ok=True)
+        for _ in range(3):
+            router.record(fast, 0.1, ok=False)
+        self.assertFalse(fast.healthy())
+        self.assertEqual(router.ranked("gpt-4o")[-1].name, "fast")
+
+    def test_only_endpoints_serving_the_model_are_used(self):
+        router = make_router()
+        self.assertEqual([e.name for e in router.ranked("gpt-4o-mini")], ["fast"])
+        self.assertEqual(router.models(), ["gpt-4o", "gpt-4o-mini"])
+
+    def test_converter_fails_over_to_the_next_endpoint(self):
+        router = make_router(fast={"gpt-4o"})
+        router.record(router.endpoints[1], 0.1, ok=True)
+        result = Converter(router=router, model="gpt-4o", fallback=False).convert(b"image")
+        self.assertEqual((result.model, result.endpoint), ("gpt-4o", "slow"))
+        self.assertEqual(router.endpoints[1].failures, 1)
+
+    def test_endpoint_without_api_key_counts_as_a_failed_attempt(self):
+        router = make_router()
+        router.endpoints.insert(0, Endpoint("nokey", models=["gpt-4o"]))
+        router.record(router.endpoints[0], 0.1, ok=True)
+        with mock.patch.dict(os.environ):
+            os.environ.pop("OPENAI_API_KEY", None)
+            result = Converter(router=router, model="gpt-4o", fallback=False).convert(b"image")
+        self.assertNotEqual(result.endpoint, "nokey")
+        self.assertEqual(router.endpoints[0].failures, 1)
+
+    def test_stats_persist_between_runs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "endpoints.json")
+            router = make_router(path)
+            router.record(router.endpoints[1], 0.25, ok=True)
+            router.save_stats()
+            reloaded = make_router(path)
+            self.assertEqual(reloaded.endpoints[1].latency, 0.25)
+            self.assertIn("- gpt-4o: fast -> slow", reloaded.describe())
+
+
+class TestComplexityRouter(unittest.TestCase):
+    def convert(self, lines, replies=None, failing_models=()):
+        client = FakeClient(replies=replies or {}, failing_models=failing_models)
+        converter = Converter(client=client, model="gpt-4o", complexity_router=ComplexityRouter("gpt-4o-mini"))
+        result = converter.convert(make_png(make_text_image(lines)))
+        return result, [call["model"] for call in client.calls], converter.complexity_router
+
+    def test_simple_image_goes_to_the_cheap_model(self):
+        result, models, router = self.convert(2, {"gpt-4o-mini": "Line one\nLine two"})
+        self.assertEqual((result.model, result.route, models), ("gpt-4o-mini", "cheap", ["gpt-4o-mini"]))
+        self.assertEqual(router.report()["hit_rate"], 1.0)
+
+    def test_complex_image_goes_to_the_full_model(self):
+        result, models, router = self.convert(20)
+        self.assertEqual((result.route, models), ("full", ["gpt-4o"]))
+        self.assertEqual(router.counts["complex"], 1)
+
+    def test_poor_cheap_output_is_escalated(self):
+        for reply in ("", "I'm sorry, I can't help with that.", "Line"):
+            result, models, router = self.convert(3, {"gpt-4o-mini": reply})
+            self.assertEqual((result.model, result.route), ("gpt-4o", "escalated"), reply)
+            self.assertEqual(models, ["gpt-4o-mini", "gpt-4o"])
+            # Both attempts count towards the usage
+            self.assertEqual(result.usage["total_tokens"], 30)
+            self.assertEqual(router.report()["escalation_rate"], 1.0)
+
+    def test_failing_cheap_model_is_escalated(self):
+        result, models, _ = self.convert(1, failing_models=["gpt-4o-mini"])
+        self.assertEqual((result.model, result.route), ("gpt-4o", "escalated"))
+
+    def test_escalation_with_no_other_model_fails(self):
+        client = FakeClient(replies={"gpt-4o": ""})
+        converter = Converter(client=client, model="gpt-4o", fallback=False,
+                              complexity_router=ComplexityRouter("gpt-4o"))
+        with self.assertRaises(ConversionError) as ctx:
+            converter.convert(make_png(make_text_image(2)))
+        self.assertEqual([call["model"] for call in client.calls], ["gpt-4o"])
+        self.assertIn("No other model to escalate to", str(ctx.exception))
+
+    def test_describe_reports_hit_rates(self):
+        router = ComplexityRouter("gpt-4o-mini")
+        for outcome in ("cheap", "cheap", "escalated", "complex"):
+            router.record(outcome)
+        self.assertIn("2 of 4 images handled by gpt-4o-mini (50%), 1 escalated (33%", router.describe())
+        self.assertIsNone(ComplexityRouter.from_config({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
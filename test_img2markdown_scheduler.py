@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import threading
+import time
+import unittest
+
+from img2markdown import Converter
+from img2markdown_scheduler import BULK, INTERACTIVE, PriorityScheduler, SchedulerTimeout
+from test_img2markdown import FakeClient
+
+
+class TestPriorityScheduler(unittest.TestCase):
+    def test_interactive_overtakes_queued_bulk(self):
+        """Queued bulk work waits while a later interactive request goes first."""
+        scheduler = PriorityScheduler(capacity=1, reserved_interactive=0)
+        order = []
+        scheduler.acquire(BULK)
+
+        def worker(priority, name):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        threads = [threading.Thread(target=worker, args=(BULK, f"bulk{i}")) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=worker, args=(INTERACTIVE, "interactive"))
+        interactive.start()
+        time.sleep(0.05)
+        scheduler.release(BULK)
+        for thread in threads + [interactive]:
+            thread.join()
+        self.assertEqual(order[0], "interactive")
+        self.assertEqual(sorted(order[1:]), ["bulk0", "bulk1", "bulk2"])
+
+    def test_reserved_capacity_is_kept_for_interactive(self):
+        scheduler = PriorityScheduler(capacity=2, reserved_interactive=1)
+        scheduler.acquire(BULK)
+        with self.assertRaises(SchedulerTimeout):
+            scheduler.acquire(BULK, timeout=0.05)
+        scheduler.acquire(INTERACTIVE, timeout=0.05)
+        stats = scheduler.stats()
+        self.assertEqual((stats[BULK]["running"], stats[INTERACTIVE]["running"]), (1, 1))
+        self.assertEqual(stats[BULK]["waiting"], 0)
+
+    def test_wait_times_are_reported_per_class(self):
+        scheduler = PriorityScheduler(capacity=1, reserved_interactive=0)
+        scheduler.acquire(BULK)
+        waiter = threading.Thread(target=lambda: scheduler.acquire(INTERACTIVE))
+        waiter.start()
+        time.sleep(0.1)
+        scheduler.release(BULK)
+        waiter.join()
+        stats = scheduler.stats()
+        self.assertGreaterEqual(stats[INTERACTIVE]["max_wait"], 0.09)
+        self.assertEqual(stats[BULK]["completed"], 1)
+
+    def test_converter_uses_the_shared_scheduler(self):
+        scheduler = PriorityScheduler(capacity=2, reserved_interactive=1)
+        converter = Converter(client=FakeClient(), scheduler=scheduler)
+        list(converter.convert_many([b"a", b"b", b"c"]))
+        converter.convert(b"d")
+        stats = scheduler.stats()
+        self.assertEqual((stats[BULK]["completed"], stats[INTERACTIVE]["completed"]), (3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import http.client
+import json
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from img2markdown import Converter
+from img2markdown_server import Metrics, extract_image, make_server
+
+
+class MockUpstream:
+    """A local OpenAI-compatible /v1/chat/completions endpoint."""
+
+    def __init__(self, delay=0.0, content="# Mock markdown"):
+        self.requests = []
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                upstream.requests.append(body)
+                time.sleep(upstream.delay)
+                payload = json.dumps({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": upstream.content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.delay = delay
+        self.content = content
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestConversionService(unittest.TestCase):
+    def start(self, delay=0.0, workers=2, queue_size=2):
+        self.upstream = MockUpstream(delay=delay)
+        self.converter = Converter(base_url=self.upstream.base_url, api_key="test", models=["gpt-4o"])
+        self.server = make_server(self.converter, port=0, workers=workers, queue_size=queue_size)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.service.shutdown()
+        self.converter.close()
+        self.upstream.close()
+
+    def post(self, body, content_type="image/png", headers=None):
+        request = urllib.request.Request(f"{self.url}/convert", data=body,
+                                         headers={"Content-Type": content_type, **(headers or {})})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_convert_raw_body(self):
+        self.start()
+        status, payload = self.post(b"\x89PNG fake image")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["markdown"], "### Mock markdown")
+        self.assertEqual(payload["model"], "gpt-4o")
+        self.assertEqual(len(self.upstream.requests), 1)
+
+    def test_convert_multipart(self):
+        self.start()
+        boundary = "XyZ"
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n"
+        ).encode() + b"\x89PNG fake image" + f"\r\n--{boundary}--\r\n".encode()
+        status, payload = self.post(body, f"multipart/form-data; boundary={boundary}")
+        self.assertEqual(status, 200)
+        sent = self.upstream.requests[0]["messages"][0]["content"][1]["image_url"]["url"]
+        self.assertTrue(sent.endswith("iVBORyBmYWtlIGltYWdl"))
+
+    def test_healthz_and_metrics(self):
+        self.start()
+        self.post(b"\x89PNG fake image")
+        with urllib.request.urlopen(f"{self.url}/healthz") as response:
+            self.assertEqual(json.loads(response.read())["status"], "ok")
+        with urllib.request.urlopen(f"{self.url}/metrics") as response:
+            metrics = response.read().decode()
+        self.assertIn('img2markdown_conversions_total{outcome="ok",priority="interactive"} 1', metrics)
+        self.assertIn('img2markdown_conversion_seconds_count{priority="interactive"} 1', metrics)
+        self.assertIn('img2markdown_queue_wait_p95_seconds{priority="bulk"}', metrics)
+        self.assertIn("img2markdown_tokens_total 120", metrics)
+
+    def test_full_queue_returns_503(self):
+        self.start(delay=0.5, workers=1, queue_size=0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.post(b"img")[0])) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [200, 503, 503])
+        rejected = self.server.service.metrics.counter("img2markdown_rejected_total", priority="interactive")
+        self.assertEqual(rejected, 2)
+
+    def test_empty_body_is_rejected(self):
+        self.start()
+        status, _ = self.post(b"")
+        self.assertEqual(status, 400)
+
+    def raw_request(self, method, path, headers):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        self.addCleanup(connection.close)
+        connection.putrequest(method, path, skip_accept_encoding=True)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders()
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def test_bad_content_length_is_rejected(self):
+        self.start()
+        self.assertEqual(self.raw_request("POST", "/convert", {"Content-Length": "abc"})[0], 400)
+        self.assertEqual(self.raw_request("POST", "/convert", {"Content-Length": "-1"})[0], 400)
+        self.assertEqual(self.raw_request("POST", "/convert", {})[0], 411)
+        self.assertEqual(self.upstream.requests, [])
+
+    def test_unknown_paths_share_one_escaped_label(self):
+        self.start()
+        self.raw_request("GET", '/x"y', {})
+        self.raw_request("GET", "/other-path", {})
+        metrics = self.raw_request("GET", "/metrics", {})[1].decode()
+        self.assertIn('img2markdown_http_requests_total{code="404",path="other"} 2', metrics)
+        self.assertNotIn('x"y', metrics)
+
+    def test_invalid_deadline_is_rejected(self):
+        self.start()
+        for value in ("soon", "-1", "nan"):
+            status, payload = self.post(b"img", headers={"X-Deadline-Seconds": value})
+            self.assertEqual(status, 400)
+            self.assertIn("X-Deadline-Seconds", payload["error"])
+        self.assertEqual(self.upstream.requests, [])
+
+    def test_unexpected_error_returns_500(self):
+        self.start()
+        with mock.patch.object(self.converter, "convert", side_effect=RuntimeError("boom")):
+            status, payload = self.post(b"img")
+        self.assertEqual(status, 500)
+        self.assertEqual(payload["error"], "internal error")
+
+
+class TestMetrics(unittest.TestCase):
+    def test_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.inc("requests_total", path='a\\b"c\nd')
+        self.assertIn('requests_total{path="a\\\\b\\"c\\nd"} 1', metrics.render())
+
+
+class TestExtractImage(unittest.TestCase):
+    def test_raw_body_is_returned_unchanged(self):
+        self.assertEqual(extract_image(b"abc", "image/png"), b"abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from img2markdown_singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_concurrent_duplicate_reuses_the_first_result(self):
+        """The second caller waits on the lock and gets the first caller's result."""
+        calls = []
+        results = {}
+
+        def compute(name):
+            calls.append(name)
+            time.sleep(0.3)
+            return {"text": f"from {name}"}
+
+        def run(name):
+            # Each caller gets its own instance, like a separate process would
+            flight = SingleFlight(self.temp_dir.name)
+            results[name] = flight.run("key", lambda: compute(name))
+
+        first = threading.Thread(target=run, args=("first",))
+        first.start()
+        time.sleep(0.05)
+        second = threading.Thread(target=run, args=("second",))
+        second.start()
+        first.join()
+        second.join()
+
+        self.assertEqual(calls, ["first"])
+        self.assertEqual(results["first"], ({"text": "from first"}, False))
+        self.assertEqual(results["second"], ({"text": "from first"}, True))
+
+    def test_stale_result_is_not_reused(self):
+        flight = SingleFlight(self.temp_dir.name, ttl=0.0)
+        flight.run("key", lambda: {"n": 1})
+        time.sleep(0.01)
+        self.assertEqual(flight.run("key", lambda: {"n": 2}), ({"n": 2}, False))
+
+    def test_later_rerun_makes_its_own_call(self):
+        flight = SingleFlight(self.temp_dir.name)
+        flight.run("key", lambda: {"n": 1})
+        _, result_path = flight._paths("key")
+        earlier = time.time() - 30
+        os.utime(result_path, (earlier, earlier))
+        self.assertEqual(flight.run("key", lambda: {"n": 2}), ({"n": 2}, False))
+
+    def test_failed_computation_leaves_no_result(self):
+        flight = SingleFlight(self.temp_dir.name)
+
+        def fail():
+            raise RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            flight.run("key", fail)
+        self.assertEqual(flight.run("key", lambda: {"n": 1}), ({"n": 1}, False))
+
+    def test_different_keys_do_not_share(self):
+        flight = SingleFlight(self.temp_dir.name)
+        flight.run("a", lambda: {"n": 1})
+        self.assertEqual(flight.run("b", lambda: {"n": 2}), ({"n": 2}, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from img2markdown import ConversionResult, Converter, prep_for_pasting
+from img2markdown_batch import convert_directory
+from img2markdown_store import ResponseStore, reprocess
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+RAW = "```markdown\n# Title\n\n## Section\n\nBody text\n```"
+
+
+class TestResponseStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ResponseStore(os.path.join(self.temp_dir.name, "store"))
+        self.addCleanup(self.store.close)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def write(self, name, text):
+        with open(self.path(name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def read(self, name):
+        with open(self.path(name), encoding="utf-8") as f:
+            return f.read()
+
+    def test_identical_responses_are_stored_once(self):
+        result = ConversionResult(text=RAW, model="gpt-4o", usage={"total_tokens": 15})
+        first = self.store.record(result, source="a.png")
+        second = self.store.record(result, source="b.png")
+        self.assertNotEqual(first, second)
+        objects = [name for _, _, files in os.walk(os.path.join(self.store.directory, "objects")) for name in files]
+        self.assertEqual(len(objects), 1)
+        text_hash = self.store.latest()[0][1]
+        self.assertEqual(self.store.get_text(text_hash), RAW)
+
+    def test_reprocess_rewrites_outputs_with_current_rules(self):
+        # Written under older formatting rules
+        self.write("old.md", "stale formatting")
+        self.write("same.md", prep_for_pasting("plain"))
+        self.store.record(ConversionResult(text="An older response"), output=self.path("old.md"))
+        self.store.record(ConversionResult(text=RAW), output=self.path("old.md"), markdown="stale formatting")
+        self.store.record(ConversionResult(text="plain"), output=self.path("same.md"))
+        self.store.record(ConversionResult(text="From the clipboard"))
+        self.store.record(ConversionResult(text="Deleted since"), output=self.path("gone.md"))
+
+        counts = reprocess(self.store, prep_for_pasting, verbose=False)
+        self.assertEqual(counts, {"updated": 1, "unchanged": 1, "modified": 0, "missing": 2, "failed": 0})
+        self.assertEqual(self.read("old.md"), "### Title\n\n**Section**\n\nBody text")
+        self.assertFalse(os.path.exists(self.path("gone.md")))
+
+        # The rewritten file is now what the store expects, so later runs may update it again
+        counts = reprocess(self.store, str.upper, verbose=False)
+        self.assertEqual(counts["updated"], 2)
+        self.assertEqual(counts["modified"], 0)
+
+    def test_reprocess_keeps_hand_edits(self):
+        self.write("edited.md", "My own notes")
+        self.store.record(ConversionResult(text=RAW), output=self.path("edited.md"), markdown="as written")
+        counts = reprocess(self.store, prep_for_pasting, verbose=False)
+        self.assertEqual(counts["modified"], 1)
+        self.assertEqual(counts["updated"], 0)
+        self.assertEqual(self.read("edited.md"), "My own notes")
+
+    def test_prune_removes_old_responses_and_their_objects(self):
+        old = self.store.record(ConversionResult(text="old"))
+        self.store.record(ConversionResult(text="new"))
+        self.store.db.execute("UPDATE responses SET created_at = 0 WHERE id = ?", (old,))
+        self.store.db.commit()
+        self.assertEqual(self.store.prune(max_age=3600), 1)
+        self.assertEqual(len(self.store.latest()), 1)
+        with self.assertRaises(OSError):
+            self.store.get_text(hashlib.sha256(b"old").hexdigest())
+        self.assertEqual(self.store.get_text(self.store.latest()[0][1]), "new")
+        # Pruning runs at most once per interval
+        self.store.prune_if_due(0)
+        self.assertEqual(self.store.latest(), [])
+        self.store.record(ConversionResult(text="newer"))
+        self.store.prune_if_due(0)
+        self.assertEqual(len(self.store.latest()), 1)
+
+    def test_reprocess_into_a_directory_in_a_process_pool(self):
+        for i in range(5):
+            self.store.record(ConversionResult(text=f"# Page {i}"), output=self.path(f"page{i}.md"))
+        export = self.path("export")
+        with unittest.mock.patch("img2markdown_store.MIN_POOL_RESPONSES", 0), \
+                unittest.mock.patch("img2markdown_store.REPROCESS_CHUNK", 2):
+            counts = reprocess(self.store, prep_for_pasting, output_dir=export, processes=2, verbose=False)
+        self.assertEqual(counts["updated"], 5)
+        self.assertEqual(sorted(os.listdir(export)), [f"{i}.md" for i in range(1, 6)])
+        self.assertEqual(self.read(os.path.join("export", "1.md")), "### Page 0")
+
+    def test_converter_remembers_directory_results(self):
+        source = self.path("scans")
+        os.makedirs(source)
+        with open(os.path.join(source, "page.png"), "wb") as f:
+            f.write(make_png(make_text_image(3)))
+        converter = Converter(client=FakeClient(), store=self.store)
+        convert_directory(converter, source, verbose=False)
+        rows = self.store.latest()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][2], os.path.join(source, "page.md"))
+        self.assertEqual(self.store.get_text(rows[0][1]), "# Converted by gpt-4o")
+        # Without a store nothing is kept
+        self.assertIsNone(Converter(client=FakeClient()).remember(ConversionResult(text="x")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import time
+import unittest
+
+from img2markdown import ConversionError, Converter
+from img2markdown_tiles import PRUNE_AGE, TileCache, join_bands, strip_fences
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_document, make_png, make_text_image
+
+PARAGRAPHS = [["Intro line one", "intro line two"], ["A paragraph with a typo teh"], ["Last", "paragraph"]]
+
+
+class TestConvertTiled(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = TileCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def convert(self, paragraphs, replies):
+        client = FakeClient(replies={"gpt-4o": [(reply, "stop") for reply in replies]})
+        converter = Converter(client=client, model="gpt-4o", fallback=False, max_workers=1)
+        return converter.convert_tiled(make_png(make_document(paragraphs)), cache=self.cache), client
+
+    def test_only_changed_bands_are_converted(self):
+        result, client = self.convert(PARAGRAPHS, ["# Intro", "A typo teh", "```markdown\nLast paragraph\n```"])
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(result.tiles, {"bands": 3, "reused": 0})
+        self.assertEqual(result.text, "# Intro\n\nA typo teh\n\nLast paragraph")
+        self.assertEqual(result.usage["total_tokens"], 45)
+
+        edited = [PARAGRAPHS[0], ["A paragraph with a typo the"], PARAGRAPHS[2]]
+        result, client = self.convert(edited, ["A typo the"])
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(result.tiles, {"bands": 3, "reused": 2})
+        self.assertEqual(result.markdown, "### Intro\n\nA typo the\n\nLast paragraph")
+        self.assertEqual(result.usage["total_tokens"], 15)
+
+    def test_settings_are_part_of_the_key(self):
+        self.convert(PARAGRAPHS, ["a", "b", "c"])
+        client = FakeClient()
+        Converter(client=client, model="gpt-4o", fallback=False, prompt="Other prompt").convert_tiled(
+            make_png(make_document(PARAGRAPHS)), cache=self.cache)
+        self.assertEqual(len(client.calls), 3)
+
+    def test_failed_bands_raise_and_finished_ones_are_kept(self):
+        with self.assertRaises(ConversionError):
+            self.convert(PARAGRAPHS, ["# Intro"])
+        result, client = self.convert(PARAGRAPHS, ["b", "c"])
+        self.assertEqual(result.tiles["reused"], 1)
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(result.text, "# Intro\n\nb\n\nc")
+
+    def test_unused_bands_are_pruned_at_most_once_a_day(self):
+        def stale_entry(key):
+            self.cache.put(key, "old", "gpt-4o")
+            path = os.path.join(self.temp_dir.name, f"{key}.json")
+            stale = time.time() - PRUNE_AGE - 60
+            os.utime(path, (stale, stale))
+            return path
+
+        first = stale_entry("stale-1")
+        self.convert(PARAGRAPHS, ["a", "b", "c"])
+        self.assertFalse(os.path.exists(first))
+        second = stale_entry("stale-2")
+        self.convert([["Another page"]], ["d"])
+        self.assertTrue(os.path.exists(second))
+
+    def test_unsplittable_images_are_converted_whole(self):
+        client = FakeClient()
+        result = Converter(client=client).convert_tiled(b"not an image", cache=self.cache)
+        self.assertIsNone(result.tiles)
+        self.assertEqual(len(client.calls), 1)
+        result = Converter(client=client).convert_tiled(make_png(make_text_image(3)), cache=self.cache)
+        self.assertEqual(result.tiles, {"bands": 1, "reused": 0})
+
+    def test_join_strips_fences_and_empty_bands(self):
+        self.assertEqual(strip_fences("```\ncode block?\n```"), "code block?")
+        self.assertEqual(join_bands(["```markdown\n# A\n```", "  ", "B\n"]), "# A\n\nB")
+
+
+if __name__ == "__main__":
+    unittest.main()
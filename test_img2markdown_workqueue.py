@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from PIL import Image
+
+from img2markdown import Converter
+from img2markdown_workqueue import WorkQueue, run_worker
+from test_img2markdown import FakeClient
+from test_img2markdown_image import make_png, make_text_image
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, "shared", "scans")
+        os.makedirs(os.path.join(self.source, "sub"))
+        self.names = ["a.png", "b.png", os.path.join("sub", "c.png"), "d.png"]
+        for i, name in enumerate(self.names):
+            with open(os.path.join(self.source, name), "wb") as f:
+                f.write(make_png(make_text_image(i + 1)))
+        self.db_path = os.path.join(self.temp_dir.name, "shared", "queue.sqlite")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def queue(self, **kwargs):
+        queue = WorkQueue(self.db_path, **kwargs)
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_enqueue_is_idempotent_and_stores_relative_paths(self):
+        queue = self.queue()
+        self.assertEqual(queue.enqueue(self.source), 4)
+        self.assertEqual(queue.enqueue(self.source), 0)
+        stored = [row[0] for row in queue.db.execute("SELECT source FROM items")]
+        self.assertTrue(all(not os.path.isabs(path) for path in stored))
+        item = queue.claim("host-a")[0]
+        self.assertEqual(item.source, os.path.join(self.source, "a.png"))
+        self.assertEqual(item.output, os.path.join(self.source, "a.md"))
+
+    def test_claims_do_not_overlap(self):
+        queue = self.queue()
+        queue.enqueue(self.source)
+        first = queue.claim("host-a", 3)
+        second = queue.claim("host-b", 3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({i.id for i in first} & {i.id for i in second})
+        self.assertEqual(queue.claim("host-c", 3), [])
+
+    def test_expired_lease_is_reclaimed_and_completed_once(self):
+        queue = self.queue(lease_seconds=0.05)
+        queue.enqueue(self.source)
+        stale = queue.claim("host-a", 1)[0]
+        time.sleep(0.1)
+        fresh = queue.claim("host-b", 1)[0]
+        self.assertEqual(stale.id, fresh.id)
+        self.assertEqual(fresh.attempts, 2)
+        published = []
+        self.assertFalse(queue.complete(stale, publish=lambda: published.append("a")))
+        self.assertEqual(queue.renew([stale]), [stale])
+        self.assertTrue(queue.complete(fresh, publish=lambda: published.append("b")))
+        self.assertFalse(queue.complete(fresh))
+        self.assertEqual(published, ["b"])
+
+    def test_renewed_lease_is_not_reclaimed(self):
+        queue = self.queue(lease_seconds=0.2)
+        queue.enqueue(self.source)
+        item = queue.claim("host-a", 1)[0]
+        time.sleep(0.1)
+        self.assertEqual(queue.renew([item]), [])
+        time.sleep(0.15)
+        self.assertNotIn(item.id, [i.id for i in queue.claim("host-b", 4)])
+
+    def test_images_differing_only_in_extension_get_separate_outputs(self):
+        with open(os.path.join(self.source, "a.jpg"), "wb") as f:
+            f.write(make_png(make_text_image(2)))
+        queue = self.queue()
+        queue.enqueue(self.source)
+        outputs = sorted(os.path.basename(item.output) for item in queue.claim("host-a", 5))
+        self.assertEqual(outputs, ["a.jpg.md", "a.png.md", "b.md", "c.md", "d.md"])
+
+    def test_failed_items_are_retried_then_given_up(self):
+        queue = self.queue(max_attempts=2)
+        queue.enqueue(self.source)
+        item = queue.claim("host-a", 1)[0]
+        queue.fail(item, "boom")
+        item = queue.claim("host-a", 1)[0]
+        self.assertEqual(item.attempts, 2)
+        queue.fail(item, "boom")
+        progress = queue.progress()
+        self.assertEqual(progress["failed"], 1)
+        self.assertEqual(progress["pending"], 3)
+
+    def test_workers_share_the_queue(self):
+        setup = self.queue()
+        setup.enqueue(self.source, os.path.join(self.temp_dir.name, "out"))
+        client = FakeClient(delay=0.02)
+        counts = []
+
+        def work(name):
+            queue = WorkQueue(self.db_path)
+            try:
+                converter = Converter(client=client, max_workers=1, verbose=False)
+                counts.append(run_worker(converter, queue, worker=name, poll_interval=0.01, verbose=False))
+            finally:
+                queue.close()
+
+        threads = [threading.Thread(target=work, args=(f"host-{n}",)) for n in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(c["converted"] for c in counts), 4)
+        self.assertEqual(len(client.calls), 4)
+        for name in self.names:
+            output = os.path.join(self.temp_dir.name, "out", os.path.splitext(name)[0] + ".md")
+            self.assertTrue(os.path.exists(output))
+        progress = setup.progress()
+        self.assertEqual(progress["done"], 4)
+        self.assertEqual(progress["total"], 4)
+        self.assertEqual(sum(w["completed"] for w in progress["workers"]), 4)
+        self.assertGreater(progress["per_minute"], 0)
+        self.assertEqual(progress["eta_minutes"], 0)
+        self.assertIn("Workers:", setup.describe())
+
+    def test_worker_records_empty_images_without_calling_the_api(self):
+        blank = os.path.join(self.source, "blank.png")
+        Image.new("RGB", (400, 300), "white").save(blank)
+        queue = self.queue()
+        queue.enqueue(self.source)
+        client = FakeClient()
+        counts = run_worker(Converter(client=client, verbose=False), queue, poll_interval=0.01, verbose=False)
+        self.assertEqual(counts["empty"], 1)
+        self.assertEqual(counts["converted"], 4)
+        self.assertEqual(len(client.calls), 4)
+        self.assertFalse(os.path.exists(os.path.join(self.source, "blank.md")))
+
+    def test_retried_failures_are_not_counted_as_failed(self):
+        queue = self.queue(max_attempts=2)
+        queue.enqueue(self.source)
+        client = FakeClient(failing_models={"gpt-4o"})
+        completions = client.chat.completions
+        create = completions.create
+
+        def fail_once(**kwargs):
+            try:
+                return create(**kwargs)
+            finally:
+                completions.failing_models.clear()
+
+        completions.create = fail_once
+        converter = Converter(client=client, model="gpt-4o", fallback=False, verbose=False)
+        counts = run_worker(converter, queue, batch_size=1, poll_interval=0.01, verbose=False)
+        self.assertEqual((counts["converted"], counts["retried"], counts["failed"]), (4, 1, 0))
+        self.assertEqual(queue.progress()["done"], 4)
+
+    def test_items_given_up_on_are_counted_as_failed(self):
+        queue = self.queue(max_attempts=2)
+        queue.enqueue(self.source)
+        converter = Converter(client=FakeClient(failing_models={"gpt-4o"}), model="gpt-4o", fallback=False,
+                              verbose=False)
+        counts = run_worker(converter, queue, poll_interval=0.01, verbose=False)
+        self.assertEqual((counts["retried"], counts["failed"]), (4, 4))
+        self.assertEqual(queue.progress()["failed"], 4)
+
+    def test_output_that_cannot_be_published_is_given_back(self):
+        queue = self.queue(max_attempts=2)
+        queue.enqueue(self.source)
+        blocked = [item.output for item in queue.claim("setup", 4) if item.source.endswith("a.png")][0]
+        queue.db.execute("UPDATE items SET status = 'pending', lease_expires = NULL, attempts = 0")
+        os.makedirs(blocked)
+        counts = run_worker(Converter(client=FakeClient(), verbose=False), queue, poll_interval=0.01, verbose=False)
+        self.assertEqual((counts["converted"], counts["retried"], counts["failed"]), (3, 1, 1))
+        leftovers = [name for name in os.listdir(self.source) if name.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()